@@ -1,49 +1,784 @@
-from flask import Flask, request, jsonify, g,  send_from_directory
+from flask import Flask, request, jsonify, g,  send_from_directory, url_for, Response, abort, has_request_context, stream_with_context
+from werkzeug.wsgi import wrap_file, ClosingIterator
 import sqlite3
 import os
 import base64
+import binascii
+import json
+import re
+import math
+import csv
+import time
+import hashlib
+import io
+import shutil
+import tempfile
+import threading
+import multiprocessing
+import queue
+import functools
+import importlib.util
+import bisect
+import fcntl
+import glob
+from collections import namedtuple, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, Future
 from flask_cors import CORS
+import click
+from PIL import Image, ImageOps
+import numpy as np
+from config.config import config
 
 app = Flask(__name__, static_folder="dist", static_url_path="")
 CORS(app)
-app.config['DATABASE'] = 'biblioteca.db'
+app_config = config[os.environ.get('FLASK_CONFIG', 'default')]
+app.config.from_object(app_config)
+app_config.init_app(app)
 
 
-## conectar com Banco de Dados
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que soma comandos e tempo de SQL na conexao (execucao e leitura das linhas) e entrega
+    o tempo de cada comando ao query_profiler quando o cursor termina"""
+    _statement = None  # (sql, params) do comando atual, ate as linhas acabarem
+    _elapsed = 0.0
+
+    def _finish(self):
+        if self._statement is not None:
+            sql, params = self._statement
+            self._statement = None
+            query_profiler.record(self.connection, sql, params, self._elapsed)
+
+    def execute(self, sql, params=()):
+        if self._statement is not None:
+            self._finish()
+        self._statement = (sql, params)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            elapsed = self._elapsed = time.perf_counter() - start
+            connection = self.connection
+            connection.sql_count += 1
+            connection.sql_seconds += elapsed
+            # Sem linhas para ler (INSERT/UPDATE/DDL ou erro): o comando ja terminou
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, params):
+        if self._statement is not None:
+            self._finish()
+        self._statement = (sql, None)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, params)
+        finally:
+            elapsed = self._elapsed = time.perf_counter() - start
+            connection = self.connection
+            connection.sql_count += 1
+            connection.sql_seconds += elapsed
+            self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        elapsed = time.perf_counter() - start
+        self.connection.sql_seconds += elapsed
+        self._elapsed += elapsed
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        elapsed = time.perf_counter() - start
+        self.connection.sql_seconds += elapsed
+        self._elapsed += elapsed
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        elapsed = time.perf_counter() - start
+        self.connection.sql_seconds += elapsed
+        self._elapsed += elapsed
+        self._finish()
+        return rows
+
+    # Iteracao em blocos: medir cada linha custaria mais que le-la
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(256)
+            yield from rows
+            if len(rows) < 256:
+                return
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    # Cursor descartado antes de ler todas as linhas (ex.: db.execute(...).fetchone())
+    def __del__(self):
+        self._finish()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Conexao com contadores de SQL para /metrics e /debug/queries"""
+    sql_count = 0
+    sql_seconds = 0.0
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return sqlite3.Connection.cursor(self, InstrumentedCursor).execute(sql, params)
+
+    def executemany(self, sql, params):
+        return sqlite3.Connection.cursor(self, InstrumentedCursor).executemany(sql, params)
+
+## abrir conexao configurada (pragmas aplicados uma unica vez por conexao)
+def connect_db(readonly=False, database=None):
+    db = sqlite3.connect(database or app.config['DATABASE'],
+                         timeout=app.config['DB_BUSY_TIMEOUT_MS'] / 1000,
+                         cached_statements=app.config['DB_STATEMENT_CACHE'],
+                         check_same_thread=False, uri=True, factory=InstrumentedConnection)
+    db.row_factory = sqlite3.Row
+    db.execute('PRAGMA foreign_keys = ON')
+    db.execute(f"PRAGMA busy_timeout = {int(app.config['DB_BUSY_TIMEOUT_MS'])}")
+    db.execute(f"PRAGMA cache_size = -{int(app.config['DB_CACHE_SIZE_KB'])}")
+    db.execute(f"PRAGMA mmap_size = {int(app.config['DB_MMAP_SIZE'])}")
+    if readonly:
+        db.execute('PRAGMA query_only = ON')
+    else:
+        # WAL: leitores nao bloqueiam o escritor (e vice-versa)
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute('PRAGMA synchronous = NORMAL')
+    return db
+
+class ConnectionPool:
+    """Pool de conexoes SQLite por processo, reaproveitadas entre requisicoes"""
+
+    def __init__(self, name, size_key, readonly=False):
+        self.name = name
+        self.size_key = size_key
+        self.readonly = readonly
+        self.reset()
+
+    ## descartar estado herdado (ex.: processo filho depois de um fork)
+    def reset(self):
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.in_use = 0
+        self.acquired = 0
+        self.waits = 0
+
+    def acquire(self):
+        if self.pid != os.getpid():
+            self.reset()
+        try:
+            db = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self.created < app.config[self.size_key]
+                if can_create:
+                    self.created += 1
+                else:
+                    self.waits += 1
+            if can_create:
+                try:
+                    db = connect_db(self.readonly)
+                except sqlite3.Error:
+                    with self._lock:
+                        self.created -= 1
+                    raise
+            else:
+                try:
+                    db = self._idle.get(timeout=app.config['DB_POOL_TIMEOUT'])
+                except queue.Empty:
+                    raise sqlite3.OperationalError(f'Nenhuma conexão livre no pool de {self.name}')
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+        return db
+
+    def release(self, db):
+        if self.pid != os.getpid():
+            return
+        # Transacao aberta por um handler que retornou erro antes do commit
+        if db.in_transaction:
+            db.rollback()
+        with self._lock:
+            self.in_use -= 1
+        self._idle.put(db)
+
+    ## fechar conexoes ociosas (ex.: antes de recriar o arquivo do banco)
+    def close_idle(self):
+        while True:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            db.close()
+            with self._lock:
+                self.created -= 1
+
+    def stats(self):
+        return {
+            'size': app.config[self.size_key],
+            'created': self.created,
+            'idle': self._idle.qsize(),
+            'in_use': self.in_use,
+            'acquired': self.acquired,
+            'waits': self.waits,
+        }
+
+read_pool = ConnectionPool('leitura', 'DB_READ_POOL_SIZE', readonly=True)
+
+## conectar com Banco de Dados (somente leitura; escritas passam por write_coordinator)
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(app.config['DATABASE'])
-        g.db.row_factory = sqlite3.Row
-        g.db.execute('PRAGMA foreign_keys = ON')
+        g.db = read_pool.acquire()
+        # Contadores no inicio da requisicao: /metrics registra a diferenca
+        g.sql_start = (g.db.sql_count, g.db.sql_seconds)
     return g.db
 
 
-## fechar banco
+## entregar a conexao da requisicao a uma resposta em streaming (ela volta ao pool quando a
+## resposta fecha, nao no fim do contexto)
+def detach_db():
+    db = get_db()
+    g.db_detached = True
+    return db
+
+## fechar banco (devolve a conexao ao pool)
 def close_db(e=None):
     db = g.pop('db', None)
-    if db is not None:
-        db.close()
+    if db is not None and not g.pop('db_detached', False):
+        read_pool.release(db)
 ## fechar banco no caso de erros/excecoes
 @app.teardown_appcontext
 def close_db_context(error):
     close_db()
 
+class WriteCoordinator:
+    """Escritor unico por processo: junta as escritas de todas as threads em transacoes curtas,
+    com um unico commit (e fsync) por lote"""
 
-## configurar Banco de Dados
-def init_db():
-    with app.app_context():
-        db = get_db()
-        with app.open_resource('schema.sql', mode='r') as f:
-            db.cursor().executescript(f.read())
-        db.commit()
+    def __init__(self):
+        self.reset()
+
+    ## descartar estado herdado (ex.: processo filho depois de um fork)
+    def reset(self):
+        self.pid = os.getpid()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.writes = 0
+        self.errors = 0
+        self.largest_batch = 0
+
+    def start(self):
+        if self.pid != os.getpid():
+            self.reset()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='escritor', daemon=True)
+                self._thread.start()
+
+    ## enfileirar fn(db) para o escritor; o Future traz o retorno ou a excecao de fn
+    def submit(self, fn):
+        self.start()
+        future = Future()
+        future.route = current_route()
+        self._queue.put((fn, future))
+        return future
+
+    def execute(self, fn):
+        future = self.submit(fn)
+        try:
+            return future.result()
+        finally:
+            # SQL da escrita entra nas metricas da requisicao que a pediu
+            if has_request_context() and hasattr(future, 'sql'):
+                g.setdefault('sql_writes', []).append(future.sql)
+
+    ## terminar as escritas ja enfileiradas e fechar a conexao
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None and self.pid == os.getpid():
+                self._queue.put(None)
+        if thread is not None and self.pid == os.getpid():
+            thread.join()
+
+    def _run(self):
+        db = connect_db()
+        max_size = app.config['WRITE_BATCH_MAX_SIZE']
+        max_delay = app.config['WRITE_BATCH_MAX_DELAY_MS'] / 1000
+        running = True
+        while running:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Espera no maximo max_delay por outras escritas para o mesmo commit
+            deadline = time.monotonic() + max_delay
+            while len(batch) < max_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            self._apply(db, batch)
+        db.close()
+
+    def _apply(self, db, batch):
+        results = []
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            for fn, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                # Cada escrita em um savepoint: um erro desfaz so a propria escrita, nao o lote
+                db.execute('SAVEPOINT escrita')
+                start = (db.sql_count, db.sql_seconds)
+                sql_context.route = future.route
+                try:
+                    result = fn(db)
+                except Exception as e:
+                    db.execute('ROLLBACK TO escrita')
+                    db.execute('RELEASE escrita')
+                    results.append((future, None, e))
+                else:
+                    db.execute('RELEASE escrita')
+                    results.append((future, result, None))
+                finally:
+                    sql_context.route = None
+                future.sql = (db.sql_count - start[0], db.sql_seconds - start[1])
+            db.commit()
+        except sqlite3.Error as e:
+            # Falha no BEGIN/COMMIT (ex.: banco travado por outro processo): o lote inteiro falha
+            if db.in_transaction:
+                db.rollback()
+            results = [(future, None, e) for _, future in batch if not future.cancelled()]
+
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for future, result, error in results:
+            self.writes += 1
+            if error is None:
+                future.set_result(result)
+            else:
+                self.errors += 1
+                future.set_exception(error)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'batches': self.batches,
+            'writes': self.writes,
+            'errors': self.errors,
+            'largest_batch': self.largest_batch,
+        }
+
+write_coordinator = WriteCoordinator()
+
+## executar uma escrita pelo coordenador; retorna o cursor (rowcount/lastrowid desta escrita)
+def execute_write(sql, params=()):
+    return write_coordinator.execute(lambda db: db.execute(sql, params))
+
+
+## calcular hash das imagens inseridas direto via SQL (ex.: dados de exemplo)
+def fill_image_hashes(db):
+    db.create_function('SHA256', 1, image_hash, deterministic=True)
+    db.execute('UPDATE LIVRO SET HASH_IMG_LIVRO = SHA256(IMG_LIVRO) WHERE HASH_IMG_LIVRO IS NULL')
+    db.execute('UPDATE CATEGORIA SET HASH_IMG_CATEGORIA = SHA256(IMG_CATEGORIA) WHERE HASH_IMG_CATEGORIA IS NULL')
 
 ## converter resultado para dict
 def row_to_dict(row):
     return {key: row[key] for key in row.keys()}
 
+## ler corpo JSON ou multipart/form-data (imagem como arquivo)
+def get_request_data():
+    if request.mimetype == 'multipart/form-data':
+        data = request.form.to_dict()
+        for field in ('autores', 'categorias'):
+            if field in request.form:
+                data[field] = request.form.getlist(field)
+        return data
+    return request.get_json()
+
+# ==================== MIGRACOES ====================
+
+MIGRATIONS_DIR = os.path.join(app.root_path, 'migrations')
+
+## migracoes disponiveis em ordem: (versao, nome, caminho); NNNN_nome.sql ou NNNN_nome.py
+def list_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = re.fullmatch(r'(\d+)_(\w+)\.(sql|py)', filename)
+        if match:
+            migrations.append((int(match[1]), match[2], os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+## separar um script SQL em comandos (gatilhos tem ';' dentro de BEGIN ... END)
+def split_sql(script):
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            if statement.strip():
+                yield statement
+            statement = ''
+    if statement.strip() and not statement.strip().startswith('--'):
+        yield statement
+
+## executar um script SQL dentro da transacao atual (executescript faria commit no meio)
+def execute_sql_file(db, path):
+    with open(path, encoding='utf-8') as f:
+        for statement in split_sql(f.read()):
+            db.execute(statement)
+
+## nome do objeto criado por um comando CREATE (tabela, indice, gatilho) ou da tabela de um INSERT
+def statement_target(statement):
+    statement = re.sub(r'^(\s*--[^\n]*\n)*\s*', '', statement)
+    match = re.match(r'CREATE\s+(?:VIRTUAL\s+|UNIQUE\s+)?(?:TABLE|INDEX|TRIGGER|VIEW)\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)'
+                     r'|INSERT\s+INTO\s+(\w+)', statement, re.IGNORECASE)
+    if match is None:
+        return None, None
+    return ('CREATE', match[1]) if match[1] else ('INSERT', match[2])
+
+## completar um banco criado pelo antigo schema.sql ate o schema da migracao 0001: colunas e
+## objetos que faltam sao criados e os dados existentes, preenchidos (hashes das imagens e busca).
+## Colunas que o ALTER TABLE nao consegue acrescentar interrompem a migracao sem alterar nada
+def upgrade_legacy_schema(db, path):
+    referencia = sqlite3.connect(':memory:')
+    try:
+        execute_sql_file(referencia, path)
+        tabelas = [row[0] for row in referencia.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE TABLE%'")]
+        colunas = {tabela: referencia.execute(f'PRAGMA table_info({tabela})').fetchall() for tabela in tabelas}
+    finally:
+        referencia.close()
+    existentes = {row[0] for row in db.execute('SELECT name FROM sqlite_master')}
+
+    for tabela in tabelas:
+        if tabela not in existentes:
+            continue
+        atuais = {row[1].upper() for row in db.execute(f'PRAGMA table_info({tabela})')}
+        for _, nome, tipo, notnull, default, pk in colunas[tabela]:
+            if nome.upper() in atuais:
+                continue
+            if pk or (notnull and default is None):
+                raise RuntimeError(f'Banco anterior às migrações sem a coluna {tabela}.{nome}, que não pode ser '
+                                   f'acrescentada; recrie o banco ou ajuste-o à migração 0001 manualmente')
+            db.execute(f'ALTER TABLE {tabela} ADD COLUMN {nome} {tipo}'
+                       + (f' DEFAULT {default}' if default is not None else '') + (' NOT NULL' if notnull else ''))
+
+    with open(path, encoding='utf-8') as f:
+        for statement in split_sql(f.read()):
+            # Objetos que ja existem e dados iniciais de tabelas que ja existiam ficam como estao
+            if statement_target(statement)[1] not in existentes:
+                db.execute(statement)
+
+    fill_image_hashes(db)
+    if 'LIVRO_BUSCA' not in existentes:
+        db.execute('''
+            INSERT INTO LIVRO_BUSCA (rowid, NM_LIVRO, AUTORES, CATEGORIAS)
+            SELECT l.ID_LIVRO, l.NM_LIVRO,
+                   (SELECT group_concat(a.NM_AUTOR, ' ') FROM LIVRO_AUTOR la
+                    JOIN AUTOR a ON a.ID_AUTOR = la.ID_AUTOR WHERE la.ID_LIVRO = l.ID_LIVRO),
+                   (SELECT group_concat(c.NM_CATEGORIA, ' ') FROM LIVRO_CATEGORIA lc
+                    JOIN CATEGORIA c ON c.ID_CATEGORIA = lc.ID_CATEGORIA WHERE lc.ID_LIVRO = l.ID_LIVRO)
+            FROM LIVRO l
+        ''')
+
+## versao atual do banco; cria VERSAO_SCHEMA em bancos novos ou anteriores as migracoes
+def schema_version(db):
+    try:
+        return db.execute('SELECT MAX(VERSAO) FROM VERSAO_SCHEMA WHERE APLICADA_EM IS NOT NULL').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        pass
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        db.execute('''
+            CREATE TABLE VERSAO_SCHEMA (
+                VERSAO INTEGER PRIMARY KEY,
+                NOME TEXT NOT NULL,
+                PROGRESSO TEXT,  -- migracoes .py: ponto de retomada do ultimo lote gravado
+                APLICADA_EM TEXT
+            )
+        ''')
+        # Banco criado pelo antigo schema.sql: completado ate o schema da migracao 0001
+        legado = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'LIVRO'").fetchone()
+        if legado:
+            version, name, path = list_migrations()[0]
+            click.echo(f'Banco anterior às migrações: completando o schema de {version:04d}_{name}...')
+            upgrade_legacy_schema(db, path)
+            db.execute("INSERT INTO VERSAO_SCHEMA (VERSAO, NOME, APLICADA_EM) VALUES (?, ?, datetime('now'))",
+                       (version, name))
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return 1 if legado else 0
+
+## aplicar migracao .sql: uma unica transacao junto com o registro da versao
+def apply_sql_migration(db, version, name, path):
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        execute_sql_file(db, path)
+        db.execute("INSERT INTO VERSAO_SCHEMA (VERSAO, NOME, APLICADA_EM) VALUES (?, ?, datetime('now'))",
+                   (version, name))
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+## aplicar migracao .py: upgrade(db, progresso) e um gerador que faz um lote por passo e
+## devolve o novo progresso; cada lote e uma transacao curta, entao a migracao pode ser
+## interrompida e retomada sem segurar a trava de escrita o tempo todo
+def apply_python_migration(db, version, name, path):
+    spec = importlib.util.spec_from_file_location(f'migracao_{version:04d}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    row = db.execute('SELECT PROGRESSO FROM VERSAO_SCHEMA WHERE VERSAO = ?', (version,)).fetchone()
+    if row is None:
+        db.execute('INSERT INTO VERSAO_SCHEMA (VERSAO, NOME) VALUES (?, ?)', (version, name))
+        db.commit()
+    progresso = json.loads(row['PROGRESSO']) if row and row['PROGRESSO'] else None
+    if progresso is not None:
+        click.echo(f'Retomando migração {version:04d} a partir de {progresso}')
+
+    steps = module.upgrade(db, progresso)
+    while True:
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            progresso = next(steps)
+        except StopIteration:
+            db.execute("UPDATE VERSAO_SCHEMA SET PROGRESSO = NULL, APLICADA_EM = datetime('now') WHERE VERSAO = ?",
+                       (version,))
+            db.commit()
+            return
+        except BaseException:
+            db.rollback()
+            raise
+        db.execute('UPDATE VERSAO_SCHEMA SET PROGRESSO = ? WHERE VERSAO = ?', (json.dumps(progresso), version))
+        db.commit()
+
+## levar o banco ate a ultima migracao; em banco atualizado e so uma consulta
+def migrate_db():
+    migrations = list_migrations()
+    db = connect_db()
+    try:
+        current = schema_version(db)
+        pendentes = [migration for migration in migrations if migration[0] > current]
+        for version, name, path in pendentes:
+            click.echo(f'Aplicando migração {version:04d}_{name}...')
+            if path.endswith('.py'):
+                apply_python_migration(db, version, name, path)
+            else:
+                apply_sql_migration(db, version, name, path)
+        return [version for version, _, _ in pendentes]
+    finally:
+        db.close()
+
+## carregar os dados de exemplo (seed.sql) se o banco estiver vazio
+def seed_db():
+    db = connect_db()
+    try:
+        if db.execute('SELECT 1 FROM ESTADO LIMIT 1').fetchone():
+            return False
+        db.execute('BEGIN IMMEDIATE')
+        execute_sql_file(db, os.path.join(app.root_path, 'seed.sql'))
+        fill_image_hashes(db)
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+## configurar Banco de Dados: migracoes e, em banco vazio, dados de exemplo
+def init_db():
+    read_pool.close_idle()
+    write_coordinator.close()
+    migrate_db()
+    seed_db()
+
+# ==================== CACHE DE RESPOSTAS ====================
+
+# Corpo JSON ja codificado, com ETag forte calculado uma unica vez
+CacheEntry = namedtuple('CacheEntry', ['body', 'etag', 'mimetype'])
+
+class ResponseCache:
+    """Cache LRU de respostas por processo, limitado pelo total de bytes"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        max_bytes = app.config['RESPONSE_CACHE_MAX_BYTES']
+        # Respostas muito grandes expulsariam todo o resto
+        if len(entry.body) > max_bytes // 4:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            while self.size > max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
+
+response_cache = ResponseCache()
+
+## versoes atuais das tabelas (lidas do banco para valer entre processos)
+def get_table_versions(tables):
+    rows = dict(get_db().execute('SELECT TABELA, VERSAO FROM CACHE_VERSAO').fetchall())
+    return tuple(rows.get(table, 0) for table in tables)
+
+## cachear a resposta do GET enquanto as tabelas de origem nao mudarem
+def cached_response(*tables):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Respostas em streaming nao passam pelo cache (o corpo nunca fica inteiro na memoria)
+            if stream_format():
+                return view(*args, **kwargs)
+            key = (request.path, request.query_string, get_table_versions(tables))
+            entry = response_cache.get(key)
+            status = 'HIT'
+            if entry is None:
+                status = 'MISS'
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = CacheEntry(body, hashlib.sha256(body).hexdigest(), response.mimetype)
+                response_cache.put(key, entry)
+
+            response = Response(entry.body, mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+            response.cache_control.no_cache = True
+            response.headers['X-Cache'] = status
+            response.vary.add('Accept')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+# ==================== RESPOSTAS EM STREAMING ====================
+
+## formato de streaming pedido: NDJSON pelo Accept, array JSON em partes com ?stream=1
+def stream_format():
+    if wants_columns():
+        return None
+    if request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+        return 'ndjson'
+    if request.args.get('stream') in ('1', 'true'):
+        return 'json'
+    return None
+
+## enviar as linhas do cursor conforme sao lidas (fetchmany), sem montar a lista inteira
+def stream_rows(cursor, fmt, transform=None):
+    chunk_rows = app.config['STREAM_CHUNK_ROWS']
+
+    def generate():
+        try:
+            if fmt == 'json':
+                yield '['
+            separator = ''
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                items = [row_to_dict(row) for row in rows]
+                if transform is not None:
+                    # Ex.: ?expand= resolvido por lote, nao por linha
+                    items = transform(items)
+                if fmt == 'ndjson':
+                    yield ''.join(app.json.dumps(item) + '\n' for item in items)
+                else:
+                    yield separator + ','.join(app.json.dumps(item) for item in items)
+                    separator = ','
+            if fmt == 'json':
+                yield ']'
+        finally:
+            cursor.close()
+
+    # stream_with_context mantem a requisicao (e a conexao do pool) ate a ultima parte
+    response = Response(stream_with_context(generate()),
+                        mimetype='application/x-ndjson' if fmt == 'ndjson' else 'application/json')
+    response.vary.add('Accept')
+    return response
+
+# ==================== FORMATO COLUNAR ====================
+
+## formato compacto pedido com ?format=columns
+def wants_columns():
+    return request.args.get('format') == 'columns'
+
+## montar {columns, values} direto das tuplas do cursor, sem um dict por linha
+def to_columns(description, rows, dictionary=(), flags=()):
+    names = [column[0] for column in description]
+    data = dict(zip(names, zip(*rows))) if rows else {name: () for name in names}
+    result = {'columns': [], 'values': [], 'dictionaries': {}, 'flags': {}}
+    for name in names:
+        if name in flags:
+            # Colunas S/N viram um unico inteiro: bit i ligado quando flags[i] = 'S'
+            if name != flags[0]:
+                continue
+            values = [0] * len(rows)
+            for bit, flag in enumerate(flags):
+                values = [value | (flag_value == 'S') << bit for value, flag_value in zip(values, data[flag])]
+            name = 'FLAGS'
+            result['flags'][name] = list(flags)
+        elif name in dictionary:
+            # Texto repetido vira indice em uma lista de valores distintos
+            index = {}
+            values = [index.setdefault(value, len(index)) for value in data[name]]
+            result['dictionaries'][name] = list(index)
+        else:
+            values = list(data[name])
+        result['columns'].append(name)
+        result['values'].append(values)
+    return result
+
 # ==================== ESTADO ENDPOINTS ====================
 
 @app.route('/estados', methods=['GET'])
+@cached_response('ESTADO')
 def get_estados():
     db = get_db()
     estados = db.execute('SELECT * FROM ESTADO ORDER BY NM_ESTADO').fetchall()
@@ -63,13 +798,11 @@ def create_estado():
     if not data or 'nm_estado' not in data:
         return jsonify({'error': 'Nome do estado é obrigatório'}), 400
     
-    db = get_db()
     try:
-        cursor = db.execute(
+        cursor = execute_write(
             'INSERT INTO ESTADO (NM_ESTADO) VALUES (?)',
             (data['nm_estado'],)
         )
-        db.commit()
         return jsonify({'id_estado': cursor.lastrowid, 'message': 'Estado criado com sucesso'}), 201
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 400
@@ -80,14 +813,12 @@ def update_estado(id_estado):
     if not data or 'nm_estado' not in data:
         return jsonify({'error': 'Nome do estado é obrigatório'}), 400
     
-    db = get_db()
     try:
-        db.execute(
+        cursor = execute_write(
             'UPDATE ESTADO SET NM_ESTADO = ? WHERE ID_ESTADO = ?',
             (data['nm_estado'], id_estado)
         )
-        db.commit()
-        if db.total_changes == 0:
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Estado não encontrado'}), 404
         return jsonify({'message': 'Estado atualizado com sucesso'})
     except sqlite3.Error as e:
@@ -95,11 +826,9 @@ def update_estado(id_estado):
 
 @app.route('/estados/<int:id_estado>', methods=['DELETE'])
 def delete_estado(id_estado):
-    db = get_db()
     try:
-        db.execute('DELETE FROM ESTADO WHERE ID_ESTADO = ?', (id_estado,))
-        db.commit()
-        if db.total_changes == 0:
+        cursor = execute_write('DELETE FROM ESTADO WHERE ID_ESTADO = ?', (id_estado,))
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Estado não encontrado'}), 404
         return jsonify({'message': 'Estado deletado com sucesso'})
     except sqlite3.Error as e:
@@ -108,6 +837,7 @@ def delete_estado(id_estado):
 # ==================== CIDADE ENDPOINTS ====================
 
 @app.route('/cidades', methods=['GET'])
+@cached_response('CIDADE', 'ESTADO')
 def get_cidades():
     db = get_db()
     cidades = db.execute('''
@@ -115,8 +845,13 @@ def get_cidades():
         FROM CIDADE c 
         JOIN ESTADO e ON c.ID_ESTADO = e.ID_ESTADO 
         ORDER BY c.NM_CIDADE
-    ''').fetchall()
-    return jsonify([row_to_dict(row) for row in cidades])
+    ''')
+    if wants_columns():
+        return jsonify(to_columns(cidades.description, cidades.fetchall(), dictionary=('NM_ESTADO',)))
+    fmt = stream_format()
+    if fmt:
+        return stream_rows(cidades, fmt)
+    return jsonify([row_to_dict(row) for row in cidades.fetchall()])
 
 @app.route('/cidades/<int:id_cidade>', methods=['GET'])
 def get_cidade(id_cidade):
@@ -137,13 +872,11 @@ def create_cidade():
     if not data or 'nm_cidade' not in data or 'id_estado' not in data:
         return jsonify({'error': 'Nome da cidade e ID do estado são obrigatórios'}), 400
     
-    db = get_db()
     try:
-        cursor = db.execute(
+        cursor = execute_write(
             'INSERT INTO CIDADE (NM_CIDADE, ID_ESTADO) VALUES (?, ?)',
             (data['nm_cidade'], data['id_estado'])
         )
-        db.commit()
         return jsonify({'id_cidade': cursor.lastrowid, 'message': 'Cidade criada com sucesso'}), 201
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 400
@@ -154,14 +887,12 @@ def update_cidade(id_cidade):
     if not data or 'nm_cidade' not in data or 'id_estado' not in data:
         return jsonify({'error': 'Nome da cidade e ID do estado são obrigatórios'}), 400
     
-    db = get_db()
     try:
-        db.execute(
+        cursor = execute_write(
             'UPDATE CIDADE SET NM_CIDADE = ?, ID_ESTADO = ? WHERE ID_CIDADE = ?',
             (data['nm_cidade'], data['id_estado'], id_cidade)
         )
-        db.commit()
-        if db.total_changes == 0:
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Cidade não encontrada'}), 404
         return jsonify({'message': 'Cidade atualizada com sucesso'})
     except sqlite3.Error as e:
@@ -169,11 +900,9 @@ def update_cidade(id_cidade):
 
 @app.route('/cidades/<int:id_cidade>', methods=['DELETE'])
 def delete_cidade(id_cidade):
-    db = get_db()
     try:
-        db.execute('DELETE FROM CIDADE WHERE ID_CIDADE = ?', (id_cidade,))
-        db.commit()
-        if db.total_changes == 0:
+        cursor = execute_write('DELETE FROM CIDADE WHERE ID_CIDADE = ?', (id_cidade,))
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Cidade não encontrada'}), 404
         return jsonify({'message': 'Cidade deletada com sucesso'})
     except sqlite3.Error as e:
@@ -182,6 +911,7 @@ def delete_cidade(id_cidade):
 # ==================== BAIRRO ENDPOINTS ====================
 
 @app.route('/bairros', methods=['GET'])
+@cached_response('BAIRRO', 'CIDADE', 'ESTADO')
 def get_bairros():
     db = get_db()
     bairros = db.execute('''
@@ -190,8 +920,14 @@ def get_bairros():
         JOIN CIDADE c ON b.ID_CIDADE = c.ID_CIDADE 
         JOIN ESTADO e ON c.ID_ESTADO = e.ID_ESTADO 
         ORDER BY b.NM_BAIRRO
-    ''').fetchall()
-    return jsonify([row_to_dict(row) for row in bairros])
+    ''')
+    if wants_columns():
+        return jsonify(to_columns(bairros.description, bairros.fetchall(),
+                                  dictionary=('NM_CIDADE', 'NM_ESTADO')))
+    fmt = stream_format()
+    if fmt:
+        return stream_rows(bairros, fmt)
+    return jsonify([row_to_dict(row) for row in bairros.fetchall()])
 
 @app.route('/bairros/<int:cep>', methods=['GET'])
 def get_bairro(cep):
@@ -213,13 +949,11 @@ def create_bairro():
     if not data or 'cep' not in data or 'nm_bairro' not in data or 'id_cidade' not in data:
         return jsonify({'error': 'CEP, nome do bairro e ID da cidade são obrigatórios'}), 400
     
-    db = get_db()
     try:
-        db.execute(
+        execute_write(
             'INSERT INTO BAIRRO (CEP, NM_BAIRRO, ID_CIDADE) VALUES (?, ?, ?)',
             (data['cep'], data['nm_bairro'], data['id_cidade'])
         )
-        db.commit()
         return jsonify({'message': 'Bairro criado com sucesso'}), 201
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 400
@@ -230,14 +964,12 @@ def update_bairro(cep):
     if not data or 'nm_bairro' not in data or 'id_cidade' not in data:
         return jsonify({'error': 'Nome do bairro e ID da cidade são obrigatórios'}), 400
     
-    db = get_db()
     try:
-        db.execute(
+        cursor = execute_write(
             'UPDATE BAIRRO SET NM_BAIRRO = ?, ID_CIDADE = ? WHERE CEP = ?',
             (data['nm_bairro'], data['id_cidade'], cep)
         )
-        db.commit()
-        if db.total_changes == 0:
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Bairro não encontrado'}), 404
         return jsonify({'message': 'Bairro atualizado com sucesso'})
     except sqlite3.Error as e:
@@ -245,11 +977,9 @@ def update_bairro(cep):
 
 @app.route('/bairros/<int:cep>', methods=['DELETE'])
 def delete_bairro(cep):
-    db = get_db()
     try:
-        db.execute('DELETE FROM BAIRRO WHERE CEP = ?', (cep,))
-        db.commit()
-        if db.total_changes == 0:
+        cursor = execute_write('DELETE FROM BAIRRO WHERE CEP = ?', (cep,))
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Bairro não encontrado'}), 404
         return jsonify({'message': 'Bairro deletado com sucesso'})
     except sqlite3.Error as e:
@@ -277,13 +1007,11 @@ def create_usuario():
     if not data or 'login' not in data or 'senha' not in data or 'nm_usuario' not in data:
         return jsonify({'error': 'Login, senha e nome do usuário são obrigatórios'}), 400
     
-    db = get_db()
     try:
-        db.execute(
+        execute_write(
             'INSERT INTO USUARIO (LOGIN, SENHA, NM_USUARIO, EMAIL_CONTATO) VALUES (?, ?, ?, ?)',
             (data['login'], data['senha'], data['nm_usuario'], data.get('email_contato'))
         )
-        db.commit()
         return jsonify({'message': 'Usuário criado com sucesso'}), 201
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 400
@@ -294,7 +1022,6 @@ def update_usuario(login):
     if not data or 'nm_usuario' not in data:
         return jsonify({'error': 'Nome do usuário é obrigatório'}), 400
     
-    db = get_db()
     try:
         query = 'UPDATE USUARIO SET NM_USUARIO = ?, EMAIL_CONTATO = ?'
         params = [data['nm_usuario'], data.get('email_contato')]
@@ -306,9 +1033,8 @@ def update_usuario(login):
         query += ' WHERE LOGIN = ?'
         params.append(login)
         
-        db.execute(query, params)
-        db.commit()
-        if db.total_changes == 0:
+        cursor = execute_write(query, params)
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Usuário não encontrado'}), 404
         return jsonify({'message': 'Usuário atualizado com sucesso'})
     except sqlite3.Error as e:
@@ -316,11 +1042,9 @@ def update_usuario(login):
 
 @app.route('/usuarios/<login>', methods=['DELETE'])
 def delete_usuario(login):
-    db = get_db()
     try:
-        db.execute('DELETE FROM USUARIO WHERE LOGIN = ?', (login,))
-        db.commit()
-        if db.total_changes == 0:
+        cursor = execute_write('DELETE FROM USUARIO WHERE LOGIN = ?', (login,))
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Usuário não encontrado'}), 404
         return jsonify({'message': 'Usuário deletado com sucesso'})
     except sqlite3.Error as e:
@@ -329,6 +1053,7 @@ def delete_usuario(login):
 # ==================== AUTOR ENDPOINTS ====================
 
 @app.route('/autores', methods=['GET'])
+@cached_response('AUTOR')
 def get_autores():
     db = get_db()
     autores = db.execute('SELECT * FROM AUTOR ORDER BY NM_AUTOR').fetchall()
@@ -348,13 +1073,11 @@ def create_autor():
     if not data or 'nm_autor' not in data:
         return jsonify({'error': 'Nome do autor é obrigatório'}), 400
     
-    db = get_db()
     try:
-        cursor = db.execute(
+        cursor = execute_write(
             'INSERT INTO AUTOR (NM_AUTOR) VALUES (?)',
             (data['nm_autor'],)
         )
-        db.commit()
         return jsonify({'id_autor': cursor.lastrowid, 'message': 'Autor criado com sucesso'}), 201
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 400
@@ -365,14 +1088,12 @@ def update_autor(id_autor):
     if not data or 'nm_autor' not in data:
         return jsonify({'error': 'Nome do autor é obrigatório'}), 400
     
-    db = get_db()
     try:
-        db.execute(
+        cursor = execute_write(
             'UPDATE AUTOR SET NM_AUTOR = ? WHERE ID_AUTOR = ?',
             (data['nm_autor'], id_autor)
         )
-        db.commit()
-        if db.total_changes == 0:
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Autor não encontrado'}), 404
         return jsonify({'message': 'Autor atualizado com sucesso'})
     except sqlite3.Error as e:
@@ -380,11 +1101,9 @@ def update_autor(id_autor):
 
 @app.route('/autores/<int:id_autor>', methods=['DELETE'])
 def delete_autor(id_autor):
-    db = get_db()
     try:
-        db.execute('DELETE FROM AUTOR WHERE ID_AUTOR = ?', (id_autor,))
-        db.commit()
-        if db.total_changes == 0:
+        cursor = execute_write('DELETE FROM AUTOR WHERE ID_AUTOR = ?', (id_autor,))
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Autor não encontrado'}), 404
         return jsonify({'message': 'Autor deletado com sucesso'})
     except sqlite3.Error as e:
@@ -393,87 +1112,93 @@ def delete_autor(id_autor):
 # ==================== CATEGORIA ENDPOINTS ====================
 
 @app.route('/categorias', methods=['GET'])
+@cached_response('CATEGORIA')
 def get_categorias():
     db = get_db()
     categorias = db.execute('SELECT ID_CATEGORIA, NM_CATEGORIA FROM CATEGORIA ORDER BY NM_CATEGORIA').fetchall()
-    result = []
-    for row in categorias:
-        categoria = row_to_dict(row)
-        # Get image separately to avoid loading all images at once
-        result.append(categoria)
-    return jsonify(result)
+    return jsonify([row_to_dict(row) for row in categorias])
 
 @app.route('/categorias/<int:id_categoria>', methods=['GET'])
 def get_categoria(id_categoria):
     db = get_db()
-    categoria = db.execute('SELECT * FROM CATEGORIA WHERE ID_CATEGORIA = ?', (id_categoria,)).fetchone()
+    categoria = db.execute('''
+        SELECT ID_CATEGORIA, NM_CATEGORIA, HASH_IMG_CATEGORIA
+        FROM CATEGORIA WHERE ID_CATEGORIA = ?
+    ''', (id_categoria,)).fetchone()
     if categoria is None:
         return jsonify({'error': 'Categoria não encontrada'}), 404
     
     result = row_to_dict(categoria)
-    if result['IMG_CATEGORIA']:
-        result['IMG_CATEGORIA'] = base64.b64encode(result['IMG_CATEGORIA']).decode('utf-8')
+    result['IMG_CATEGORIA_URL'] = image_url('get_categoria_imagem', result['HASH_IMG_CATEGORIA'],
+                                            id_categoria=id_categoria)
     return jsonify(result)
 
 @app.route('/categorias', methods=['POST'])
 def create_categoria():
-    data = request.get_json()
-    if not data or 'nm_categoria' not in data or 'img_categoria' not in data:
+    data = get_request_data()
+    if not data or 'nm_categoria' not in data or not has_image(data, 'img_categoria'):
         return jsonify({'error': 'Nome da categoria e imagem são obrigatórios'}), 400
     
-    try:
-        img_data = base64.b64decode(data['img_categoria'])
-    except:
-        return jsonify({'error': 'Imagem deve estar em base64'}), 400
+    img, error = get_image_upload(data, 'img_categoria')
+    if error:
+        return error
     
-    db = get_db()
-    try:
+    def insert(db):
         cursor = db.execute(
-            'INSERT INTO CATEGORIA (NM_CATEGORIA, IMG_CATEGORIA) VALUES (?, ?)',
-            (data['nm_categoria'], img_data)
+            'INSERT INTO CATEGORIA (NM_CATEGORIA, IMG_CATEGORIA) VALUES (?, zeroblob(?))',
+            (data['nm_categoria'], img.size)
         )
-        db.commit()
-        return jsonify({'id_categoria': cursor.lastrowid, 'message': 'Categoria criada com sucesso'}), 201
+        return cursor.lastrowid, store_image(db, 'CATEGORIA', cursor.lastrowid, img)
+
+    try:
+        id_categoria, img_hash = write_coordinator.execute(insert)
+        schedule_thumbnails(get_db(), 'CATEGORIA', id_categoria, img_hash)
+        return jsonify({'id_categoria': id_categoria, 'message': 'Categoria criada com sucesso'}), 201
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 400
 
 @app.route('/categorias/<int:id_categoria>', methods=['PUT'])
 def update_categoria(id_categoria):
-    data = request.get_json()
+    data = get_request_data()
     if not data or 'nm_categoria' not in data:
         return jsonify({'error': 'Nome da categoria é obrigatório'}), 400
     
-    db = get_db()
-    try:
-        if 'img_categoria' in data:
-            try:
-                img_data = base64.b64decode(data['img_categoria'])
-                db.execute(
-                    'UPDATE CATEGORIA SET NM_CATEGORIA = ?, IMG_CATEGORIA = ? WHERE ID_CATEGORIA = ?',
-                    (data['nm_categoria'], img_data, id_categoria)
-                )
-            except:
-                return jsonify({'error': 'Imagem deve estar em base64'}), 400
-        else:
-            db.execute(
+    img = None
+    if has_image(data, 'img_categoria'):
+        img, error = get_image_upload(data, 'img_categoria')
+        if error:
+            return error
+
+    def update(db):
+        if img is None:
+            cursor = db.execute(
                 'UPDATE CATEGORIA SET NM_CATEGORIA = ? WHERE ID_CATEGORIA = ?',
                 (data['nm_categoria'], id_categoria)
             )
-        
-        db.commit()
-        if db.total_changes == 0:
+            return cursor.rowcount, None
+        cursor = db.execute(
+            'UPDATE CATEGORIA SET NM_CATEGORIA = ?, IMG_CATEGORIA = zeroblob(?) WHERE ID_CATEGORIA = ?',
+            (data['nm_categoria'], img.size, id_categoria)
+        )
+        if cursor.rowcount == 0:
+            return 0, None
+        return cursor.rowcount, store_image(db, 'CATEGORIA', id_categoria, img)
+
+    try:
+        rowcount, img_hash = write_coordinator.execute(update)
+        if rowcount == 0:
             return jsonify({'error': 'Categoria não encontrada'}), 404
+        if img_hash:
+            schedule_thumbnails(get_db(), 'CATEGORIA', id_categoria, img_hash)
         return jsonify({'message': 'Categoria atualizada com sucesso'})
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 400
 
 @app.route('/categorias/<int:id_categoria>', methods=['DELETE'])
 def delete_categoria(id_categoria):
-    db = get_db()
     try:
-        db.execute('DELETE FROM CATEGORIA WHERE ID_CATEGORIA = ?', (id_categoria,))
-        db.commit()
-        if db.total_changes == 0:
+        cursor = execute_write('DELETE FROM CATEGORIA WHERE ID_CATEGORIA = ?', (id_categoria,))
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Categoria não encontrada'}), 404
         return jsonify({'message': 'Categoria deletada com sucesso'})
     except sqlite3.Error as e:
@@ -481,180 +1206,2790 @@ def delete_categoria(id_categoria):
 
 # ==================== LIVRO ENDPOINTS ====================
 
+## codificar cursor de paginacao (ultimo NM_LIVRO e ID_LIVRO da pagina)
+def encode_cursor(nm_livro, id_livro):
+    raw = json.dumps([nm_livro, id_livro], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+## decodificar cursor recebido em ?after=
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    nm_livro, id_livro = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    if not isinstance(nm_livro, str) or not isinstance(id_livro, int):
+        raise ValueError('Cursor inválido')
+    return nm_livro, id_livro
+
+LIVRO_FLAGS = ['pagamento_eletronico', 'pagamento_dinheiro', 'entrega_presencial', 'entrega_delivery']
+LIVRO_FIELDS = ['nm_livro', 'preco'] + LIVRO_FLAGS + ['cep', 'login_comprador', 'login_vendedor']
+
+## montar filtros de LIVRO a partir da query string
+def build_livro_filters(args):
+    where = []
+    params = []
+
+    if 'preco_min' in args:
+        where.append('l.PRECO >= ?')
+        params.append(float(args['preco_min']))
+    if 'preco_max' in args:
+        where.append('l.PRECO <= ?')
+        params.append(float(args['preco_max']))
+
+    for flag in LIVRO_FLAGS:
+        if flag in args:
+            valor = args[flag].upper()
+            if valor not in ('S', 'N'):
+                raise ValueError(f'{flag} deve ser S ou N')
+            where.append(f'l.{flag.upper()} = ?')
+            params.append(valor)
+
+    if 'cep' in args:
+        where.append('l.CEP = ?')
+        params.append(int(args['cep']))
+    if 'cidade' in args:
+        where.append('l.ID_CIDADE = ?')
+        params.append(int(args['cidade']))
+    if 'estado' in args:
+        where.append('l.ID_ESTADO = ?')
+        params.append(int(args['estado']))
+
+    if 'categoria' in args:
+        where.append('''EXISTS (SELECT 1 FROM LIVRO_CATEGORIA lc
+                                WHERE lc.ID_CATEGORIA = ? AND lc.ID_LIVRO = l.ID_LIVRO)''')
+        params.append(int(args['categoria']))
+    if 'autor' in args:
+        where.append('''EXISTS (SELECT 1 FROM LIVRO_AUTOR la
+                                WHERE la.ID_AUTOR = ? AND la.ID_LIVRO = l.ID_LIVRO)''')
+        params.append(int(args['autor']))
+
+    if 'ids' in args:
+        # Multi-get: ?ids=1,2,3 (limitado ao tamanho maximo da pagina)
+        ids = [int(value) for value in args['ids'].split(',')]
+        if len(ids) > app.config['LIVROS_MAX_PAGE_SIZE']:
+            raise ValueError('ids demais')
+        where.append(f'l.ID_LIVRO IN ({", ".join("?" * len(ids))})')
+        params.extend(ids)
+
+    return where, params
+
+# Colunas de LIVRO_LISTAGEM devolvidas nas listagens
+LIVRO_COLUMNS = '''
+    l.ID_LIVRO, l.NM_LIVRO, l.PRECO, l.PAGAMENTO_ELETRONICO,
+    l.PAGAMENTO_DINHEIRO, l.ENTREGA_PRESENCIAL, l.ENTREGA_DELIVERY,
+    l.CEP, l.LOGIN_COMPRADOR, l.LOGIN_VENDEDOR,
+    l.NM_BAIRRO, l.NM_CIDADE, l.NM_ESTADO
+'''
+
+# Relacoes que podem vir embutidas nos livros (?expand=autores,categorias):
+# listas JSON ja guardadas em LIVRO_LISTAGEM
+LIVRO_EXPANSIONS = {
+    'autores': 'AUTORES',
+    'categorias': 'CATEGORIAS',
+}
+
+## ler ?expand= (lista separada por virgulas)
+def get_expand(args):
+    expand = [value for value in args.get('expand', '').split(',') if value]
+    for value in expand:
+        if value not in LIVRO_EXPANSIONS:
+            raise ValueError(f'expand invalido: {value}')
+    return expand
+
+## colunas extras do SELECT para as relacoes pedidas em ?expand=
+def expand_columns(expand):
+    return ''.join(f', l.{LIVRO_EXPANSIONS[relation]}' for relation in expand)
+
+## embutir autores/categorias: decodifica as listas JSON lidas junto com os livros
+def expand_livros(livros, expand):
+    for livro in livros:
+        for relation in expand:
+            livro[relation] = json.loads(livro.pop(LIVRO_EXPANSIONS[relation]))
+    return livros
+
+## ler ?limit= respeitando o maximo configurado
+def get_page_size(args):
+    limit = int(args.get('limit', app.config['LIVROS_PAGE_SIZE']))
+    if limit < 1:
+        raise ValueError('limit deve ser positivo')
+    return min(limit, app.config['LIVROS_MAX_PAGE_SIZE'])
+
 @app.route('/livros', methods=['GET'])
 def get_livros():
+    fmt = stream_format()
+    try:
+        where, params = build_livro_filters(request.args)
+        expand = get_expand(request.args)
+        # Em streaming a exportacao vai ate o fim, salvo limit explicito
+        limit = get_page_size(request.args) if not fmt or 'limit' in request.args else -1
+        if expand and wants_columns():
+            raise ValueError('expand nao combina com format=columns')
+        if 'after' in request.args:
+            # Keyset: continua a partir do ultimo livro visto, sem OFFSET
+            where.append('(l.NM_LIVRO, l.ID_LIVRO) > (?, ?)')
+            params.extend(decode_cursor(request.args['after']))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Filtros ou cursor de paginação inválidos'}), 400
+
+    db = get_db()
+    livros = db.execute(f'''
+        SELECT {LIVRO_COLUMNS}{expand_columns(expand)}
+        FROM LIVRO_LISTAGEM l
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY l.NM_LIVRO, l.ID_LIVRO
+        LIMIT ?
+    ''', params + [limit])
+    if fmt:
+        return stream_rows(livros, fmt, lambda chunk: expand_livros(chunk, expand))
+
+    description = livros.description
+    livros = livros.fetchall()
+    if wants_columns():
+        response = jsonify(to_columns(description, livros, flags=[flag.upper() for flag in LIVRO_FLAGS],
+                                      dictionary=('NM_BAIRRO', 'NM_CIDADE', 'NM_ESTADO',
+                                                  'LOGIN_COMPRADOR', 'LOGIN_VENDEDOR')))
+    else:
+        response = jsonify(expand_livros([row_to_dict(row) for row in livros], expand))
+    # Cursor da proxima pagina vai nos cabecalhos para manter o corpo como lista
+    if len(livros) == limit:
+        ultimo = livros[-1]
+        cursor = encode_cursor(ultimo['NM_LIVRO'], ultimo['ID_LIVRO'])
+        args = request.args.to_dict()
+        args.update({'after': cursor, 'limit': limit})
+        response.headers['X-Next-Cursor'] = cursor
+        response.headers['Link'] = f'<{url_for("get_livros", **args)}>; rel="next"'
+    return response
+
+## transformar texto livre em expressao MATCH do FTS5
+def build_fts_query(texto):
+    # Cada termo vira uma frase entre aspas (sem operadores do usuario);
+    # o ultimo termo casa por prefixo para funcionar durante a digitacao
+    termos = re.findall(r'\w+', texto)
+    if not termos:
+        return None
+    frases = [f'"{termo}"' for termo in termos]
+    frases[-1] += '*'
+    return ' '.join(frases)
+
+@app.route('/livros/busca', methods=['GET'])
+def search_livros():
+    match = build_fts_query(request.args.get('q', ''))
+    if match is None:
+        return jsonify({'error': 'Parâmetro q é obrigatório'}), 400
+
+    try:
+        where, params = build_livro_filters(request.args)
+        limit = get_page_size(request.args)
+        expand = get_expand(request.args)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Filtros de busca inválidos'}), 400
+
+    db = get_db()
+    livros = db.execute(f'''
+        SELECT {LIVRO_COLUMNS}{expand_columns(expand)}
+        FROM LIVRO_BUSCA f
+        JOIN LIVRO_LISTAGEM l ON l.ID_LIVRO = f.rowid
+        WHERE LIVRO_BUSCA MATCH ?
+        {''.join(' AND ' + clause for clause in where)}
+        ORDER BY f.rank
+        LIMIT ?
+    ''', [match] + params + [limit]).fetchall()
+    return jsonify(expand_livros([row_to_dict(row) for row in livros], expand))
+
+@app.route('/livros/changes', methods=['GET'])
+def get_livros_changes():
+    try:
+        since = int(request.args.get('since', 0))
+        limit = get_page_size(request.args)
+        expand = get_expand(request.args)
+        seq_minimo = request.args.get('seq_minimo')
+        if seq_minimo is not None:
+            seq_minimo = int(seq_minimo)
+        if since < 0:
+            raise ValueError('since deve ser positivo')
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Parâmetros since, limit, seq_minimo ou expand inválidos'}), 400
+
+    db = get_db()
+    # since=0 e uma sincronizacao completa: remocoes compactadas nao importam para quem nao tem nada.
+    # As paginas seguintes dela passam seq_minimo: sem compactacao no meio, tambem nao importam
+    limite = db.execute('SELECT SEQ FROM LIVRO_ALTERACAO_LIMITE').fetchone()[0]
+    completa = since == 0 or seq_minimo == limite
+    if not completa and since < limite:
+        return jsonify({'error': 'Alterações anteriores já foram compactadas, sincronize com since=0',
+                        'seq_minimo': limite}), 410
+
+    # Uma unica consulta: alteracoes e linhas de LIVRO_LISTAGEM do mesmo instante
+    rows = db.execute(f'''
+        SELECT a.SEQ, a.ID_LIVRO AS ID_ALTERADO, a.REMOVIDO, {LIVRO_COLUMNS}{expand_columns(expand)}
+        FROM LIVRO_ALTERACAO a
+        LEFT JOIN LIVRO_LISTAGEM l ON l.ID_LIVRO = a.ID_LIVRO
+        WHERE a.SEQ > ?
+        ORDER BY a.SEQ
+        LIMIT ?
+    ''', (since, limit)).fetchall()
+
+    # Cada livro aparece no maximo uma vez (so a ultima alteracao fica no log)
+    upserts = []
+    deletes = []
+    for row in rows:
+        if row['REMOVIDO'] == 'S':
+            deletes.append(row['ID_ALTERADO'])
+        else:
+            livro = row_to_dict(row)
+            for column in ('SEQ', 'ID_ALTERADO', 'REMOVIDO'):
+                del livro[column]
+            upserts.append(livro)
+    resposta = {
+        'upserts': expand_livros(upserts, expand),
+        'deletes': deletes,
+        # Proximo since; sem alteracoes, o cliente continua de onde estava
+        'seq': rows[-1]['SEQ'] if rows else since,
+        'has_more': len(rows) == limit,
+    }
+    if completa:
+        resposta['seq_minimo'] = limite
+    return jsonify(resposta)
+
+RAIO_TERRA_KM = 6371.0
+KM_POR_GRAU = 111.32  # um grau de latitude (ou de longitude no equador)
+
+# CEPs sem coordenadas: regioes pelo prefixo do CEP, da mais proxima para a mais larga,
+# com o raio (km) a partir do qual a regiao seguinte tambem entra
+CEP_PREFIXOS = [(5, 2), (4, 10), (3, 50), (2, 200), (1, None)]
+
+## distancia em km entre dois pontos (formula de haversine)
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * math.asin(math.sqrt(a))
+
+## bairros a ate alcance km da origem, com a distancia
+def bairros_proximos(db, lat, lon, alcance):
+    dlat = alcance / KM_POR_GRAU
+    dlon = alcance / (KM_POR_GRAU * max(math.cos(math.radians(lat)), 0.01))
+    # Pre-filtro pela caixa no R*Tree; a distancia exata e calculada so para os bairros da caixa
+    candidatos = db.execute('''
+        SELECT CEP, LATITUDE, LONGITUDE FROM BAIRRO_COORDENADA
+        WHERE MAX_LAT >= ? AND MIN_LAT <= ? AND MAX_LON >= ? AND MIN_LON <= ?
+    ''', (lat - dlat, lat + dlat, lon - dlon, lon + dlon))
+    for cep, cep_lat, cep_lon in candidatos:
+        distancia = haversine_km(lat, lon, cep_lat, cep_lon)
+        if distancia <= alcance:
+            yield cep, distancia
+
+## livros dos bairros a ate raio km, do mais perto para o mais longe
+def livros_por_distancia(db, origem, raio, where, params, expand, limit):
+    lat, lon = origem
+    livros = []
+    interno = -1
+    alcance = min(raio, 1)
+    # Aneis cada vez maiores em volta da origem: quando os bairros mais proximos ja enchem a pagina,
+    # os mais distantes nem sao lidos (todo livro de um anel esta mais longe que os do anel anterior)
+    while True:
+        anel = [[cep, round(distancia, 2)] for cep, distancia in bairros_proximos(db, lat, lon, alcance)
+                if distancia > interno]
+        if anel:
+            livros += db.execute(f'''
+                SELECT {LIVRO_COLUMNS}{expand_columns(expand)}, json_extract(d.value, '$[1]') AS DISTANCIA_KM
+                FROM json_each(?) d
+                JOIN LIVRO_LISTAGEM l ON l.CEP = json_extract(d.value, '$[0]')
+                {'WHERE ' + ' AND '.join(where) if where else ''}
+                ORDER BY DISTANCIA_KM, l.NM_LIVRO, l.ID_LIVRO
+                LIMIT ?
+            ''', [json.dumps(anel)] + params + [limit - len(livros)]).fetchall()
+        if len(livros) >= limit or alcance >= raio:
+            return livros
+        interno, alcance = alcance, min(alcance * 2, raio)
+
+## livros pelo prefixo do CEP (origem sem coordenadas): mesmo prefixo de 5 digitos primeiro
+def livros_por_prefixo(db, cep, raio, where, params, expand, limit):
+    livros = []
+    interna = None
+    for digitos, ate_km in CEP_PREFIXOS:
+        faixa = 10 ** (8 - digitos)
+        inicio = cep // faixa * faixa
+        # A regiao anterior (mais proxima) ja foi lida: sobram as faixas abaixo e acima dela,
+        # cada uma lida em ordem de CEP direto do indice (CEP, NM_LIVRO, ID_LIVRO)
+        faixas = [(inicio, interna[0]), (interna[1], inicio + faixa)] if interna else [(inicio, inicio + faixa)]
+        for de, ate in faixas:
+            if de >= ate or len(livros) >= limit:
+                continue
+            livros += db.execute(f'''
+                SELECT {LIVRO_COLUMNS}{expand_columns(expand)}, NULL AS DISTANCIA_KM
+                FROM LIVRO_LISTAGEM l
+                WHERE {' AND '.join(['l.CEP >= ?', 'l.CEP < ?'] + where)}
+                ORDER BY l.CEP, l.NM_LIVRO, l.ID_LIVRO
+                LIMIT ?
+            ''', [de, ate] + params + [limit - len(livros)]).fetchall()
+        interna = (inicio, inicio + faixa)
+        # Sem nenhum livro dentro do raio, a regiao seguinte entra mesmo assim: o prefixo so aproxima a distancia
+        if len(livros) >= limit or ate_km is None or (raio <= ate_km and livros):
+            break
+    return livros
+
+@app.route('/livros/proximos', methods=['GET'])
+def get_livros_proximos():
+    args = request.args.copy()
+    try:
+        cep = int(args.pop('cep'))
+        raio = float(args.pop('raio_km', app.config['LIVROS_PROXIMOS_RAIO_KM']))
+        if not 0 < raio <= app.config['LIVROS_PROXIMOS_MAX_RAIO_KM']:
+            raise ValueError('raio_km fora do limite')
+        # Demais filtros de /livros (o CEP aqui e a origem, nao um filtro)
+        where, params = build_livro_filters(args)
+        limit = get_page_size(args)
+        expand = get_expand(args)
+    except (KeyError, ValueError, TypeError):
+        return jsonify({'error': 'Parâmetros cep, raio_km ou filtros inválidos'}), 400
+
+    db = get_db()
+    if db.execute('SELECT 1 FROM BAIRRO WHERE CEP = ?', (cep,)).fetchone() is None:
+        return jsonify({'error': 'CEP não encontrado'}), 404
+    origem = db.execute('SELECT LATITUDE, LONGITUDE FROM BAIRRO_COORDENADA WHERE CEP = ?', (cep,)).fetchone()
+    if origem is not None:
+        livros = livros_por_distancia(db, tuple(origem), raio, where, params, expand, limit)
+    else:
+        livros = livros_por_prefixo(db, cep, raio, where, params, expand, limit)
+
+    response = jsonify(expand_livros([row_to_dict(row) for row in livros], expand))
+    response.headers['X-Proximidade'] = 'coordenadas' if origem is not None else 'prefixo-cep'
+    return response
+
+# Facetas com nome: tabela e colunas de onde vem o nome de cada ID
+LIVRO_FACETAS_NOMEADAS = {
+    'categoria': ('categorias', 'CATEGORIA', 'ID_CATEGORIA', 'NM_CATEGORIA'),
+    'estado': ('estados', 'ESTADO', 'ID_ESTADO', 'NM_ESTADO'),
+    'cidade': ('cidades', 'CIDADE', 'ID_CIDADE', 'NM_CIDADE'),
+}
+
+## contagens por faceta do catalogo inteiro: lidas de LIVRO_FACETA (mantida pelos gatilhos)
+def facetas_catalogo(db):
+    contagens = {}
+    for faceta, valor, total in db.execute('SELECT FACETA, VALOR, TOTAL FROM LIVRO_FACETA WHERE TOTAL > 0'):
+        contagens.setdefault(faceta, {})[valor] = total
+    return contagens
+
+## contagens por faceta dos livros que atendem aos filtros/busca: o conjunto filtrado e lido uma
+## unica vez e agregado por todas as facetas na mesma consulta
+def facetas_filtradas(db, where, params, match):
+    origem = 'FROM LIVRO_LISTAGEM l'
+    # CROSS JOIN fixa a ordem: a busca (ou o conjunto filtrado) conduz, nunca o catalogo inteiro
+    if match is not None:
+        origem = 'FROM LIVRO_BUSCA f CROSS JOIN LIVRO_LISTAGEM l ON l.ID_LIVRO = f.rowid'
+        where = ['LIVRO_BUSCA MATCH ?'] + where
+        params = [match] + params
+    colunas = ['ID_ESTADO', 'ID_CIDADE'] + [flag.upper() for flag in LIVRO_FLAGS]
+    rows = db.execute(f'''
+        WITH filtrados AS MATERIALIZED (
+            SELECT l.ID_LIVRO, {', '.join('l.' + coluna for coluna in colunas)}
+            {origem}
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+        )
+        SELECT NULL AS ID_CATEGORIA, {', '.join(colunas)}, COUNT(*) AS TOTAL
+        FROM filtrados
+        GROUP BY {', '.join(colunas)}
+        UNION ALL
+        SELECT lc.ID_CATEGORIA, {', '.join('NULL' for _ in colunas)}, COUNT(*)
+        FROM filtrados CROSS JOIN LIVRO_CATEGORIA lc ON lc.ID_LIVRO = filtrados.ID_LIVRO
+        GROUP BY lc.ID_CATEGORIA
+    ''', params).fetchall()
+
+    # As combinacoes (estado, cidade, flags) viram uma contagem por faceta
+    facetas = ['estado', 'cidade'] + LIVRO_FLAGS
+    contagens = {'total': {0: 0}}
+    for row in rows:
+        if row['ID_CATEGORIA'] is not None:
+            contagens.setdefault('categoria', {})[row['ID_CATEGORIA']] = row['TOTAL']
+            continue
+        contagens['total'][0] += row['TOTAL']
+        for faceta, coluna in zip(facetas, colunas):
+            valores = contagens.setdefault(faceta, {})
+            valores[row[coluna]] = valores.get(row[coluna], 0) + row['TOTAL']
+    return contagens
+
+## montar a resposta: nomes das facetas com ID, maiores contagens primeiro
+def facetas_response(db, contagens):
+    result = {'total': contagens.get('total', {}).get(0, 0)}
+    for faceta, (chave, tabela, id_coluna, nome_coluna) in LIVRO_FACETAS_NOMEADAS.items():
+        valores = contagens.get(faceta, {})
+        nomes = dict(db.execute(f'''
+            SELECT {id_coluna}, {nome_coluna} FROM {tabela}
+            WHERE {id_coluna} IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(list(valores)),)).fetchall())
+        result[chave] = [{id_coluna: valor, nome_coluna: nomes.get(valor), 'TOTAL': total}
+                         for valor, total in sorted(valores.items(), key=lambda item: (-item[1], item[0]))]
+    for flag in LIVRO_FLAGS:
+        valores = contagens.get(flag, {})
+        result[flag] = {'S': valores.get('S', 0), 'N': valores.get('N', 0)}
+    return result
+
+@app.route('/livros/facetas', methods=['GET'])
+def get_livros_facetas():
+    match = None
+    if 'q' in request.args:
+        match = build_fts_query(request.args['q'])
+        if match is None:
+            return jsonify({'error': 'Parâmetro q inválido'}), 400
+    try:
+        where, params = build_livro_filters(request.args)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Filtros inválidos'}), 400
+
     db = get_db()
-    livros = db.execute('''
-        SELECT l.ID_LIVRO, l.NM_LIVRO, l.PRECO, l.PAGAMENTO_ELETRONICO, 
-               l.PAGAMENTO_DINHEIRO, l.ENTREGA_PRESENCIAL, l.ENTREGA_DELIVERY,
-               l.CEP, l.LOGIN_COMPRADOR, l.LOGIN_VENDEDOR,
-               b.NM_BAIRRO, c.NM_CIDADE, e.NM_ESTADO
-        FROM LIVRO l 
-        JOIN BAIRRO b ON l.CEP = b.CEP
-        JOIN CIDADE c ON b.ID_CIDADE = c.ID_CIDADE
-        JOIN ESTADO e ON c.ID_ESTADO = e.ID_ESTADO
-        ORDER BY l.NM_LIVRO
-    ''').fetchall()
-    return jsonify([row_to_dict(row) for row in livros])
+    if where or match is not None:
+        contagens = facetas_filtradas(db, where, params, match)
+    else:
+        contagens = facetas_catalogo(db)
+    return jsonify(facetas_response(db, contagens))
 
 @app.route('/livros/<int:id_livro>', methods=['GET'])
 def get_livro(id_livro):
     db = get_db()
-    livro = db.execute('''
-        SELECT l.*, b.NM_BAIRRO, c.NM_CIDADE, e.NM_ESTADO
-        FROM LIVRO l 
-        JOIN BAIRRO b ON l.CEP = b.CEP
-        JOIN CIDADE c ON b.ID_CIDADE = c.ID_CIDADE
-        JOIN ESTADO e ON c.ID_ESTADO = e.ID_ESTADO
+    livro = db.execute(f'''
+        SELECT {LIVRO_COLUMNS}, l.HASH_IMG_LIVRO{expand_columns(LIVRO_EXPANSIONS)}
+        FROM LIVRO_LISTAGEM l
         WHERE l.ID_LIVRO = ?
     ''', (id_livro,)).fetchone()
     if livro is None:
         return jsonify({'error': 'Livro não encontrado'}), 404
     
     result = row_to_dict(livro)
-    if result['IMG_LIVRO']:
-        result['IMG_LIVRO'] = base64.b64encode(result['IMG_LIVRO']).decode('utf-8')
-    
-    # Get authors
-    autores = db.execute('''
-        SELECT a.* FROM AUTOR a 
-        JOIN LIVRO_AUTOR la ON a.ID_AUTOR = la.ID_AUTOR 
-        WHERE la.ID_LIVRO = ?
-    ''', (id_livro,)).fetchall()
-    result['autores'] = [row_to_dict(row) for row in autores]
-    
-    # Get categories
-    categorias = db.execute('''
-        SELECT c.ID_CATEGORIA, c.NM_CATEGORIA FROM CATEGORIA c 
-        JOIN LIVRO_CATEGORIA lc ON c.ID_CATEGORIA = lc.ID_CATEGORIA 
-        WHERE lc.ID_LIVRO = ?
-    ''', (id_livro,)).fetchall()
-    result['categorias'] = [row_to_dict(row) for row in categorias]
-    
+    result['IMG_LIVRO_URL'] = image_url('get_livro_imagem', result['HASH_IMG_LIVRO'], id_livro=id_livro)
+    expand_livros([result], LIVRO_EXPANSIONS)
     return jsonify(result)
 
 @app.route('/livros', methods=['POST'])
 def create_livro():
-    data = request.get_json()
-    required_fields = ['nm_livro', 'preco', 'pagamento_eletronico', 'pagamento_dinheiro', 
-                      'entrega_presencial', 'entrega_delivery', 'img_livro', 'cep', 
-                      'login_comprador', 'login_vendedor']
-    
-    for field in required_fields:
+    data = get_request_data()
+    if not data:
+        return jsonify({'error': 'Dados são obrigatórios'}), 400
+    for field in LIVRO_FIELDS:
         if field not in data:
             return jsonify({'error': f'{field} é obrigatório'}), 400
+    if not has_image(data, 'img_livro'):
+        return jsonify({'error': 'img_livro é obrigatório'}), 400
     
-    try:
-        img_data = base64.b64decode(data['img_livro'])
-    except:
-        return jsonify({'error': 'Imagem deve estar em base64'}), 400
+    img, error = get_image_upload(data, 'img_livro')
+    if error:
+        return error
     
-    db = get_db()
-    try:
+    def insert(db):
         cursor = db.execute('''
             INSERT INTO LIVRO (NM_LIVRO, PRECO, PAGAMENTO_ELETRONICO, PAGAMENTO_DINHEIRO, 
                               ENTREGA_PRESENCIAL, ENTREGA_DELIVERY, IMG_LIVRO, CEP, 
                               LOGIN_COMPRADOR, LOGIN_VENDEDOR) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, zeroblob(?), ?, ?, ?)
         ''', (data['nm_livro'], data['preco'], data['pagamento_eletronico'], 
               data['pagamento_dinheiro'], data['entrega_presencial'], data['entrega_delivery'],
-              img_data, data['cep'], data['login_comprador'], data['login_vendedor']))
+              img.size, data['cep'], data['login_comprador'], data['login_vendedor']))
         
         id_livro = cursor.lastrowid
+        img_hash = store_image(db, 'LIVRO', id_livro, img)
         
         # Add authors if provided
         if 'autores' in data:
-            for id_autor in data['autores']:
-                db.execute('INSERT INTO LIVRO_AUTOR (ID_AUTOR, ID_LIVRO) VALUES (?, ?)', 
-                          (id_autor, id_livro))
+            db.executemany('INSERT INTO LIVRO_AUTOR (ID_AUTOR, ID_LIVRO) VALUES (?, ?)',
+                           [(id_autor, id_livro) for id_autor in data['autores']])
         
         # Add categories if provided
         if 'categorias' in data:
-            for id_categoria in data['categorias']:
-                db.execute('INSERT INTO LIVRO_CATEGORIA (ID_CATEGORIA, ID_LIVRO) VALUES (?, ?)', 
-                          (id_categoria, id_livro))
-        
-        db.commit()
+            db.executemany('INSERT INTO LIVRO_CATEGORIA (ID_CATEGORIA, ID_LIVRO) VALUES (?, ?)',
+                           [(id_categoria, id_livro) for id_categoria in data['categorias']])
+        return id_livro, img_hash
+
+    try:
+        id_livro, img_hash = write_coordinator.execute(insert)
+        livro_events.notify()
+        livro_similares.notify()
+        schedule_thumbnails(get_db(), 'LIVRO', id_livro, img_hash)
         return jsonify({'id_livro': id_livro, 'message': 'Livro criado com sucesso'}), 201
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 400
 
 @app.route('/livros/<int:id_livro>', methods=['PUT'])
 def update_livro(id_livro):
-    data = request.get_json()
-    if not data:
+    data = get_request_data()
+    if not data and not request.files:
         return jsonify({'error': 'Dados são obrigatórios'}), 400
     
-    db = get_db()
-    try:
-        # Update main fields
-        update_fields = []
-        params = []
-        
-        for field in ['nm_livro', 'preco', 'pagamento_eletronico', 'pagamento_dinheiro', 
-                     'entrega_presencial', 'entrega_delivery', 'cep', 'login_comprador', 'login_vendedor']:
-            if field in data:
-                update_fields.append(f'{field.upper()} = ?')
-                params.append(data[field])
-        
-        if 'img_livro' in data:
-            try:
-                img_data = base64.b64decode(data['img_livro'])
-                update_fields.append('IMG_LIVRO = ?')
-                params.append(img_data)
-            except:
-                return jsonify({'error': 'Imagem deve estar em base64'}), 400
-        
+    # Update main fields
+    update_fields = []
+    params = []
+    
+    for field in LIVRO_FIELDS:
+        if field in data:
+            update_fields.append(f'{field.upper()} = ?')
+            params.append(data[field])
+    
+    img = None
+    if has_image(data, 'img_livro'):
+        img, error = get_image_upload(data, 'img_livro')
+        if error:
+            return error
+        update_fields.append('IMG_LIVRO = zeroblob(?)')
+        params.append(img.size)
+    
+    def update(db):
+        img_hash = None
         if update_fields:
-            params.append(id_livro)
-            db.execute(f'UPDATE LIVRO SET {", ".join(update_fields)} WHERE ID_LIVRO = ?', params)
+            cursor = db.execute(f'UPDATE LIVRO SET {", ".join(update_fields)} WHERE ID_LIVRO = ?',
+                                params + [id_livro])
+            if img is not None:
+                if cursor.rowcount == 0:
+                    return False, None
+                img_hash = store_image(db, 'LIVRO', id_livro, img)
         
         # Update authors if provided
         if 'autores' in data:
             db.execute('DELETE FROM LIVRO_AUTOR WHERE ID_LIVRO = ?', (id_livro,))
-            for id_autor in data['autores']:
-                db.execute('INSERT INTO LIVRO_AUTOR (ID_AUTOR, ID_LIVRO) VALUES (?, ?)', 
-                          (id_autor, id_livro))
+            db.executemany('INSERT INTO LIVRO_AUTOR (ID_AUTOR, ID_LIVRO) VALUES (?, ?)',
+                           [(id_autor, id_livro) for id_autor in data['autores']])
         
         # Update categories if provided
         if 'categorias' in data:
             db.execute('DELETE FROM LIVRO_CATEGORIA WHERE ID_LIVRO = ?', (id_livro,))
-            for id_categoria in data['categorias']:
-                db.execute('INSERT INTO LIVRO_CATEGORIA (ID_CATEGORIA, ID_LIVRO) VALUES (?, ?)', 
-                          (id_categoria, id_livro))
-        
-        db.commit()
+            db.executemany('INSERT INTO LIVRO_CATEGORIA (ID_CATEGORIA, ID_LIVRO) VALUES (?, ?)',
+                           [(id_categoria, id_livro) for id_categoria in data['categorias']])
+        return True, img_hash
+
+    try:
+        found, img_hash = write_coordinator.execute(update)
+        if not found:
+            return jsonify({'error': 'Livro não encontrado'}), 404
+        livro_events.notify()
+        livro_similares.notify()
+        if img_hash:
+            schedule_thumbnails(get_db(), 'LIVRO', id_livro, img_hash)
         return jsonify({'message': 'Livro atualizado com sucesso'})
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 400
 
 @app.route('/livros/<int:id_livro>', methods=['DELETE'])
 def delete_livro(id_livro):
-    db = get_db()
-    try:
+    def delete(db):
         # Delete relationships first
         db.execute('DELETE FROM LIVRO_AUTOR WHERE ID_LIVRO = ?', (id_livro,))
         db.execute('DELETE FROM LIVRO_CATEGORIA WHERE ID_LIVRO = ?', (id_livro,))
         
         # Delete main record
-        db.execute('DELETE FROM LIVRO WHERE ID_LIVRO = ?', (id_livro,))
-        db.commit()
-        
-        if db.total_changes == 0:
+        return db.execute('DELETE FROM LIVRO WHERE ID_LIVRO = ?', (id_livro,))
+
+    try:
+        cursor = write_coordinator.execute(delete)
+        if cursor.rowcount == 0:
             return jsonify({'error': 'Livro não encontrado'}), 404
+        livro_events.notify()
+        livro_similares.notify()
         return jsonify({'message': 'Livro deletado com sucesso'})
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 400
 
-# ==================== ROTAS DE TESTE ====================
+## livros de LIVRO_LISTAGEM diferentes da origem (LIVRO_LISTAGEM_ORIGEM) em uma faixa de ids
+def listagem_drift(db, first, last):
+    return [row[0] for row in db.execute('''
+        SELECT ID_LIVRO FROM (
+            SELECT * FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_LIVRO BETWEEN :first AND :last
+            EXCEPT SELECT * FROM LIVRO_LISTAGEM WHERE ID_LIVRO BETWEEN :first AND :last)
+        UNION
+        SELECT ID_LIVRO FROM (
+            SELECT * FROM LIVRO_LISTAGEM WHERE ID_LIVRO BETWEEN :first AND :last
+            EXCEPT SELECT * FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_LIVRO BETWEEN :first AND :last)
+    ''', {'first': first, 'last': last})]
 
-@app.route('/dados', methods=['GET'])
-def index():
-    return jsonify({
-        'message': 'API da Biblioteca funcionando!',
-        'endpoints': {
-            'estados': '/estados',
-            'cidades': '/cidades', 
+@app.cli.command('rebuild-listagem')
+@click.option('--verificar', is_flag=True, help='Só conta as diferenças, sem corrigir')
+@click.option('--lote', type=int, default=5000, show_default=True, help='Livros por transação')
+def rebuild_listagem_command(verificar, lote):
+    """Compara LIVRO_LISTAGEM com as tabelas de origem e corrige as linhas divergentes"""
+    db = connect_db()
+    corrigidos = 0
+    ultimo = 0
+    while True:
+        # Transacoes curtas: o servidor continua escrevendo entre um lote e outro
+        db.execute('BEGIN IMMEDIATE')
+        ids = db.execute('SELECT ID_LIVRO FROM LIVRO WHERE ID_LIVRO > ? ORDER BY ID_LIVRO LIMIT ?',
+                         (ultimo, lote)).fetchall()
+        if not ids:
+            # Linhas de livros que nao existem mais
+            orfaos = db.execute('''SELECT ID_LIVRO FROM LIVRO_LISTAGEM
+                                   WHERE ID_LIVRO NOT IN (SELECT ID_LIVRO FROM LIVRO)''').fetchall()
+            if not verificar:
+                db.executemany('DELETE FROM LIVRO_LISTAGEM WHERE ID_LIVRO = ?', orfaos)
+            db.commit()
+            corrigidos += len(orfaos)
+            break
+        first, last = ids[0][0], ids[-1][0]
+        drift = listagem_drift(db, first, last)
+        if drift and not verificar:
+            placeholders = ', '.join('?' * len(drift))
+            db.execute(f'DELETE FROM LIVRO_LISTAGEM WHERE ID_LIVRO IN ({placeholders})', drift)
+            db.execute(f'''INSERT INTO LIVRO_LISTAGEM
+                           SELECT * FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_LIVRO IN ({placeholders})''', drift)
+        db.commit()
+        corrigidos += len(drift)
+        ultimo = last
+    db.close()
+    click.echo(f'{corrigidos} livros divergentes' + ('' if verificar else ' corrigidos'))
+
+@app.cli.command('compact-changes')
+@click.option('--dias', type=int, default=None,
+              help='Remoções mais antigas que isso saem do log (padrão: LIVROS_CHANGES_RETENTION_DAYS)')
+def compact_changes_command(dias):
+    """Apaga do log de alterações as remoções antigas de livros"""
+    if dias is None:
+        dias = app.config['LIVROS_CHANGES_RETENTION_DAYS']
+    corte = int(time.time()) - dias * 86400
+    db = connect_db()
+    db.execute('BEGIN IMMEDIATE')
+    # So as remocoes saem: cada livro existente tem uma unica entrada (a ultima alteracao)
+    seq = db.execute("SELECT MAX(SEQ) FROM LIVRO_ALTERACAO WHERE REMOVIDO = 'S' AND ALTERADO_EM < ?",
+                     (corte,)).fetchone()[0]
+    removidas = 0
+    if seq is not None:
+        removidas = db.execute("DELETE FROM LIVRO_ALTERACAO WHERE REMOVIDO = 'S' AND SEQ <= ?",
+                               (seq,)).rowcount
+        # Clientes com since abaixo disso podem ter perdido uma remocao
+        db.execute('UPDATE LIVRO_ALTERACAO_LIMITE SET SEQ = MAX(SEQ, ?)', (seq,))
+    db.commit()
+    db.close()
+    click.echo(f'{removidas} remoções apagadas do log de alterações')
+
+
+# ==================== LIVROS EM LOTE ====================
+
+## verificar se o valor e um ID inteiro (bool tambem e int em Python)
+def is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+## validar tipos de um item do lote; retorna mensagem de erro ou None
+def validate_livro_item(item, partial=False):
+    if not isinstance(item, dict):
+        return 'Item deve ser um objeto'
+    if partial:
+        if not is_id(item.get('id_livro')):
+            return 'id_livro é obrigatório'
+    else:
+        for field in LIVRO_FIELDS + ['img_livro']:
+            if field not in item:
+                return f'{field} é obrigatório'
+
+    if 'nm_livro' in item and not (isinstance(item['nm_livro'], str) and item['nm_livro'].strip()):
+        return 'nm_livro inválido'
+    if 'preco' in item and not (isinstance(item['preco'], (int, float))
+                                and not isinstance(item['preco'], bool) and item['preco'] >= 0):
+        return 'preco inválido'
+    for flag in LIVRO_FLAGS:
+        if flag in item and item[flag] not in ('S', 'N'):
+            return f'{flag} deve ser S ou N'
+    if 'cep' in item and not is_id(item['cep']):
+        return 'cep inválido'
+    for field in ('login_comprador', 'login_vendedor'):
+        if field in item and not isinstance(item[field], str):
+            return f'{field} inválido'
+    for field in ('autores', 'categorias'):
+        if field in item:
+            if not (isinstance(item[field], list) and all(is_id(value) for value in item[field])):
+                return f'{field} deve ser uma lista de IDs'
+            item[field] = list(dict.fromkeys(item[field]))
+    return None
+
+## consultar de uma vez quais chaves existem (um IN por tabela, nao um SELECT por item)
+def existing_keys(db, table, column, values):
+    values = list(values)
+    if not values:
+        return set()
+    placeholders = ', '.join('?' * len(values))
+    return {row[0] for row in db.execute(f'SELECT {column} FROM {table} WHERE {column} IN ({placeholders})', values)}
+
+## validar formato e imagem de todos os itens antes de entrar na fila; retorna (erros por indice, imagens por indice)
+def prepare_livros_lote(itens, partial=False):
+    errors = {}
+    images = {}
+    for i, item in enumerate(itens):
+        error = validate_livro_item(item, partial)
+        if error is None and 'img_livro' in item:
+            try:
+                img_data = base64.b64decode(item['img_livro'])
+            except:
+                error = 'Imagem deve estar em base64'
+            else:
+                invalid = image_error(img_data[:IMAGE_HEADER_SIZE], len(img_data))
+                if invalid:
+                    error = invalid[0]
+                else:
+                    images[i] = (img_data, image_hash(img_data))
+        if error:
+            errors[i] = error
+    return errors, images
+
+## conferir as chaves estrangeiras (e, no PUT, os livros) dos itens validos; roda no escritor, dentro
+## da transacao que grava o lote, para que nada seja removido entre a conferencia e a gravacao
+def check_livro_refs(db, itens, indices, partial=False):
+    errors = {}
+    pending = [(i, itens[i]) for i in indices]
+    if partial:
+        livros = existing_keys(db, 'LIVRO', 'ID_LIVRO', {item['id_livro'] for _, item in pending})
+    ceps = existing_keys(db, 'BAIRRO', 'CEP', {item['cep'] for _, item in pending if 'cep' in item})
+    logins = existing_keys(db, 'USUARIO', 'LOGIN', {item[field] for _, item in pending
+                                                    for field in ('login_comprador', 'login_vendedor')
+                                                    if field in item})
+    autores = existing_keys(db, 'AUTOR', 'ID_AUTOR', {value for _, item in pending
+                                                      for value in item.get('autores', [])})
+    categorias = existing_keys(db, 'CATEGORIA', 'ID_CATEGORIA', {value for _, item in pending
+                                                                 for value in item.get('categorias', [])})
+    for i, item in pending:
+        if partial and item['id_livro'] not in livros:
+            errors[i] = 'Livro não encontrado'
+        elif 'cep' in item and item['cep'] not in ceps:
+            errors[i] = f'CEP {item["cep"]} não encontrado'
+        elif any(field in item and item[field] not in logins for field in ('login_comprador', 'login_vendedor')):
+            errors[i] = 'Usuário não encontrado'
+        elif any(value not in autores for value in item.get('autores', [])):
+            errors[i] = 'Autor não encontrado'
+        elif any(value not in categorias for value in item.get('categorias', [])):
+            errors[i] = 'Categoria não encontrada'
+    return errors
+
+## ler e conferir a lista enviada para /livros/lote
+def get_lote():
+    itens = request.get_json()
+    if not isinstance(itens, list) or not itens:
+        return None, (jsonify({'error': 'Lista de livros é obrigatória'}), 400)
+    if len(itens) > app.config['LIVROS_BULK_MAX_ITEMS']:
+        return None, (jsonify({'error': f'Máximo de {app.config["LIVROS_BULK_MAX_ITEMS"]} livros por lote'}), 400)
+    return itens, None
+
+## resposta com o resultado de cada item, na ordem recebida
+def lote_response(total, ids, errors, success_status):
+    results = []
+    for i in range(total):
+        if i in errors:
+            results.append({'index': i, 'error': errors[i]})
+        else:
+            results.append({'index': i, 'id_livro': ids[i]})
+    status = success_status if not errors else (207 if ids else 400)
+    return jsonify({
+        'results': results,
+        'message': f'{len(ids)} livros processados, {len(errors)} com erro'
+    }), status
+
+## gravar o lote de junções (autores ou categorias) com um executemany
+def insert_livro_relations(db, table, column, pairs):
+    db.executemany(f'INSERT INTO {table} ({column}, ID_LIVRO) VALUES (?, ?)', pairs)
+
+@app.route('/livros/lote', methods=['POST'])
+def create_livros_lote():
+    itens, error = get_lote()
+    if error:
+        return error
+
+    errors, images = prepare_livros_lote(itens)
+    validos = [i for i in range(len(itens)) if i not in errors]
+    ids = {}
+
+    def insert(db):
+        recusados = check_livro_refs(db, itens, validos)
+        gravados = [i for i in validos if i not in recusados]
+        # O lote do escritor ja tem a trava de escrita: os proximos IDs do AUTOINCREMENT sao conhecidos
+        base = db.execute('''
+            SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'LIVRO'), 0),
+                       COALESCE((SELECT MAX(ID_LIVRO) FROM LIVRO), 0))
+        ''').fetchone()[0]
+        ids = {i: base + n + 1 for n, i in enumerate(gravados)}
+
+        db.executemany('''
+            INSERT INTO LIVRO (ID_LIVRO, NM_LIVRO, PRECO, PAGAMENTO_ELETRONICO, PAGAMENTO_DINHEIRO,
+                               ENTREGA_PRESENCIAL, ENTREGA_DELIVERY, IMG_LIVRO, HASH_IMG_LIVRO, CEP,
+                               LOGIN_COMPRADOR, LOGIN_VENDEDOR)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(ids[i], itens[i]['nm_livro'], itens[i]['preco'], itens[i]['pagamento_eletronico'],
+               itens[i]['pagamento_dinheiro'], itens[i]['entrega_presencial'], itens[i]['entrega_delivery'],
+               images[i][0], images[i][1], itens[i]['cep'], itens[i]['login_comprador'],
+               itens[i]['login_vendedor']) for i in gravados])
+        insert_livro_relations(db, 'LIVRO_AUTOR', 'ID_AUTOR',
+                               [(value, ids[i]) for i in gravados for value in itens[i].get('autores', [])])
+        insert_livro_relations(db, 'LIVRO_CATEGORIA', 'ID_CATEGORIA',
+                               [(value, ids[i]) for i in gravados for value in itens[i].get('categorias', [])])
+        return ids, recusados
+
+    if validos:
+        try:
+            ids, recusados = write_coordinator.execute(insert)
+            errors.update(recusados)
+        except sqlite3.Error as e:
+            # Falha inesperada: nada foi gravado e o erro vale para cada item do lote
+            errors.update((i, str(e)) for i in validos)
+    if ids:
+        livro_events.notify()
+        livro_similares.notify()
+
+        db = get_db()
+        for i in ids:
+            schedule_thumbnails(db, 'LIVRO', ids[i], images[i][1])
+    return lote_response(len(itens), ids, errors, 201)
+
+@app.route('/livros/lote', methods=['PUT'])
+def update_livros_lote():
+    itens, error = get_lote()
+    if error:
+        return error
+
+    errors, images = prepare_livros_lote(itens, partial=True)
+    validos = [i for i in range(len(itens)) if i not in errors]
+    ids = {}
+
+    # Itens que alteram o mesmo conjunto de campos compartilham um UPDATE (um executemany por grupo)
+    grupos = {}
+    for i in validos:
+        fields = [field for field in LIVRO_FIELDS if field in itens[i]]
+        columns = [f'{field.upper()} = ?' for field in fields]
+        params = [itens[i][field] for field in fields]
+        if i in images:
+            columns += ['IMG_LIVRO = ?', 'HASH_IMG_LIVRO = ?']
+            params += list(images[i])
+        if columns:
+            grupos.setdefault(', '.join(columns), []).append((i, params + [itens[i]['id_livro']]))
+
+    def update(db):
+        recusados = check_livro_refs(db, itens, validos, partial=True)
+        gravados = [i for i in validos if i not in recusados]
+        for set_clause, rows in grupos.items():
+            db.executemany(f'UPDATE LIVRO SET {set_clause} WHERE ID_LIVRO = ?',
+                           [params for i, params in rows if i not in recusados])
+        for field, table, column in (('autores', 'LIVRO_AUTOR', 'ID_AUTOR'),
+                                     ('categorias', 'LIVRO_CATEGORIA', 'ID_CATEGORIA')):
+            alterados = [itens[i] for i in gravados if field in itens[i]]
+            db.executemany(f'DELETE FROM {table} WHERE ID_LIVRO = ?', [(item['id_livro'],) for item in alterados])
+            insert_livro_relations(db, table, column,
+                                   [(value, item['id_livro']) for item in alterados for value in item[field]])
+        return {i: itens[i]['id_livro'] for i in gravados}, recusados
+
+    if validos:
+        try:
+            ids, recusados = write_coordinator.execute(update)
+            errors.update(recusados)
+        except sqlite3.Error as e:
+            # Falha inesperada: nada foi gravado e o erro vale para cada item do lote
+            errors.update((i, str(e)) for i in validos)
+    if ids:
+        livro_events.notify()
+        livro_similares.notify()
+
+        db = get_db()
+        for i in ids:
+            if i in images:
+                schedule_thumbnails(db, 'LIVRO', ids[i], images[i][1])
+    return lote_response(len(itens), ids, errors, 200)
+
+# ==================== EVENTOS DE LIVROS (SSE) ====================
+
+# Evento ja formatado em SSE (uma vez para todos os assinantes) e as chaves usadas nos filtros;
+# remocoes nao tem mais os dados do livro e ficam com keys None
+LivroEvent = namedtuple('LivroEvent', ['seq', 'frame', 'keys', 'categorias'])
+
+LIVRO_EVENT_FILTERS = ['cep', 'cidade', 'estado', 'categoria']
+
+class EventSubscriber:
+    """Conexao de /eventos/livros: filtros e fila limitada de eventos pendentes"""
+
+    def __init__(self, filters):
+        self.filters = filters
+        self.queue = queue.Queue(app.config['SSE_QUEUE_SIZE'])
+        self.dropped = False
+
+    def matches(self, event):
+        # Remocoes vao para todos (o cliente ignora IDs que nao conhece)
+        if event.keys is None:
+            return True
+        for key, value in self.filters.items():
+            if key == 'categoria':
+                if value not in event.categorias:
+                    return False
+            elif event.keys[key] != value:
+                return False
+        return True
+
+class EventBroadcaster:
+    """Distribui as alteracoes de livros aos assinantes do processo. Uma unica thread le
+    LIVRO_ALTERACAO (acordada logo apos as escritas deste processo e, para as escritas dos
+    outros, a cada SSE_POLL_INTERVAL) e coloca cada evento na fila dos assinantes"""
+
+    def __init__(self):
+        self.reset()
+
+    ## descartar assinantes e historico herdados (ex.: processo filho depois de um fork)
+    def reset(self):
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscribers = set()
+        self._history = deque()  # eventos recentes, para retomar com Last-Event-ID
+        self._floor = None  # todos os eventos com seq acima disso estao no historico
+        self._seq = None  # ultimo seq lido de LIVRO_ALTERACAO
+        self._max_id = None  # maior ID_LIVRO ja visto: IDs acima dele sao livros novos
+        self._thread = None
+        self.dropped = 0
+
+    ## registrar um assinante; devolve (assinante, eventos a reenviar desde last_event_id),
+    ## com eventos None se o historico nao cobre last_event_id, ou (None, None) se lotado
+    def subscribe(self, filters, last_event_id=None):
+        if self.pid != os.getpid():
+            self.reset()
+        subscriber = EventSubscriber(filters)
+        with self._lock:
+            if len(self._subscribers) >= app.config['SSE_MAX_SUBSCRIBERS']:
+                return None, None
+            if self._thread is None:
+                self._start()
+            if last_event_id is None:
+                replay = []
+            elif last_event_id < self._floor:
+                replay = None
+            else:
+                replay = [event for event in self._history
+                          if event.seq > last_event_id and subscriber.matches(event)]
+            self._subscribers.add(subscriber)
+        return subscriber, replay
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    ## escrita de livro confirmada neste processo: le as alteracoes sem esperar o intervalo
+    def notify(self):
+        if self._thread is not None and self.pid == os.getpid():
+            self._wake.set()
+
+    ## processo encerrando: termina as conexoes abertas, que de outro modo segurariam o
+    ## desligamento ate o graceful_timeout (os clientes reconectam em outro worker)
+    def close(self):
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, set()
+        for subscriber in subscribers:
+            subscriber.dropped = True
+            try:
+                # Acorda o gerador parado em queue.get
+                subscriber.queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def stats(self):
+        return {'subscribers': len(self._subscribers), 'dropped': self.dropped, 'seq': self._seq}
+
+    ## ponto de partida (alteracoes anteriores ao primeiro assinante nao viram eventos) e thread leitora
+    def _start(self):
+        db = read_pool.acquire()
+        try:
+            row = db.execute('''SELECT (SELECT MAX(SEQ) FROM LIVRO_ALTERACAO),
+                                       (SELECT seq FROM sqlite_sequence WHERE name = 'LIVRO')''').fetchone()
+        finally:
+            read_pool.release(db)
+        self._seq = self._floor = row[0] or 0
+        self._max_id = row[1] or 0
+        self._thread = threading.Thread(target=self._run, name='eventos-livros', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(app.config['SSE_POLL_INTERVAL'])
+            self._wake.clear()
+            try:
+                self._poll()
+            except sqlite3.Error:
+                app.logger.exception('Falha ao ler LIVRO_ALTERACAO para /eventos/livros')
+
+    ## uma consulta por processo para todos os assinantes
+    def _poll(self):
+        db = read_pool.acquire()
+        try:
+            while True:
+                rows = db.execute(f'''
+                    SELECT a.SEQ, a.ID_LIVRO AS ID_ALTERADO, a.REMOVIDO, {LIVRO_COLUMNS},
+                           l.ID_CIDADE, l.ID_ESTADO, l.AUTORES, l.CATEGORIAS
+                    FROM LIVRO_ALTERACAO a
+                    LEFT JOIN LIVRO_LISTAGEM l ON l.ID_LIVRO = a.ID_LIVRO
+                    WHERE a.SEQ > ?
+                    ORDER BY a.SEQ
+                    LIMIT 500
+                ''', (self._seq,)).fetchall()
+                if rows:
+                    self._publish([self._event(row) for row in rows])
+                if len(rows) < 500:
+                    return
+        finally:
+            read_pool.release(db)
+
+    def _event(self, row):
+        id_livro = row['ID_ALTERADO']
+        if row['REMOVIDO'] == 'S':
+            kind, data, keys, categorias = 'delete', {'ID_LIVRO': id_livro}, None, ()
+        else:
+            # Criacao e alteracoes entre duas leituras chegam juntas, como criacao com o estado atual
+            kind = 'create' if id_livro > self._max_id else 'update'
+            self._max_id = max(self._max_id, id_livro)
+            data = row_to_dict(row)
+            keys = {'cep': data['CEP'], 'cidade': data.pop('ID_CIDADE'), 'estado': data.pop('ID_ESTADO')}
+            for column in ('SEQ', 'ID_ALTERADO', 'REMOVIDO'):
+                del data[column]
+            expand_livros([data], LIVRO_EXPANSIONS)
+            categorias = {categoria['ID_CATEGORIA'] for categoria in data['categorias']}
+        frame = f'id: {row["SEQ"]}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+        return LivroEvent(row['SEQ'], frame.encode('utf-8'), keys, categorias)
+
+    def _publish(self, events):
+        with self._lock:
+            self._seq = events[-1].seq
+            self._history.extend(events)
+            while len(self._history) > app.config['SSE_HISTORY_SIZE']:
+                self._floor = self._history.popleft().seq
+            for subscriber in list(self._subscribers):
+                try:
+                    for event in events:
+                        if subscriber.matches(event):
+                            subscriber.queue.put_nowait(event)
+                except queue.Full:
+                    # Consumidor lento: a conexao e encerrada e o cliente retoma com Last-Event-ID
+                    subscriber.dropped = True
+                    self._subscribers.discard(subscriber)
+                    self.dropped += 1
+
+livro_events = EventBroadcaster()
+
+@app.route('/eventos/livros', methods=['GET'])
+def get_livro_events():
+    try:
+        filters = {key: int(request.args[key]) for key in LIVRO_EVENT_FILTERS if key in request.args}
+        # EventSource reenvia o ultimo id recebido ao reconectar
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Filtros ou Last-Event-ID inválidos'}), 400
+
+    subscriber, replay = livro_events.subscribe(filters, last_event_id)
+    if subscriber is None:
+        response = jsonify({'error': 'Limite de conexões de eventos atingido'})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+
+    def generate():
+        # Primeiro bloco logo na conexao: o servidor so envia os cabecalhos junto com ele
+        yield b': conectado\n\n'
+        ultimo = 0
+        if replay is None:
+            # Historico do processo nao alcanca Last-Event-ID: o cliente completa por /livros/changes
+            yield f'event: reset\ndata: {json.dumps({"since": last_event_id})}\n\n'.encode('utf-8')
+        else:
+            ultimo = last_event_id or 0
+            for event in replay:
+                yield event.frame
+                ultimo = event.seq
+        while not subscriber.dropped:
+            try:
+                event = subscriber.queue.get(timeout=app.config['SSE_HEARTBEAT_INTERVAL'])
+            except queue.Empty:
+                # Comentario SSE: mantem proxies abertos e detecta clientes que ja foram embora
+                yield b': ping\n\n'
+                continue
+            # Eventos ja reenviados do historico tambem chegam pela fila
+            if event is not None and event.seq > ultimo:
+                yield event.frame
+                ultimo = event.seq
+
+    # close() sempre e chamado pelo servidor, mesmo se o gerador nunca comecar
+    response = Response(ClosingIterator(generate(), lambda: livro_events.unsubscribe(subscriber)),
+                        content_type='text/event-stream; charset=utf-8')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ==================== ANALISE DE PRECOS ====================
+
+# Percentis de /analytics/precos (interpolacao linear, como numpy.percentile)
+PRECO_PERCENTIS = {'p10': 0.10, 'mediana': 0.50, 'p90': 0.90}
+
+# Dimensoes aceitas como filtro e em ?agrupar=
+PRECO_DIMENSOES = ['categoria', 'estado', 'cidade']
+
+# Foto do mercado em arrays NumPy, uma posicao por livro em ordem de preco (precos, estados, cidades):
+# qualquer subconjunto dessas posicoes, na mesma ordem, ja esta ordenado por preco. Ordenacoes
+# (grupo, preco) calculadas na carga evitam ordenar a cada requisicao:
+# - ordens['estado'] / ordens['cidade']: posicoes dos livros por estado/cidade e preco
+# - pares_livro / pares_categoria: um par por livro e categoria, por categoria e preco
+PriceSnapshot = namedtuple('PriceSnapshot', [
+    'seq', 'precos', 'estados', 'cidades', 'ordens', 'pares_livro', 'pares_categoria', 'atualizado_em',
+])
+
+## ordenar posicoes (ja em ordem de preco) por grupo, sem perder a ordem de preco dentro do grupo:
+## uma unica ordenacao de inteiros com o grupo nos 32 bits altos
+def ordenar_por_grupo(grupos, posicoes):
+    chaves = np.sort((grupos.astype(np.int64) << 32) | posicoes)
+    return (chaves >> 32).astype(np.int32), (chaves & 0xFFFFFFFF).astype(np.int32)
+
+## ler a foto em uma unica transacao de leitura; None se LIVRO_ALTERACAO nao andou desde seq_anterior
+def carregar_precos(db, seq_anterior=None):
+    db.execute('BEGIN')
+    try:
+        seq = db.execute('SELECT COALESCE(MAX(SEQ), 0) FROM LIVRO_ALTERACAO').fetchone()[0]
+        if seq == seq_anterior:
+            return None
+        cursor = db.execute('SELECT ID_LIVRO, PRECO, ID_ESTADO, ID_CIDADE FROM LIVRO_LISTAGEM')
+        cursor.row_factory = None
+        livros = np.fromiter(cursor, dtype=[('id', np.int64), ('preco', np.float64),
+                                            ('estado', np.int32), ('cidade', np.int32)])
+        cursor = db.execute('SELECT ID_LIVRO, ID_CATEGORIA FROM LIVRO_CATEGORIA')
+        cursor.row_factory = None
+        pares = np.fromiter(cursor, dtype=[('id', np.int64), ('categoria', np.int32)])
+    finally:
+        db.rollback()
+
+    livros = livros[np.argsort(livros['preco'], kind='stable')]
+    todos = np.arange(len(livros), dtype=np.int32)
+    ordens = {dimensao: ordenar_por_grupo(livros[dimensao], todos)[1] for dimensao in ('estado', 'cidade')}
+
+    # Par -> posicao do livro (busca binaria nos IDs ordenados)
+    por_id = np.argsort(livros['id']).astype(np.int32)
+    ids = livros['id'][por_id]
+    indice = np.searchsorted(ids, pares['id'])
+    achados = indice < len(ids)
+    achados[achados] = ids[indice[achados]] == pares['id'][achados]
+    pares_categoria, pares_livro = ordenar_por_grupo(pares['categoria'][achados], por_id[indice[achados]])
+    return PriceSnapshot(seq, livros['preco'].copy(), livros['estado'].copy(), livros['cidade'].copy(),
+                         ordens, pares_livro, pares_categoria, time.time())
+
+## percentil q de varios grupos de uma vez: o grupo i esta ordenado em
+## precos[inicios[i]:inicios[i] + totais[i]]
+def percentis_agrupados(precos, inicios, totais, q):
+    posicao = inicios + (totais - 1) * q
+    abaixo = np.floor(posicao).astype(np.int64)
+    acima = np.minimum(abaixo + 1, inicios + totais - 1)
+    return precos[abaixo] + (precos[acima] - precos[abaixo]) * (posicao - abaixo)
+
+## total, min, max e percentis de cada grupo (precos ordenados dentro de cada grupo)
+def resumo_grupos(precos, inicios, totais):
+    fins = inicios + totais - 1
+    resumo = {'total': totais, 'min': precos[inicios], 'max': precos[fins]}
+    for nome, q in PRECO_PERCENTIS.items():
+        resumo[nome] = percentis_agrupados(precos, inicios, totais, q)
+    return resumo
+
+## manter das posicoes (None = todos os livros) as que atendem aos filtros de estado/cidade,
+## na mesma ordem; grupos acompanha as posicoes
+def filtrar_localidade(foto, filtros, posicoes, grupos=None):
+    selecao = None
+    for dimensao, coluna in (('estado', foto.estados), ('cidade', foto.cidades)):
+        if dimensao in filtros:
+            mascara = (coluna if posicoes is None else coluna[posicoes]) == filtros[dimensao]
+            selecao = mascara if selecao is None else selecao & mascara
+    if selecao is None:
+        return posicoes, grupos
+    if posicoes is None:
+        return np.flatnonzero(selecao), grupos
+    return posicoes[selecao], grupos[selecao] if grupos is not None else None
+
+## pares (posicao do livro, categoria) de uma categoria ou de todas, por categoria e preco
+def pares_da_categoria(foto, categoria=None):
+    if categoria is None:
+        return foto.pares_livro, foto.pares_categoria
+    inicio, fim = np.searchsorted(foto.pares_categoria, [categoria, categoria + 1])
+    return foto.pares_livro[inicio:fim], foto.pares_categoria[inicio:fim]
+
+## precos ordenados dos livros que atendem aos filtros (cada livro uma vez)
+def precos_filtrados(foto, filtros):
+    posicoes = pares_da_categoria(foto, filtros['categoria'])[0] if 'categoria' in filtros else None
+    posicoes, _ = filtrar_localidade(foto, filtros, posicoes)
+    return foto.precos if posicoes is None else foto.precos[posicoes]
+
+## precos dos livros que atendem aos filtros, ordenados por grupo e preco, e o grupo de cada um;
+## por categoria, um livro conta em cada uma das suas
+def precos_agrupados(foto, filtros, agrupar):
+    if agrupar == 'categoria':
+        posicoes, grupos = pares_da_categoria(foto, filtros.get('categoria'))
+    elif 'categoria' in filtros:
+        # Unico caso sem ordem pronta: so os livros da categoria sao ordenados
+        posicoes = pares_da_categoria(foto, filtros['categoria'])[0]
+        coluna = foto.estados if agrupar == 'estado' else foto.cidades
+        grupos, posicoes = ordenar_por_grupo(coluna[posicoes], posicoes)
+    else:
+        posicoes = foto.ordens[agrupar]
+        grupos = (foto.estados if agrupar == 'estado' else foto.cidades)[posicoes]
+    posicoes, grupos = filtrar_localidade(foto, filtros, posicoes, grupos)
+    return foto.precos[posicoes], grupos
+
+## resumo de cada grupo (precos ordenados por grupo e preco), maiores grupos primeiro
+def resumo_por_grupo(precos, grupos, coluna):
+    if len(grupos) == 0:
+        return []
+    inicios = np.flatnonzero(np.r_[True, grupos[1:] != grupos[:-1]])
+    totais = np.diff(np.append(inicios, len(grupos)))
+    ordem = np.argsort(-totais, kind='stable')
+    colunas = {coluna: grupos[inicios][ordem]}
+    colunas.update((nome, valores[ordem]) for nome, valores in resumo_grupos(precos, inicios, totais).items())
+    return [dict(zip(colunas, linha)) for linha in zip(*(precos_json(valores) for valores in colunas.values()))]
+
+## resumo de precos ja ordenados: total, min, max, percentis e histograma em faixas de mesma largura
+def resumo_precos(precos, faixas):
+    total = len(precos)
+    if total == 0:
+        return {'total': 0}
+    resumo = {nome: valores[0] for nome, valores in resumo_grupos(
+        precos, np.array([0]), np.array([total])).items()}
+    limites = np.histogram_bin_edges(precos, faixas)
+    # Ordenados, as contagens saem de busca binaria (ultima faixa fechada nos dois lados)
+    posicoes = np.searchsorted(precos, limites, side='left')
+    posicoes[-1] = total
+    resumo['histograma'] = {'limites': limites, 'contagens': np.diff(posicoes)}
+    return resumo
+
+## converter arrays/escalares NumPy da resposta em JSON (precos com 2 casas)
+def precos_json(valor):
+    if isinstance(valor, dict):
+        return {chave: precos_json(item) for chave, item in valor.items()}
+    if isinstance(valor, np.ndarray):
+        if valor.dtype.kind == 'f':
+            return np.round(valor, 2).tolist()
+        return valor.tolist()
+    if isinstance(valor, (float, np.floating)):
+        return round(float(valor), 2)
+    if isinstance(valor, np.integer):
+        return int(valor)
+    return valor
+
+class PriceAnalytics:
+    """Foto do mercado de /analytics/precos, por processo. A primeira requisicao carrega a foto;
+    depois, uma thread a refaz a cada ANALYTICS_PRECOS_INTERVAL segundos (so se LIVRO_ALTERACAO
+    andou) e troca a referencia de uma vez: cada requisicao usa a foto que pegou no inicio"""
+
+    def __init__(self):
+        self.reset()
+
+    ## descartar a foto herdada (ex.: processo filho depois de um fork)
+    def reset(self):
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._thread = None
+        self.refreshes = 0
+        self.load_seconds = None
+
+    def snapshot(self):
+        if self.pid != os.getpid():
+            self.reset()
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Requisicoes simultaneas sem foto esperam uma unica carga
+            with self._lock:
+                if self._snapshot is None:
+                    self._refresh()
+                    self._thread = threading.Thread(target=self._run, name='analise-precos', daemon=True)
+                    self._thread.start()
+                snapshot = self._snapshot
+        return snapshot
+
+    def stats(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'loaded': False}
+        return {'loaded': True, 'seq': snapshot.seq, 'livros': len(snapshot.precos),
+                'age': round(time.time() - snapshot.atualizado_em, 1),
+                'refreshes': self.refreshes, 'load_seconds': self.load_seconds}
+
+    def _run(self):
+        while True:
+            time.sleep(app.config['ANALYTICS_PRECOS_INTERVAL'])
+            try:
+                self._refresh()
+            except sqlite3.Error:
+                app.logger.exception('Falha ao atualizar a foto de /analytics/precos')
+
+    def _refresh(self):
+        atual = self._snapshot
+        start = time.perf_counter()
+        db = read_pool.acquire()
+        try:
+            snapshot = carregar_precos(db, atual.seq if atual is not None else None)
+        finally:
+            read_pool.release(db)
+        if snapshot is not None:
+            self._snapshot = snapshot
+            self.refreshes += 1
+            self.load_seconds = round(time.perf_counter() - start, 3)
+
+price_analytics = PriceAnalytics()
+
+@app.route('/analytics/precos', methods=['GET'])
+def get_analytics_precos():
+    try:
+        filtros = {dimensao: int(request.args[dimensao])
+                   for dimensao in PRECO_DIMENSOES if dimensao in request.args}
+        faixas = int(request.args.get('faixas', app.config['ANALYTICS_PRECOS_FAIXAS']))
+    except ValueError:
+        return jsonify({'error': 'Filtros inválidos'}), 400
+    if not 1 <= faixas <= app.config['ANALYTICS_PRECOS_MAX_FAIXAS']:
+        return jsonify({'error': f"faixas deve estar entre 1 e {app.config['ANALYTICS_PRECOS_MAX_FAIXAS']}"}), 400
+    agrupar = request.args.get('agrupar')
+    if agrupar is not None and agrupar not in PRECO_DIMENSOES:
+        return jsonify({'error': f"agrupar deve ser {', '.join(PRECO_DIMENSOES)}"}), 400
+
+    foto = price_analytics.snapshot()
+    result = resumo_precos(precos_filtrados(foto, filtros), faixas)
+    if agrupar is not None:
+        precos, grupos = precos_agrupados(foto, filtros, agrupar)
+        result['grupos'] = resumo_por_grupo(precos, grupos, f'ID_{agrupar.upper()}')
+    result['seq'] = foto.seq
+    result['atualizado_em'] = int(foto.atualizado_em)
+    return jsonify(precos_json(result))
+
+# ==================== LIVROS SEMELHANTES ====================
+
+# Atributos do modelo de semelhanca e o peso de cada tipo, que multiplica o IDF do valor (valores
+# raros pesam mais): um livro e um vetor esparso desses atributos e a semelhanca e o cosseno
+SEMELHANTES_PESOS = {'faixa': 1.0, 'estado': 0.5, 'cidade': 1.0, 'autor': 3.0, 'categoria': 2.0}
+
+# Autores/categorias de um livro considerados no modelo (os de menor id)
+SEMELHANTES_MAX_VALORES = 4
+
+# Livros por bloco na reconstrucao completa (pares candidatos de um bloco ficam na memoria)
+SEMELHANTES_BLOCO = 2000
+
+# Linhas de LIVRO_SEMELHANTE por escrita na atualizacao incremental: cada escrita e um job do escritor,
+# entao as escritas dos usuarios nunca esperam o lote inteiro
+SEMELHANTES_ESCRITA = 500
+
+# Candidatos da reconstrucao completa: livros vizinhos de preco que compartilham uma destas chaves
+# (as mais especificas primeiro; autores e categorias grandes so chegam aos mais parecidos por elas)
+SEMELHANTES_CHAVES = [
+    ('autor', 'categoria'), ('autor', 'cidade'), ('autor',),
+    ('categoria', 'categoria'), ('categoria', 'cidade'), ('categoria', 'estado'),
+]
+
+# Atributos em arrays NumPy, uma posicao por livro em ordem de ID; autores/categorias em matrizes
+# de ate SEMELHANTES_MAX_VALORES colunas completadas com 0
+LivroAtributos = namedtuple('LivroAtributos', ['ids', 'precos', 'estados', 'cidades', 'autores', 'categorias'])
+
+## faixa de preco de meia oitava (cada faixa vai ate ~1,41x o inicio), sempre positiva
+def faixa_preco(precos):
+    return np.floor(np.log2(np.maximum(precos, 0.01)) * 2).astype(np.int32) + 64
+
+## limites [inicio, fim) de uma faixa de preco
+def limites_faixa(faixa):
+    return 2 ** ((faixa - 64) / 2), 2 ** ((faixa - 63) / 2)
+
+## posicao de cada id procurado nos ids ordenados e se ele esta la
+def localizar(ids, procurados):
+    posicoes = np.searchsorted(ids, procurados)
+    achados = posicoes < len(ids)
+    achados[achados] = ids[posicoes[achados]] == procurados[achados]
+    return posicoes, achados
+
+## pares (livro, valor) em matriz por livro: linha = posicao do livro em ids, ate
+## SEMELHANTES_MAX_VALORES valores por linha
+def matriz_por_livro(ids, pares_ids, valores):
+    ordem = np.lexsort((valores, pares_ids))
+    pares_ids, valores = pares_ids[ordem], valores[ordem]
+    posicoes, achados = localizar(ids, pares_ids)
+    posicoes, valores = posicoes[achados], valores[achados]
+    colunas = np.arange(len(posicoes)) - np.searchsorted(posicoes, posicoes)
+    largura = min(int(colunas.max()) + 1 if len(colunas) else 1, SEMELHANTES_MAX_VALORES)
+    manter = colunas < largura
+    matriz = np.zeros((len(ids), largura), dtype=np.int32)
+    matriz[posicoes[manter], colunas[manter]] = valores[manter]
+    return matriz
+
+## ler os atributos de todos os livros ou so dos ids pedidos
+def carregar_atributos(db, ids=None):
+    filtro, params = '', ()
+    if ids is not None:
+        filtro, params = 'WHERE ID_LIVRO IN (SELECT value FROM json_each(?))', (json.dumps(ids),)
+    cursor = db.execute(f'SELECT ID_LIVRO, PRECO, ID_ESTADO, ID_CIDADE FROM LIVRO_LISTAGEM {filtro} ORDER BY ID_LIVRO',
+                        params)
+    cursor.row_factory = None
+    livros = np.fromiter(cursor, dtype=[('id', np.int64), ('preco', np.float64),
+                                        ('estado', np.int32), ('cidade', np.int32)])
+    relacoes = []
+    for tabela, coluna in (('LIVRO_AUTOR', 'ID_AUTOR'), ('LIVRO_CATEGORIA', 'ID_CATEGORIA')):
+        cursor = db.execute(f'SELECT ID_LIVRO, {coluna} FROM {tabela} {filtro}', params)
+        cursor.row_factory = None
+        pares = np.fromiter(cursor, dtype=[('id', np.int64), ('valor', np.int32)])
+        relacoes.append(matriz_por_livro(livros['id'], pares['id'], pares['valor']))
+    return LivroAtributos(livros['id'], livros['preco'], livros['estado'], livros['cidade'], *relacoes)
+
+## valores de cada tipo de atributo (ordem de SEMELHANTES_PESOS): uma matriz por tipo, um livro
+## por linha, 0 = vazio
+def valores_atributos(atributos):
+    return [faixa_preco(atributos.precos)[:, None], atributos.estados[:, None], atributos.cidades[:, None],
+            atributos.autores, atributos.categorias]
+
+## pesos^2 de cada valor: (peso do tipo x IDF suavizado, log(1 + total / livros com o valor))^2;
+## devolve as matrizes de pesos^2 e a norma de cada livro
+def pesos_atributos(valores, frequencias, total):
+    quadrados = []
+    for matriz, peso, (unicos, contagens) in zip(valores, SEMELHANTES_PESOS.values(), frequencias):
+        indices, achados = localizar(unicos, matriz)
+        contagens = np.where(achados, contagens[np.minimum(indices, len(unicos) - 1)], 1) if len(unicos) else 1
+        quadrados.append(np.where(matriz > 0, (peso * np.log1p(total / np.maximum(contagens, 1))) ** 2, 0.0))
+    return quadrados, np.sqrt(sum(quadrado.sum(axis=1) for quadrado in quadrados))
+
+## livros com cada valor, no proprio catalogo carregado (reconstrucao completa)
+def frequencias_locais(valores):
+    return [np.unique(matriz[matriz > 0], return_counts=True) for matriz in valores], len(valores[0])
+
+## livros com um valor no catalogo inteiro: LIVRO_FACETA para estado/cidade/categoria, LIVRO_AUTOR
+## para autores e o indice de preco para as faixas
+def frequencia_catalogo(db, tipo, valor):
+    if tipo == 'autor':
+        row = db.execute('SELECT COUNT(*) FROM LIVRO_AUTOR WHERE ID_AUTOR = ?', (valor,)).fetchone()
+    elif tipo == 'faixa':
+        row = db.execute('SELECT COUNT(*) FROM LIVRO_LISTAGEM WHERE PRECO >= ? AND PRECO < ?',
+                         limites_faixa(valor)).fetchone()
+    else:
+        row = db.execute('SELECT TOTAL FROM LIVRO_FACETA WHERE FACETA = ? AND VALOR = ?', (tipo, valor)).fetchone()
+    return row[0] if row is not None else 1
+
+## livros com cada valor presente nas matrizes, no catalogo inteiro (atualizacao incremental)
+def frequencias_catalogo(db, valores):
+    frequencias = []
+    for tipo, matriz in zip(SEMELHANTES_PESOS, valores):
+        unicos = np.unique(matriz[matriz > 0])
+        contagens = [frequencia_catalogo(db, tipo, valor) for valor in unicos.tolist()]
+        frequencias.append((unicos, np.array(contagens, dtype=np.int64)))
+    total = db.execute("SELECT TOTAL FROM LIVRO_FACETA WHERE FACETA = 'total' AND VALOR = 0").fetchone()
+    return frequencias, total[0] if total is not None else len(valores[0])
+
+## cosseno entre os livros a[i] e b[i] (posicoes nas matrizes): soma dos pesos^2 dos valores em comum
+def similaridades(valores, quadrados, normas, a, b):
+    comum = np.zeros(len(a))
+    for matriz, quadrado in zip(valores, quadrados):
+        valores_b = matriz[b]
+        for coluna in range(matriz.shape[1]):
+            valores_a = matriz[a, coluna]
+            iguais = valores_b[:, 0] == valores_a
+            for outra in range(1, matriz.shape[1]):
+                iguais |= valores_b[:, outra] == valores_a
+            # Colunas vazias tem peso 0
+            comum += iguais * quadrado[a, coluna]
+    return comum / (normas[a] * normas[b])
+
+## os k pares mais semelhantes de cada livro a, com a semelhanca em 4 casas (> 0); os pares chegam
+## ordenados por (a, b), entao empates ficam com o menor b
+def melhores_pares(a, b, semelhancas, k):
+    # Uma ordenacao de inteiros: livro nos bits altos, 10000 - semelhanca*10000 nos baixos
+    pontos = np.rint(semelhancas * 10000).astype(np.int64)
+    ordem = np.argsort((a.astype(np.int64) << 14) | (10000 - pontos), kind='stable')
+    a, b, pontos = a[ordem], b[ordem], pontos[ordem]
+    posicao = np.arange(len(a)) - np.searchsorted(a, a)
+    manter = (posicao < k) & (pontos > 0)
+    return a[manter], b[manter], pontos[manter] / 10000
+
+## entradas (livro, chave) de uma chave de candidatos, ordenadas por chave e preco: os livros e
+## grupos nessa ordem e, ordenados por livro, os indices das entradas e os livros
+def entradas_da_chave(atributos, chave):
+    colunas = {'autor': atributos.autores, 'categoria': atributos.categorias,
+               'cidade': atributos.cidades[:, None], 'estado': atributos.estados[:, None]}
+    # Ids cabem em 31 bits: chave de duas colunas = primeira nos 32 bits altos; duas colunas de
+    # varios valores combinam cada valor de uma com cada da outra (a mesma coluna duas vezes: pares
+    # de valores diferentes, em ordem crescente)
+    grupos = colunas[chave[0]].astype(np.int64)
+    grupos = np.where(grupos > 0, grupos, -1)
+    for anterior, nome in zip(chave, chave[1:]):
+        valores = colunas[nome]
+        validos = (grupos[:, :, None] >= 0) & (valores[:, None, :] > 0)
+        if nome == anterior:
+            validos &= (grupos[:, :, None] & 0xFFFFFFFF) < valores[:, None, :]
+        grupos = np.where(validos, (grupos[:, :, None] << 32) | valores[:, None, :].astype(np.int64), -1)
+        grupos = grupos.reshape(len(validos), -1)
+    validos = grupos >= 0
+    livros = np.broadcast_to(np.arange(len(atributos.ids), dtype=np.int32)[:, None], grupos.shape)[validos]
+    grupos = grupos[validos]
+    ordem = np.lexsort((atributos.precos[livros], grupos))
+    livros, grupos = livros[ordem], grupos[ordem]
+    por_livro = np.argsort(livros, kind='stable').astype(np.int32)
+    return livros, grupos, por_livro, livros[por_livro]
+
+## pares (origem, destino) distintos, ordenados, sem o livro com ele mesmo; total = livros no catalogo
+def pares_unicos(origens, destinos, total):
+    pares = np.sort(origens[origens != destinos] * total + destinos[origens != destinos])
+    pares = pares[np.r_[True, pares[1:] != pares[:-1]]]
+    return pares // total, pares % total
+
+## pares candidatos dos livros [inicio, fim): ate janela vizinhos de preco de cada lado em cada chave
+def candidatos_bloco(chaves, inicio, fim, janela, total):
+    origens, destinos = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for livros, grupos, por_livro, livros_ordenados in chaves:
+        entradas = por_livro[np.searchsorted(livros_ordenados, inicio):np.searchsorted(livros_ordenados, fim)]
+        for passo in range(1, janela + 1):
+            for vizinhas in (entradas - passo, entradas + passo):
+                dentro = (vizinhas >= 0) & (vizinhas < len(livros))
+                dentro[dentro] = grupos[vizinhas[dentro]] == grupos[entradas[dentro]]
+                origens.append(livros[entradas[dentro]])
+                destinos.append(livros[vizinhas[dentro]])
+    return pares_unicos(np.concatenate(origens), np.concatenate(destinos), total)
+
+## pares candidatos dos livros [inicio, fim) pelas listas atuais: os vizinhos e os vizinhos deles
+def candidatos_vizinhanca(vizinhos, inicio, fim):
+    proprios = vizinhos[inicio:fim]
+    deles = np.where(proprios[:, :, None] >= 0, vizinhos[np.maximum(proprios, 0)], -1)
+    destinos = np.concatenate([proprios, deles.reshape(len(proprios), -1)], axis=1)
+    origens = np.broadcast_to(np.arange(inicio, fim)[:, None], destinos.shape)
+    return pares_unicos(origens[destinos >= 0], destinos[destinos >= 0], len(vizinhos))
+
+## listas de todo o catalogo: matrizes N x k com as posicoes dos vizinhos (-1 = vazio) e as
+## semelhancas. Primeiro os vizinhos de preco em cada chave; cada refinamento troca a lista de cada
+## livro pelas melhores entre os vizinhos e os vizinhos dos vizinhos (semelhante de semelhante
+## tende a ser semelhante), o que acha os parecidos que as janelas nao alcancam
+def construir_semelhantes(atributos, k, janela, refinamentos):
+    total = len(atributos.ids)
+    valores = valores_atributos(atributos)
+    quadrados, normas = pesos_atributos(valores, *frequencias_locais(valores))
+    chaves = [entradas_da_chave(atributos, chave) for chave in SEMELHANTES_CHAVES]
+
+    def listas(candidatos):
+        vizinhos = np.full((total, k), -1, dtype=np.int32)
+        semelhancas = np.zeros((total, k))
+        # Em blocos de livros: os pares de um bloco cabem na memoria
+        for inicio in range(0, total, SEMELHANTES_BLOCO):
+            a, b = candidatos(inicio, min(inicio + SEMELHANTES_BLOCO, total))
+            a, b, melhores = melhores_pares(a, b, similaridades(valores, quadrados, normas, a, b), k)
+            colunas = np.arange(len(a)) - np.searchsorted(a, a)
+            vizinhos[a, colunas] = b
+            semelhancas[a, colunas] = melhores
+        return vizinhos, semelhancas
+
+    vizinhos, semelhancas = listas(lambda inicio, fim: candidatos_bloco(chaves, inicio, fim, janela, total))
+    for _ in range(refinamentos):
+        anteriores = vizinhos
+        vizinhos, semelhancas = listas(lambda inicio, fim: candidatos_vizinhanca(anteriores, inicio, fim))
+    return vizinhos, semelhancas
+
+## candidatos de um livro para a atualizacao incremental, todos por indice: coautores, livros da
+## mesma cidade e os de uma mesma categoria no mesmo estado com preco mais proximo (como as chaves
+## de SEMELHANTES_CHAVES), a lista atual, as listas que o contem e as listas deles
+def candidatos_livro(db, id_livro, estado, cidade, preco, janela):
+    sementes = {row[0] for row in db.execute('''
+        SELECT ID_LIVRO FROM LIVRO_AUTOR
+        WHERE ID_AUTOR IN (SELECT ID_AUTOR FROM LIVRO_AUTOR WHERE ID_LIVRO = ?) AND ID_LIVRO != ?
+        LIMIT ?
+    ''', (id_livro, id_livro, janela * 2))}
+    sementes.update(row[0] for row in db.execute('''
+        SELECT DISTINCT l.ID_LIVRO FROM LIVRO_CATEGORIA lc
+        JOIN LIVRO_LISTAGEM l ON l.ID_LIVRO = lc.ID_LIVRO
+        WHERE lc.ID_CATEGORIA IN (SELECT ID_CATEGORIA FROM LIVRO_CATEGORIA WHERE ID_LIVRO = ?)
+          AND l.ID_ESTADO = ? AND l.ID_LIVRO != ?
+        ORDER BY ABS(l.PRECO - ?)
+        LIMIT ?
+    ''', (id_livro, estado, id_livro, preco, janela * 2)))
+    sementes.update(row[0] for row in db.execute('''
+        SELECT ID_LIVRO FROM LIVRO_LISTAGEM
+        WHERE ID_ESTADO = ? AND ID_CIDADE = ? AND ID_LIVRO != ?
+        ORDER BY ABS(PRECO - ?)
+        LIMIT ?
+    ''', (estado, cidade, id_livro, preco, janela * 2)))
+    sementes.update(row[0] for row in db.execute('''
+        SELECT ID_SEMELHANTE FROM LIVRO_SEMELHANTE WHERE ID_LIVRO = ?
+        UNION SELECT ID_LIVRO FROM LIVRO_SEMELHANTE WHERE ID_SEMELHANTE = ?
+    ''', (id_livro, id_livro)))
+    candidatos = set(sementes)
+    candidatos.update(row[0] for row in db.execute('''
+        SELECT ID_SEMELHANTE FROM LIVRO_SEMELHANTE WHERE ID_LIVRO IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(list(sementes)),)))
+    candidatos.discard(id_livro)
+    return candidatos
+
+## novas listas dos livros alterados e a nova semelhanca de cada candidato com eles: (ids dos livros
+## que ainda existem, linhas das listas deles, linhas (candidato, livro, semelhanca) para as listas dos candidatos)
+def atualizar_semelhantes(db, ids, k, janela):
+    alterados = carregar_atributos(db, ids)
+    candidatos = {}
+    for posicao, id_livro in enumerate(alterados.ids.tolist()):
+        candidatos[id_livro] = candidatos_livro(db, id_livro, int(alterados.estados[posicao]),
+                                                int(alterados.cidades[posicao]),
+                                                float(alterados.precos[posicao]), janela)
+    todos = set(alterados.ids.tolist()).union(*candidatos.values())
+    atributos = carregar_atributos(db, sorted(todos))
+    valores = valores_atributos(atributos)
+    quadrados, normas = pesos_atributos(valores, *frequencias_catalogo(db, valores))
+
+    pares = [(id_livro, candidato) for id_livro, vizinhos in candidatos.items() for candidato in vizinhos]
+    pares = np.array(sorted(pares), dtype=np.int64).reshape(-1, 2)
+    a, achados_a = localizar(atributos.ids, pares[:, 0])
+    b, achados_b = localizar(atributos.ids, pares[:, 1])
+    # Livros removidos entre as consultas
+    a, b = a[achados_a & achados_b], b[achados_a & achados_b]
+    semelhancas = np.round(similaridades(valores, quadrados, normas, a, b), 4)
+    reversas = list(zip(atributos.ids[b].tolist(), atributos.ids[a].tolist(), semelhancas.tolist()))
+    reversas = filtrar_reversas(db, alterados.ids.tolist(), reversas, k)
+    a, b, semelhancas = melhores_pares(a, b, semelhancas, k)
+    listas = list(zip(atributos.ids[a].tolist(), atributos.ids[b].tolist(), semelhancas.tolist()))
+    return alterados.ids.tolist(), listas, reversas
+
+## manter so as linhas (candidato, livro, semelhanca) que mudam a lista do candidato: o livro ja esta
+## nela com outro valor (ou sai dela) ou supera a menor semelhanca de uma lista cheia; as demais
+## seriam descartadas pelo corte das k maiores e so ocupariam o escritor
+def filtrar_reversas(db, ids, reversas, k):
+    atuais = {(row[0], row[1]): row[2] for row in db.execute('''
+        SELECT ID_LIVRO, ID_SEMELHANTE, SIMILARIDADE FROM LIVRO_SEMELHANTE
+        WHERE ID_SEMELHANTE IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(ids),))}
+    limites = {row[0]: row[1] for row in db.execute('''
+        SELECT ID_LIVRO, MIN(SIMILARIDADE) FROM LIVRO_SEMELHANTE
+        WHERE ID_LIVRO IN (SELECT value FROM json_each(?))
+        GROUP BY ID_LIVRO HAVING COUNT(*) >= ?
+    ''', (json.dumps(sorted({linha[0] for linha in reversas})), k))}
+    return [linha for linha in reversas
+            if (abs(atuais[linha[:2]] - linha[2]) > 0.00005 if linha[:2] in atuais
+                else linha[2] > limites.get(linha[0], 0.0))]
+
+## dividir o resultado de atualizar_semelhantes em escritas de ate SEMELHANTES_ESCRITA linhas,
+## com todas as linhas de um livro alterado na mesma escrita: (ids, listas, reversas) por escrita
+def escritas_semelhantes(ids, listas, reversas):
+    por_livro = {id_livro: ([], []) for id_livro in ids}
+    for linha in listas:
+        por_livro[linha[0]][0].append(linha)
+    for linha in reversas:
+        por_livro[linha[1]][1].append(linha)
+    escrita = ([], [], [])
+    for id_livro, (proprias, outras) in por_livro.items():
+        escrita[0].append(id_livro)
+        escrita[1].extend(proprias)
+        escrita[2].extend(outras)
+        if len(escrita[1]) + len(escrita[2]) >= SEMELHANTES_ESCRITA:
+            yield escrita
+            escrita = ([], [], [])
+    if escrita[0]:
+        yield escrita
+
+## gravar o resultado de atualizar_semelhantes (no escritor): troca as listas dos livros e coloca
+## cada livro na lista dos candidatos, mantendo so as k maiores semelhancas de cada lista
+def gravar_semelhantes(db, ids, listas, reversas, k):
+    db.executemany('DELETE FROM LIVRO_SEMELHANTE WHERE ID_LIVRO = ?', [(id_livro,) for id_livro in ids])
+    # Livros e candidatos removidos desde a leitura ficam de fora (o trigger de remocao ja passou)
+    db.executemany('''
+        INSERT OR REPLACE INTO LIVRO_SEMELHANTE (ID_LIVRO, ID_SEMELHANTE, SIMILARIDADE)
+        SELECT ?1, ?2, ?3 WHERE EXISTS (SELECT 1 FROM LIVRO_LISTAGEM WHERE ID_LIVRO = ?1)
+                            AND EXISTS (SELECT 1 FROM LIVRO_LISTAGEM WHERE ID_LIVRO = ?2)
+    ''', listas + [linha for linha in reversas if linha[2] > 0])
+    db.executemany('DELETE FROM LIVRO_SEMELHANTE WHERE ID_LIVRO = ? AND ID_SEMELHANTE = ?',
+                   [linha[:2] for linha in reversas if linha[2] <= 0])
+    db.executemany('''
+        DELETE FROM LIVRO_SEMELHANTE WHERE ID_LIVRO = ?1 AND ID_SEMELHANTE IN (
+            SELECT ID_SEMELHANTE FROM LIVRO_SEMELHANTE WHERE ID_LIVRO = ?1
+            ORDER BY SIMILARIDADE DESC, ID_SEMELHANTE LIMIT -1 OFFSET ?2)
+    ''', [(candidato, k) for candidato in {linha[0] for linha in reversas}])
+
+class SimilarityUpdater:
+    """Mantem LIVRO_SEMELHANTE em dia com as alteracoes de livros, por processo. Os triggers marcam
+    os livros alterados em LIVRO_SEMELHANTE_PENDENTE; uma thread (acordada logo apos as escritas deste
+    processo e, para as dos outros, a cada LIVROS_SEMELHANTES_INTERVAL) retira ate
+    LIVROS_SEMELHANTES_LOTE livros por vez e recalcula so a vizinhanca de cada um"""
+
+    def __init__(self):
+        self.reset()
+
+    ## descartar a thread herdada (ex.: processo filho depois de um fork)
+    def reset(self):
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.atualizados = 0
+
+    def start(self):
+        if self.pid != os.getpid():
+            self.reset()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='livros-semelhantes', daemon=True)
+                self._thread.start()
+
+    ## escrita de livro confirmada neste processo: processa as marcas sem esperar o intervalo
+    def notify(self):
+        self.start()
+        self._wake.set()
+
+    def stats(self):
+        return {'ativo': self._thread is not None, 'atualizados': self.atualizados}
+
+    def _run(self):
+        while True:
+            self._wake.wait(app.config['LIVROS_SEMELHANTES_INTERVAL'])
+            self._wake.clear()
+            try:
+                while self._update():
+                    pass
+            except Exception:
+                app.logger.exception('Falha ao atualizar LIVRO_SEMELHANTE')
+
+    ## um lote de livros marcados; False se nao havia nenhum
+    def _update(self):
+        lote = app.config['LIVROS_SEMELHANTES_LOTE']
+        k = app.config['LIVROS_SEMELHANTES_K']
+        # Sem marcas, so uma leitura: os processos nao ocupam o escritor a cada intervalo
+        db = read_pool.acquire()
+        try:
+            pendente = db.execute('SELECT 1 FROM LIVRO_SEMELHANTE_PENDENTE LIMIT 1').fetchone()
+        finally:
+            read_pool.release(db)
+        if pendente is None:
+            return False
+        # Retirar as marcas e uma escrita: processos diferentes nunca pegam o mesmo livro
+        ids = write_coordinator.execute(lambda db: [row[0] for row in db.execute('''
+            DELETE FROM LIVRO_SEMELHANTE_PENDENTE
+            WHERE ID_LIVRO IN (SELECT ID_LIVRO FROM LIVRO_SEMELHANTE_PENDENTE LIMIT ?)
+            RETURNING ID_LIVRO
+        ''', (lote,)).fetchall()])
+        if not ids:
+            return False
+        try:
+            db = read_pool.acquire()
+            try:
+                existentes, listas, reversas = atualizar_semelhantes(
+                    db, ids, k, app.config['LIVROS_SEMELHANTES_JANELA'])
+            finally:
+                read_pool.release(db)
+            for escrita in escritas_semelhantes(existentes, listas, reversas):
+                write_coordinator.execute(lambda db, escrita=escrita: gravar_semelhantes(db, *escrita, k))
+        except Exception:
+            # Devolve as marcas para a proxima rodada
+            write_coordinator.execute(lambda db: db.executemany(
+                'INSERT OR IGNORE INTO LIVRO_SEMELHANTE_PENDENTE (ID_LIVRO) VALUES (?)', [(i,) for i in ids]))
+            raise
+        self.atualizados += len(existentes)
+        return True
+
+livro_similares = SimilarityUpdater()
+
+@app.route('/livros/<int:id_livro>/semelhantes', methods=['GET'])
+def get_livros_semelhantes(id_livro):
+    k = app.config['LIVROS_SEMELHANTES_K']
+    try:
+        limit = int(request.args.get('limit', k))
+        if limit < 1:
+            raise ValueError('limit deve ser positivo')
+        expand = get_expand(request.args)
+    except ValueError:
+        return jsonify({'error': 'Parâmetros limit ou expand inválidos'}), 400
+
+    db = get_db()
+    livros = db.execute(f'''
+        SELECT {LIVRO_COLUMNS}{expand_columns(expand)}, s.SIMILARIDADE
+        FROM LIVRO_SEMELHANTE s
+        JOIN LIVRO_LISTAGEM l ON l.ID_LIVRO = s.ID_SEMELHANTE
+        WHERE s.ID_LIVRO = ?
+        ORDER BY s.SIMILARIDADE DESC, s.ID_SEMELHANTE
+        LIMIT ?
+    ''', (id_livro, min(limit, k))).fetchall()
+    if not livros and db.execute('SELECT 1 FROM LIVRO_LISTAGEM WHERE ID_LIVRO = ?', (id_livro,)).fetchone() is None:
+        return jsonify({'error': 'Livro não encontrado'}), 404
+    return jsonify(expand_livros([row_to_dict(row) for row in livros], expand))
+
+@app.cli.command('rebuild-semelhantes')
+@click.option('--refinamentos', type=int, default=1, show_default=True,
+              help='Passadas pelos vizinhos dos vizinhos (cada uma acha mais semelhantes e leva mais tempo)')
+@click.option('--lote', type=int, default=2000, show_default=True, help='Livros por transação')
+def rebuild_semelhantes_command(refinamentos, lote):
+    """Recalcula LIVRO_SEMELHANTE para o catálogo inteiro (ex.: depois de migrate ou de uma importação)"""
+    db = connect_db()
+    # As marcas anteriores ficam cobertas pela reconstrucao
+    db.execute('DELETE FROM LIVRO_SEMELHANTE_PENDENTE')
+    db.commit()
+    db.execute('BEGIN')
+    seq = db.execute('SELECT COALESCE(MAX(SEQ), 0) FROM LIVRO_ALTERACAO').fetchone()[0]
+    atributos = carregar_atributos(db)
+    db.rollback()
+    vizinhos, semelhancas = construir_semelhantes(atributos, app.config['LIVROS_SEMELHANTES_K'],
+                                                  app.config['LIVROS_SEMELHANTES_JANELA'], refinamentos)
+
+    total = 0
+    for inicio in range(0, len(atributos.ids), lote):
+        fim = min(inicio + lote, len(atributos.ids))
+        livros, colunas = np.nonzero(vizinhos[inicio:fim] >= 0)
+        linhas = zip(atributos.ids[inicio + livros].tolist(),
+                     atributos.ids[vizinhos[inicio + livros, colunas]].tolist(),
+                     semelhancas[inicio + livros, colunas].tolist())
+        # Transacoes curtas: o servidor continua escrevendo entre um lote e outro
+        db.execute('BEGIN IMMEDIATE')
+        db.execute('DELETE FROM LIVRO_SEMELHANTE WHERE ID_LIVRO BETWEEN ? AND ?',
+                   (int(atributos.ids[inicio]), int(atributos.ids[fim - 1])))
+        cursor = db.executemany('INSERT INTO LIVRO_SEMELHANTE (ID_LIVRO, ID_SEMELHANTE, SIMILARIDADE) VALUES (?, ?, ?)',
+                                linhas)
+        db.commit()
+        total += cursor.rowcount
+
+    # Livros alterados durante a leitura: removidos saem das listas e os demais voltam a ser marcados
+    db.execute('BEGIN IMMEDIATE')
+    # (filtrar REMOVIDO no SQL levaria o planner a idx_alteracao_removido e ao feed inteiro)
+    alterados = db.execute('SELECT ID_LIVRO, REMOVIDO FROM LIVRO_ALTERACAO WHERE SEQ > ?', (seq,)).fetchall()
+    removidos = [(row[0],) for row in alterados if row[1] == 'S']
+    db.executemany('''INSERT OR IGNORE INTO LIVRO_SEMELHANTE_PENDENTE (ID_LIVRO)
+                      SELECT ID_LIVRO FROM LIVRO_SEMELHANTE WHERE ID_SEMELHANTE = ?''', removidos)
+    db.executemany('DELETE FROM LIVRO_SEMELHANTE WHERE ID_LIVRO = ?1 OR ID_SEMELHANTE = ?1', removidos)
+    db.executemany('INSERT OR IGNORE INTO LIVRO_SEMELHANTE_PENDENTE (ID_LIVRO) VALUES (?)',
+                   [(row[0],) for row in alterados if row[1] == 'N'])
+    db.commit()
+    db.close()
+    click.echo(f'{total} pares em listas de {len(atributos.ids)} livros')
+
+# ==================== IMAGENS ====================
+
+IMAGE_CHUNK_SIZE = 64 * 1024
+IMAGE_HEADER_SIZE = 16
+# Uploads brutos ate este tamanho ficam em memoria antes da gravacao; acima disso, em arquivo temporario
+IMAGE_SPOOL_SIZE = 1024 * 1024
+IMAGE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Colunas de imagem por tabela: (BLOB, hash, chave)
+IMAGE_COLUMNS = {
+    'LIVRO': ('IMG_LIVRO', 'HASH_IMG_LIVRO', 'ID_LIVRO'),
+    'CATEGORIA': ('IMG_CATEGORIA', 'HASH_IMG_CATEGORIA', 'ID_CATEGORIA'),
+}
+
+# Imagem recebida: primeiros bytes ja lidos, restante do stream e tamanho total
+ImageUpload = namedtuple('ImageUpload', ['header', 'stream', 'size'])
+
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+## hash do conteudo da imagem (ETag e versao na URL)
+def image_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+## detectar tipo da imagem pelos primeiros bytes
+def detect_image_type(header):
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mimetype
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+## verificar se a imagem veio no JSON (base64) ou como arquivo no multipart
+def has_image(data, field):
+    return field in request.files or (data is not None and field in data)
+
+## motivo para recusar uma imagem pelo tamanho ou formato; retorna (mensagem, status) ou None
+def image_error(header, size):
+    if size > app.config['IMAGE_MAX_SIZE']:
+        return 'Imagem excede o tamanho máximo permitido', 413
+    if detect_image_type(header) is None:
+        return 'Formato de imagem não suportado', 415
+    return None
+
+## validar tamanho e formato antes de gravar qualquer byte
+def check_image(header, size):
+    error = image_error(header, size)
+    if error:
+        return jsonify({'error': error[0]}), error[1]
+    return None
+
+## obter imagem do multipart (arquivo) ou do JSON (base64); retorna (imagem, erro)
+def get_image_upload(data, field):
+    upload = request.files.get(field)
+    if upload is None:
+        try:
+            img_data = base64.b64decode(data[field])
+        except:
+            return None, (jsonify({'error': 'Imagem deve estar em base64'}), 400)
+        header = img_data[:IMAGE_HEADER_SIZE]
+        error = check_image(header, len(img_data))
+        if error:
+            return None, error
+        return ImageUpload(header, io.BytesIO(img_data[len(header):]), len(img_data)), None
+
+    # O Werkzeug ja grava arquivos grandes do multipart em disco temporario
+    upload.stream.seek(0, os.SEEK_END)
+    size = upload.stream.tell()
+    upload.stream.seek(0)
+    header = upload.stream.read(IMAGE_HEADER_SIZE)
+    error = check_image(header, size)
+    if error:
+        return None, error
+    return ImageUpload(header, upload.stream, size), None
+
+## copiar imagem em partes para o BLOB (ja criado com zeroblob) e gravar o hash
+def store_image(db, table, rowid, img):
+    column, hash_column, key_column = IMAGE_COLUMNS[table]
+    hasher = hashlib.sha256(img.header)
+    with db.blobopen(table, column, rowid) as blob:
+        blob.write(img.header)
+        remaining = img.size - len(img.header)
+        while remaining > 0:
+            chunk = img.stream.read(min(IMAGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                abort(400)
+            blob.write(chunk)
+            hasher.update(chunk)
+            remaining -= len(chunk)
+    img_hash = hasher.hexdigest()
+    db.execute(f'UPDATE {table} SET {hash_column} = ? WHERE {key_column} = ?', (img_hash, rowid))
+    return img_hash
+
+## receber imagem como corpo bruto da requisicao (PUT .../imagem)
+def receive_raw_image(table, rowid, not_found):
+    size = request.content_length
+    if size is None:
+        return jsonify({'error': 'Content-Length é obrigatório'}), 411
+    header = request.stream.read(min(IMAGE_HEADER_SIZE, size))
+    error = check_image(header, size)
+    if error:
+        return error
+
+    # Corpo copiado antes de entrar na fila: o escritor nunca espera pela rede do cliente
+    body = tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_SIZE)
+    shutil.copyfileobj(request.stream, body, IMAGE_CHUNK_SIZE)
+    if body.tell() != size - len(header):
+        abort(400)
+    body.seek(0)
+
+    column, hash_column, key_column = IMAGE_COLUMNS[table]
+
+    def update(db):
+        cursor = db.execute(f'UPDATE {table} SET {column} = zeroblob(?) WHERE {key_column} = ?', (size, rowid))
+        if cursor.rowcount == 0:
+            return None
+        return store_image(db, table, rowid, ImageUpload(header, body, size))
+
+    try:
+        with body:
+            img_hash = write_coordinator.execute(update)
+        if img_hash is None:
+            return jsonify({'error': not_found}), 404
+        schedule_thumbnails(get_db(), table, rowid, img_hash)
+        return jsonify({'hash': img_hash, 'message': 'Imagem atualizada com sucesso'})
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 400
+
+## URL versionada da imagem para os JSONs
+def image_url(endpoint, img_hash, **values):
+    return url_for(endpoint, v=img_hash, **values)
+
+## enviar BLOB em partes com ETag, 304 e Range
+def send_blob(table, column, rowid, etag, version=None):
+    # Com ?v=<hash> atual a URL nunca muda de conteudo e pode ficar em cache para sempre
+    immutable = version is not None and request.args.get('v') == version
+
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+    else:
+        # O BLOB e lido depois que o contexto da requisicao termina, pela mesma conexao da
+        # requisicao (uma segunda conexao do pool por download esgotaria o pool sob concorrencia)
+        db = get_db()
+        blob = db.blobopen(table, column, rowid, readonly=True)
+        mimetype = detect_image_type(blob.read(IMAGE_HEADER_SIZE)) or 'application/octet-stream'
+        blob.seek(0)
+
+        # Com direct_passthrough o Werkzeug nao chama call_on_close: a conexao volta ao pool
+        # quando o servidor fecha o iteravel
+        body = ClosingIterator(wrap_file(request.environ, blob, IMAGE_CHUNK_SIZE),
+                               lambda: read_pool.release(db))
+        response = Response(body, mimetype=mimetype, direct_passthrough=True)
+        response.set_etag(etag)
+        try:
+            response.make_conditional(request, accept_ranges=True, complete_length=len(blob))
+        except Exception:
+            # Range invalido (416): a resposta nunca sera iterada e a conexao fica com o contexto
+            blob.close()
+            raise
+        detach_db()
+
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMAGE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+## enviar imagem original ou miniatura (?size=) no formato aceito pelo cliente
+def send_image(table, rowid, img_hash):
+    column = IMAGE_COLUMNS[table][0]
+    if 'size' not in request.args:
+        return send_blob(table, column, rowid, img_hash, img_hash)
+
+    size = request.args.get('size', type=int)
+    if size not in app.config['THUMBNAIL_SIZES']:
+        return jsonify({'error': 'Tamanho de miniatura inválido'}), 400
+
+    formato = 'image/webp' if 'image/webp' in request.headers.get('Accept', '') else 'image/jpeg'
+    derivada = get_db().execute('''
+        SELECT ID_IMAGEM_DERIVADA, HASH_IMAGEM FROM IMAGEM_DERIVADA
+        WHERE HASH_ORIGEM = ? AND TAMANHO = ? AND FORMATO = ?
+    ''', (img_hash, size, formato)).fetchone()
+    if derivada is None:
+        # Miniatura ainda nao gerada (ou imagem nao decodificavel): envia o original sem cache longo
+        response = send_blob(table, column, rowid, img_hash)
+    else:
+        response = send_blob('IMAGEM_DERIVADA', 'IMAGEM', derivada['ID_IMAGEM_DERIVADA'],
+                             derivada['HASH_IMAGEM'], img_hash)
+    response.vary.add('Accept')
+    return response
+
+@app.route('/livros/<int:id_livro>/imagem', methods=['GET'])
+def get_livro_imagem(id_livro):
+    db = get_db()
+    livro = db.execute('SELECT HASH_IMG_LIVRO FROM LIVRO WHERE ID_LIVRO = ?', (id_livro,)).fetchone()
+    if livro is None:
+        return jsonify({'error': 'Livro não encontrado'}), 404
+    return send_image('LIVRO', id_livro, livro['HASH_IMG_LIVRO'])
+
+@app.route('/livros/<int:id_livro>/imagem', methods=['PUT'])
+def put_livro_imagem(id_livro):
+    return receive_raw_image('LIVRO', id_livro, 'Livro não encontrado')
+
+@app.route('/categorias/<int:id_categoria>/imagem', methods=['GET'])
+def get_categoria_imagem(id_categoria):
+    db = get_db()
+    categoria = db.execute('SELECT HASH_IMG_CATEGORIA FROM CATEGORIA WHERE ID_CATEGORIA = ?',
+                           (id_categoria,)).fetchone()
+    if categoria is None:
+        return jsonify({'error': 'Categoria não encontrada'}), 404
+    return send_image('CATEGORIA', id_categoria, categoria['HASH_IMG_CATEGORIA'])
+
+@app.route('/categorias/<int:id_categoria>/imagem', methods=['PUT'])
+def put_categoria_imagem(id_categoria):
+    return receive_raw_image('CATEGORIA', id_categoria, 'Categoria não encontrada')
+
+# ==================== MINIATURAS ====================
+
+THUMBNAIL_FORMATS = {'image/webp': 'WEBP', 'image/jpeg': 'JPEG'}
+THUMBNAIL_QUALITY = 80
+
+_thumbnail_pool = None
+_thumbnail_pending = set()
+_thumbnail_lock = threading.Lock()
+
+## gerar miniaturas de uma imagem (roda em um processo do pool)
+def render_thumbnails(database, table, rowid, img_hash, sizes):
+    column, hash_column, key_column = IMAGE_COLUMNS[table]
+    # O processo do pool importa o app de novo: o caminho vem do processo que agendou
+    db = connect_db(database=database)
+    try:
+        row = db.execute(f'SELECT {column} FROM {table} WHERE {key_column} = ? AND {hash_column} = ?',
+                         (rowid, img_hash)).fetchone()
+        if row is None:
+            # Imagem trocada ou removida antes do processamento
+            return 0
+        try:
+            original = Image.open(io.BytesIO(row[0]))
+            original.draft('RGB', (max(sizes), max(sizes)))
+            original = ImageOps.exif_transpose(original).convert('RGB')
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            return 0
+
+        derivadas = []
+        for size in sizes:
+            thumb = original.copy()
+            thumb.thumbnail((size, size))
+            for formato, pil_format in THUMBNAIL_FORMATS.items():
+                out = io.BytesIO()
+                thumb.save(out, pil_format, quality=THUMBNAIL_QUALITY)
+                data = out.getvalue()
+                derivadas.append((img_hash, size, formato, data, image_hash(data)))
+
+        db.executemany('''
+            INSERT OR IGNORE INTO IMAGEM_DERIVADA (HASH_ORIGEM, TAMANHO, FORMATO, IMAGEM, HASH_IMAGEM)
+            VALUES (?, ?, ?, ?, ?)
+        ''', derivadas)
+        db.commit()
+        return len(derivadas)
+    finally:
+        db.close()
+
+## pool de processos criado sob demanda (depois de um eventual fork do servidor)
+def get_thumbnail_pool():
+    global _thumbnail_pool
+    with _thumbnail_lock:
+        if _thumbnail_pool is None:
+            _thumbnail_pool = ProcessPoolExecutor(max_workers=app.config['THUMBNAIL_WORKERS'],
+                                                  mp_context=multiprocessing.get_context('spawn'))
+    return _thumbnail_pool
+
+## liberar o hash quando o processamento termina; falhas (banco travado, processo do pool que
+## morreu) ficam no log, e o hash volta a poder ser agendado
+def thumbnail_done(img_hash, future):
+    with _thumbnail_lock:
+        _thumbnail_pending.discard(img_hash)
+    if not future.cancelled() and future.exception() is not None:
+        app.logger.error('Falha ao gerar miniaturas da imagem %s', img_hash, exc_info=future.exception())
+
+## agendar miniaturas de uma imagem ja gravada (chamar depois do commit)
+def schedule_thumbnails(db, table, rowid, img_hash):
+    # Uploads identicos tem o mesmo hash e sao processados uma unica vez
+    if db.execute('SELECT 1 FROM IMAGEM_DERIVADA WHERE HASH_ORIGEM = ? LIMIT 1', (img_hash,)).fetchone():
+        return None
+    with _thumbnail_lock:
+        if img_hash in _thumbnail_pending or len(_thumbnail_pending) >= app.config['THUMBNAIL_MAX_PENDING']:
+            return None
+        _thumbnail_pending.add(img_hash)
+
+    future = get_thumbnail_pool().submit(render_thumbnails, app.config['DATABASE'], table, rowid,
+                                         img_hash, app.config['THUMBNAIL_SIZES'])
+    future.add_done_callback(lambda f: thumbnail_done(img_hash, f))
+    return future
+
+## gerar miniaturas que faltam para as imagens ja cadastradas
+@app.cli.command('build-thumbnails')
+def build_thumbnails_command():
+    db = connect_db()
+    pendentes = []
+    for table, (column, hash_column, key_column) in IMAGE_COLUMNS.items():
+        pendentes += [(table, row[0], row[1]) for row in db.execute(f'''
+            SELECT MIN({key_column}), {hash_column} FROM {table}
+            WHERE {hash_column} NOT IN (SELECT HASH_ORIGEM FROM IMAGEM_DERIVADA)
+            GROUP BY {hash_column}
+        ''')]
+    db.close()
+
+    with ProcessPoolExecutor(max_workers=app.config['THUMBNAIL_WORKERS'],
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(render_thumbnails, app.config['DATABASE'], table, rowid, img_hash,
+                               app.config['THUMBNAIL_SIZES'])
+                   for table, rowid, img_hash in pendentes]
+        total = sum(future.result() for future in futures)
+    click.echo(f'{len(pendentes)} imagens processadas, {total} miniaturas geradas')
+
+# ==================== IMPORTACAO ====================
+
+## ler CSV linha a linha (gerador: o arquivo nunca fica inteiro na memoria)
+def read_csv_lines(path, start, delimiter):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for line_number, row in enumerate(csv.DictReader(f, delimiter=delimiter), start=1):
+            if line_number > start:
+                yield line_number, row
+
+## ler arquivo JSON Lines linha a linha
+def read_jsonl_lines(path, start):
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if line_number > start and line.strip():
+                yield line_number, line
+
+## agrupar linhas em lotes para executemany
+def batches(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+## indices secundarios das tabelas (os automaticos, de PK/UNIQUE, tem sql NULL)
+def secondary_indexes(db, tables):
+    placeholders = ', '.join('?' * len(tables))
+    return [[row[0], row[1], row[2]] for row in db.execute(f'''
+        SELECT name, tbl_name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    ''', tables)]
+
+## abrir (ou retomar) uma importacao: le o checkpoint e remove os indices durante a carga
+def start_import(db, key, tables, restart):
+    row = db.execute('SELECT LINHA, INDICES FROM IMPORTACAO WHERE ARQUIVO = ?', (key,)).fetchone()
+    start = row['LINHA'] if row and not restart else 0
+    # Indices removidos por uma execucao interrompida continuam no checkpoint
+    indices = {name: (table, sql) for name, table, sql in (json.loads(row['INDICES']) if row else [])}
+    for name, (table, sql) in list(indices.items()):
+        if table not in tables:
+            db.execute(sql)
+            del indices[name]
+    for name, table, sql in secondary_indexes(db, tables):
+        db.execute(f'DROP INDEX {name}')
+        indices[name] = (table, sql)
+    db.execute('''
+        INSERT INTO IMPORTACAO (ARQUIVO, LINHA, INDICES) VALUES (?, ?, ?)
+        ON CONFLICT(ARQUIVO) DO UPDATE SET LINHA = excluded.LINHA, INDICES = excluded.INDICES
+    ''', (key, start, json.dumps([[name, table, sql] for name, (table, sql) in indices.items()])))
+    db.commit()
+    return start, indices
+
+## recriar os indices de uma vez (mais rapido que mante-los a cada linha) e encerrar o checkpoint
+def finish_import(db, key, indices):
+    for table, sql in indices.values():
+        db.execute(sql)
+    db.execute('DELETE FROM IMPORTACAO WHERE ARQUIVO = ?', (key,))
+    db.commit()
+    db.execute('PRAGMA optimize')
+
+## executar a carga em transacoes por lote, gravando o checkpoint junto com cada lote
+def run_import(key, tables, lines, write_batch, restart, batch_size):
+    db = connect_db()
+    start, indices = start_import(db, key, tables, restart)
+    if start:
+        click.echo(f'Retomando após a linha {start}')
+
+    inicio = time.monotonic()
+    total = ignoradas = 0
+    try:
+        for batch in batches(lines(start), batch_size):
+            db.execute('BEGIN IMMEDIATE')
+            ignoradas += write_batch(db, batch)
+            db.execute('UPDATE IMPORTACAO SET LINHA = ? WHERE ARQUIVO = ?', (batch[-1][0], key))
+            db.commit()
+            total += len(batch)
+            click.echo(f'{total} linhas ({total / (time.monotonic() - inicio):.0f} linhas/s)')
+    except BaseException:
+        db.rollback()
+        click.echo('Importação interrompida; rode o mesmo comando para retomar do último lote gravado', err=True)
+        raise
+
+    click.echo('Recriando índices...')
+    finish_import(db, key, indices)
+    db.close()
+    duracao = time.monotonic() - inicio
+    click.echo(f'{total - ignoradas} linhas importadas, {ignoradas} ignoradas, '
+               f'{duracao:.1f}s ({total / max(duracao, 1e-9):.0f} linhas/s)')
+
+## linha ignorada: avisar sem interromper a carga
+def skip_line(line_number, error):
+    click.echo(f'linha {line_number}: {error}', err=True)
+    return 1
+
+## gravar um lote de CEPs; estados e cidades sao resolvidos pelos dicionarios em memoria
+def import_ceps_batch(db, batch, estados, cidades):
+    rows = []
+    ignoradas = 0
+    for line_number, row in batch:
+        try:
+            cep = int(re.sub(r'\D', '', row['cep']))
+            nm_bairro, nm_cidade, nm_estado = row['bairro'].strip(), row['cidade'].strip(), row['estado'].strip()
+        except (KeyError, TypeError, ValueError, AttributeError):
+            ignoradas += skip_line(line_number, 'cep, bairro, cidade e estado são obrigatórios')
+            continue
+        if not (nm_bairro and nm_cidade and nm_estado):
+            ignoradas += skip_line(line_number, 'cep, bairro, cidade e estado são obrigatórios')
+            continue
+
+        id_estado = estados.get(nm_estado)
+        if id_estado is None:
+            id_estado = estados[nm_estado] = db.execute(
+                'INSERT INTO ESTADO (NM_ESTADO) VALUES (?)', (nm_estado,)).lastrowid
+        id_cidade = cidades.get((id_estado, nm_cidade))
+        if id_cidade is None:
+            id_cidade = cidades[(id_estado, nm_cidade)] = db.execute(
+                'INSERT INTO CIDADE (NM_CIDADE, ID_ESTADO) VALUES (?, ?)', (nm_cidade, id_estado)).lastrowid
+        rows.append((cep, nm_bairro, id_cidade))
+
+    db.executemany('''
+        INSERT INTO BAIRRO (CEP, NM_BAIRRO, ID_CIDADE) VALUES (?, ?, ?)
+        ON CONFLICT(CEP) DO UPDATE SET NM_BAIRRO = excluded.NM_BAIRRO, ID_CIDADE = excluded.ID_CIDADE
+    ''', rows)
+    return ignoradas
+
+@app.cli.command('import-ceps')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--delimitador', default=',', help='Separador do CSV')
+@click.option('--lote', type=int, default=None, help='Linhas por transação')
+@click.option('--reiniciar', is_flag=True, help='Ignora o checkpoint e começa do início')
+def import_ceps_command(arquivo, delimitador, lote, reiniciar):
+    """Importa CEPs de um CSV com as colunas cep, bairro, cidade e estado"""
+    db = connect_db()
+    estados = {row['NM_ESTADO']: row['ID_ESTADO'] for row in db.execute('SELECT ID_ESTADO, NM_ESTADO FROM ESTADO')}
+    cidades = {(row['ID_ESTADO'], row['NM_CIDADE']): row['ID_CIDADE']
+               for row in db.execute('SELECT ID_CIDADE, NM_CIDADE, ID_ESTADO FROM CIDADE')}
+    db.close()
+
+    run_import(f'import-ceps:{os.path.abspath(arquivo)}', ['ESTADO', 'CIDADE', 'BAIRRO'],
+               lambda start: read_csv_lines(arquivo, start, delimitador),
+               lambda db, batch: import_ceps_batch(db, batch, estados, cidades),
+               reiniciar, lote or app.config['IMPORT_BATCH_SIZE'])
+
+## gravar um lote de coordenadas; CEPs que nao estao em BAIRRO sao ignorados
+def import_coordenadas_batch(db, batch, ceps):
+    rows = []
+    ignoradas = 0
+    for line_number, row in batch:
+        try:
+            cep = int(re.sub(r'\D', '', row['cep']))
+            lat, lon = float(row['latitude']), float(row['longitude'])
+        except (KeyError, TypeError, ValueError):
+            ignoradas += skip_line(line_number, 'cep, latitude e longitude são obrigatórios')
+            continue
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            ignoradas += skip_line(line_number, 'latitude ou longitude fora da faixa')
+            continue
+        if cep not in ceps:
+            ignoradas += skip_line(line_number, f'CEP {cep} não encontrado')
+            continue
+        rows.append((cep, lat, lat, lon, lon, lat, lon))
+
+    db.executemany('''
+        INSERT OR REPLACE INTO BAIRRO_COORDENADA (CEP, MIN_LAT, MAX_LAT, MIN_LON, MAX_LON, LATITUDE, LONGITUDE)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return ignoradas
+
+@app.cli.command('import-coordenadas')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--delimitador', default=',', help='Separador do CSV')
+@click.option('--lote', type=int, default=None, help='Linhas por transação')
+@click.option('--reiniciar', is_flag=True, help='Ignora o checkpoint e começa do início')
+def import_coordenadas_command(arquivo, delimitador, lote, reiniciar):
+    """Importa coordenadas dos bairros de um CSV com as colunas cep, latitude e longitude"""
+    db = connect_db()
+    ceps = {row[0] for row in db.execute('SELECT CEP FROM BAIRRO')}
+    db.close()
+
+    # O R*Tree nao tem indices secundarios a remover durante a carga
+    run_import(f'import-coordenadas:{os.path.abspath(arquivo)}', [],
+               lambda start: read_csv_lines(arquivo, start, delimitador),
+               lambda db, batch: import_coordenadas_batch(db, batch, ceps),
+               reiniciar, lote or app.config['IMPORT_BATCH_SIZE'])
+
+## resolver nomes de autores para IDs, criando os que ainda nao existem
+def resolve_autores(db, names, autores):
+    result = []
+    for name in dict.fromkeys(name.strip() for name in names):
+        if name not in autores:
+            autores[name] = db.execute('INSERT INTO AUTOR (NM_AUTOR) VALUES (?)', (name,)).lastrowid
+        result.append(autores[name])
+    return result
+
+## gravar um lote de livros; chaves estrangeiras conferidas nos conjuntos/dicionarios em memoria
+def import_livros_batch(db, batch, refs):
+    # BEGIN IMMEDIATE ja foi executado: os proximos IDs do AUTOINCREMENT sao conhecidos
+    next_id = db.execute('''
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'LIVRO'), 0),
+                   COALESCE((SELECT MAX(ID_LIVRO) FROM LIVRO), 0)) + 1
+    ''').fetchone()[0]
+    livros, livro_autores, livro_categorias = [], [], []
+    ignoradas = 0
+    for line_number, line in batch:
+        try:
+            item = json.loads(line)
+        except ValueError:
+            ignoradas += skip_line(line_number, 'JSON inválido')
+            continue
+        if not isinstance(item, dict):
+            ignoradas += skip_line(line_number, 'Item deve ser um objeto')
+            continue
+
+        nomes = {field: item.pop(field, []) for field in ('autores', 'categorias')}
+        error = validate_livro_item(item)
+        if error is None and not all(isinstance(value, list)
+                                     and all(isinstance(name, str) and name.strip() for name in value)
+                                     for value in nomes.values()):
+            error = 'autores e categorias devem ser listas de nomes'
+        if error is None and item['cep'] not in refs['ceps']:
+            error = f'CEP {item["cep"]} não encontrado'
+        if error is None and not {item['login_comprador'], item['login_vendedor']} <= refs['logins']:
+            error = 'Usuário não encontrado'
+        if error is None:
+            # Categorias exigem imagem, entao nao sao criadas pela importacao
+            faltando = [name for name in nomes['categorias'] if name.strip() not in refs['categorias']]
+            if faltando:
+                error = f'Categoria {faltando[0]} não encontrada'
+        if error is None:
+            try:
+                if not isinstance(item['img_livro'], str):
+                    raise ValueError
+                img_data = base64.b64decode(item['img_livro'])
+            except (binascii.Error, ValueError):
+                error = 'Imagem deve estar em base64'
+            else:
+                invalid = image_error(img_data[:IMAGE_HEADER_SIZE], len(img_data))
+                if invalid:
+                    error = invalid[0]
+        if error:
+            ignoradas += skip_line(line_number, error)
+            continue
+
+        livros.append((next_id, item['nm_livro'], item['preco'], item['pagamento_eletronico'],
+                       item['pagamento_dinheiro'], item['entrega_presencial'], item['entrega_delivery'],
+                       img_data, image_hash(img_data), item['cep'], item['login_comprador'],
+                       item['login_vendedor']))
+        livro_autores += [(id_autor, next_id) for id_autor in resolve_autores(db, nomes['autores'], refs['autores'])]
+        livro_categorias += [(refs['categorias'][name], next_id)
+                             for name in dict.fromkeys(name.strip() for name in nomes['categorias'])]
+        next_id += 1
+
+    db.executemany('''
+        INSERT INTO LIVRO (ID_LIVRO, NM_LIVRO, PRECO, PAGAMENTO_ELETRONICO, PAGAMENTO_DINHEIRO,
+                           ENTREGA_PRESENCIAL, ENTREGA_DELIVERY, IMG_LIVRO, HASH_IMG_LIVRO, CEP,
+                           LOGIN_COMPRADOR, LOGIN_VENDEDOR)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', livros)
+    insert_livro_relations(db, 'LIVRO_AUTOR', 'ID_AUTOR', livro_autores)
+    insert_livro_relations(db, 'LIVRO_CATEGORIA', 'ID_CATEGORIA', livro_categorias)
+    return ignoradas
+
+@app.cli.command('import-livros')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--lote', type=int, default=None, help='Linhas por transação')
+@click.option('--reiniciar', is_flag=True, help='Ignora o checkpoint e começa do início')
+def import_livros_command(arquivo, lote, reiniciar):
+    """Importa livros de um arquivo JSON Lines (autores e categorias por nome; autores novos são criados)"""
+    db = connect_db()
+    refs = {
+        'ceps': {row[0] for row in db.execute('SELECT CEP FROM BAIRRO')},
+        'logins': {row[0] for row in db.execute('SELECT LOGIN FROM USUARIO')},
+        'autores': {row['NM_AUTOR']: row['ID_AUTOR'] for row in db.execute('SELECT ID_AUTOR, NM_AUTOR FROM AUTOR')},
+        'categorias': {row['NM_CATEGORIA']: row['ID_CATEGORIA']
+                       for row in db.execute('SELECT ID_CATEGORIA, NM_CATEGORIA FROM CATEGORIA')},
+    }
+    db.close()
+
+    # Os indices de LIVRO_AUTOR/LIVRO_CATEGORIA por ID_LIVRO ficam: os gatilhos da busca textual
+    # e da listagem os usam
+    run_import(f'import-livros:{os.path.abspath(arquivo)}', ['LIVRO', 'LIVRO_LISTAGEM'],
+               lambda start: read_jsonl_lines(arquivo, start),
+               lambda db, batch: import_livros_batch(db, batch, refs),
+               reiniciar, lote or app.config['IMPORT_BATCH_SIZE'])
+    click.echo('Rode "flask build-thumbnails" para gerar as miniaturas das capas importadas')
+
+# ==================== METRICAS ====================
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(9))  # 256 B .. 16 MiB
+
+class Metrics:
+    """Contadores e histogramas por rota deste processo; com METRICS_DIR, cada processo grava
+    um snapshot em arquivo e /metrics soma os snapshots de todos os workers"""
+
+    def __init__(self):
+        self.reset()
+
+    ## descartar contadores herdados (ex.: processo filho depois de um fork)
+    def reset(self):
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._dirty = False
+        self._flusher = None
+        self._stop = threading.Event()
+
+    def observe(self, route, method, status, seconds, size, sql_count, sql_seconds):
+        if self.pid != os.getpid():
+            self.reset()
+        with self._lock:
+            rec = self._routes.get((route, method))
+            if rec is None:
+                rec = self._routes[(route, method)] = {
+                    'status': {}, 'latency': [0] * (len(LATENCY_BUCKETS) + 1), 'latency_sum': 0.0,
+                    'size': [0] * (len(SIZE_BUCKETS) + 1), 'size_sum': 0,
+                    'sql_count': 0, 'sql_seconds': 0.0,
+                }
+            rec['status'][status] = rec['status'].get(status, 0) + 1
+            rec['latency'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            rec['latency_sum'] += seconds
+            # Respostas em streaming nao tem tamanho conhecido ao final da view
+            if size is not None:
+                rec['size'][bisect.bisect_left(SIZE_BUCKETS, size)] += 1
+                rec['size_sum'] += size
+            rec['sql_count'] += sql_count
+            rec['sql_seconds'] += sql_seconds
+            self._dirty = True
+            if self._flusher is None and app.config['METRICS_DIR']:
+                self._flusher = threading.Thread(target=self._flush_loop, name='metricas', daemon=True)
+                self._flusher.start()
+
+    ## copia serializavel dos contadores do processo (inclui cache e escritor)
+    def snapshot(self):
+        with self._lock:
+            routes = [[route, method, dict(rec, status={str(k): v for k, v in rec['status'].items()},
+                                           latency=list(rec['latency']), size=list(rec['size']))]
+                      for (route, method), rec in self._routes.items()]
+        writes = write_coordinator.stats()
+        return {
+            'routes': routes,
+            'counters': {
+                'cache_hits': response_cache.hits,
+                'cache_misses': response_cache.misses,
+                'write_batches': writes['batches'],
+                'writes': writes['writes'],
+                'write_errors': writes['errors'],
+            },
+        }
+
+    def path(self, name):
+        return os.path.join(app.config['METRICS_DIR'], f'metrics_{name}.json')
+
+    ## gravacao periodica fora das requisicoes (inclusive de um worker que ficou ocioso)
+    def _flush_loop(self):
+        while not self._stop.wait(app.config['METRICS_FLUSH_INTERVAL']):
+            if self._dirty:
+                self.flush()
+
+    ## gravar o snapshot do processo (tmp + rename: quem le nunca ve arquivo pela metade)
+    def flush(self):
+        self._dirty = False
+        write_json_atomic(self.path(os.getpid()), self.snapshot())
+
+    ## processo saindo: soma o snapshot em metrics_encerrados.json e remove o arquivo do pid,
+    ## para o diretorio nao crescer a cada worker reciclado sem os contadores voltarem atras
+    def retire(self):
+        if not app.config['METRICS_DIR'] or self.pid != os.getpid():
+            return
+        # Sem o gravador periodico, o arquivo do pid nao reaparece depois de removido
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with open(os.path.join(app.config['METRICS_DIR'], 'metrics.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            retired = self.path('encerrados')
+            write_json_atomic(retired, merge_snapshots([read_snapshot(retired), self.snapshot()]))
+            try:
+                os.remove(self.path(os.getpid()))
+            except FileNotFoundError:
+                pass
+
+    ## snapshots de todos os processos (o deste processo atualizado agora)
+    def collect(self):
+        if not app.config['METRICS_DIR']:
+            return self.snapshot()
+        self.flush()
+        with open(os.path.join(app.config['METRICS_DIR'], 'metrics.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            files = glob.glob(os.path.join(app.config['METRICS_DIR'], 'metrics_*.json'))
+            return merge_snapshots(read_snapshot(path) for path in files)
+
+metrics = Metrics()
+
+def write_json_atomic(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+## somar snapshots de varios processos
+def merge_snapshots(snapshots):
+    routes = {}
+    counters = {}
+    for snap in snapshots:
+        if snap is None:
+            continue
+        for name, value in snap['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+        for route, method, rec in snap['routes']:
+            total = routes.get((route, method))
+            if total is None:
+                routes[(route, method)] = json.loads(json.dumps(rec))
+                continue
+            for status, count in rec['status'].items():
+                total['status'][status] = total['status'].get(status, 0) + count
+            for key in ('latency', 'size'):
+                total[key] = [a + b for a, b in zip(total[key], rec[key])]
+            for key in ('latency_sum', 'size_sum', 'sql_count', 'sql_seconds'):
+                total[key] += rec[key]
+    return {'routes': [[route, method, rec] for (route, method), rec in routes.items()],
+            'counters': counters}
+
+def prometheus_labels(**labels):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+def prometheus_histogram(lines, name, labels, buckets, counts, total):
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{prometheus_labels(**labels, le=bound)} {cumulative}')
+    cumulative += counts[-1]
+    lines.append(f'{name}_bucket{prometheus_labels(**labels, le="+Inf")} {cumulative}')
+    lines.append(f'{name}_sum{prometheus_labels(**labels)} {total}')
+    lines.append(f'{name}_count{prometheus_labels(**labels)} {cumulative}')
+
+## snapshot no formato texto do Prometheus (versao 0.0.4)
+def render_prometheus(snap):
+    routes = sorted(snap['routes'], key=lambda r: (r[0], r[1]))
+    lines = []
+    lines += ['# HELP biblioteca_http_requests_total Requisicoes por rota, metodo e status',
+              '# TYPE biblioteca_http_requests_total counter']
+    for route, method, rec in routes:
+        for status, count in sorted(rec['status'].items()):
+            lines.append(f'biblioteca_http_requests_total{prometheus_labels(route=route, method=method, status=status)} {count}')
+    lines += ['# HELP biblioteca_http_request_duration_seconds Tempo da view ate a resposta',
+              '# TYPE biblioteca_http_request_duration_seconds histogram']
+    for route, method, rec in routes:
+        prometheus_histogram(lines, 'biblioteca_http_request_duration_seconds', {'route': route, 'method': method},
+                             LATENCY_BUCKETS, rec['latency'], rec['latency_sum'])
+    lines += ['# HELP biblioteca_http_response_size_bytes Tamanho do corpo (respostas com Content-Length)',
+              '# TYPE biblioteca_http_response_size_bytes histogram']
+    for route, method, rec in routes:
+        prometheus_histogram(lines, 'biblioteca_http_response_size_bytes', {'route': route, 'method': method},
+                             SIZE_BUCKETS, rec['size'], rec['size_sum'])
+    lines += ['# HELP biblioteca_sql_statements_total Comandos SQL executados pelas requisicoes',
+              '# TYPE biblioteca_sql_statements_total counter']
+    for route, method, rec in routes:
+        lines.append(f'biblioteca_sql_statements_total{prometheus_labels(route=route, method=method)} {rec["sql_count"]}')
+    lines += ['# HELP biblioteca_sql_duration_seconds_total Tempo em SQL (execucao e leitura das linhas)',
+              '# TYPE biblioteca_sql_duration_seconds_total counter']
+    for route, method, rec in routes:
+        lines.append(f'biblioteca_sql_duration_seconds_total{prometheus_labels(route=route, method=method)} {rec["sql_seconds"]}')
+    counters = (
+        ('biblioteca_response_cache_hits_total', 'cache_hits', 'Respostas servidas do cache'),
+        ('biblioteca_response_cache_misses_total', 'cache_misses', 'Respostas geradas sem cache'),
+        ('biblioteca_write_batches_total', 'write_batches', 'Lotes (commits) do escritor'),
+        ('biblioteca_writes_total', 'writes', 'Escritas aplicadas pelo escritor'),
+        ('biblioteca_write_errors_total', 'write_errors', 'Escritas que falharam'),
+    )
+    for name, key, help_text in counters:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter',
+                  f'{name} {snap["counters"].get(key, 0)}']
+    return '\n'.join(lines) + '\n'
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    sql_context.route = request.url_rule.rule if request.url_rule is not None else '<nenhuma>'
+
+@app.teardown_request
+def clear_request_route(error):
+    sql_context.route = None
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    sql_count, sql_seconds = 0, 0.0
+    if 'db' in g:
+        sql_count = g.db.sql_count - g.sql_start[0]
+        sql_seconds = g.db.sql_seconds - g.sql_start[1]
+    for count, seconds in g.get('sql_writes', ()):
+        sql_count += count
+        sql_seconds += seconds
+    # Rota (com os parametros como no @app.route), nunca a URL: cardinalidade fixa
+    metrics.observe(current_route(), request.method, response.status_code, time.perf_counter() - start,
+                    response.content_length, sql_count, sql_seconds)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(render_prometheus(metrics.collect()),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ==================== PERFIL DE SQL ====================
+
+sql_context = threading.local()  # rota da requisicao (ou da escrita, no escritor) em cada thread
+
+## rota (padrao do @app.route) que originou o SQL; fora de requisicao, a thread
+def current_route():
+    return getattr(sql_context, 'route', None) or threading.current_thread().name
+
+## texto do comando sem valores literais, agrupando IN (?, ?, ...) de qualquer tamanho
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'(?<![\w.])-?\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', sql)
+    return ' '.join(sql.split())
+
+## EXPLAIN QUERY PLAN com os mesmos parametros; retorna (linhas indentadas, tabelas lidas por inteiro)
+def explain_query(db, sql, params):
+    try:
+        rows = db.cursor(sqlite3.Cursor).execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    except sqlite3.Error:
+        return None, []
+    depth = {0: -1}
+    plan = []
+    scans = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        plan.append('  ' * depth[node] + detail)
+        # "SCAN LIVRO" sem indice; SCAN ... USING INDEX, tabelas virtuais e subconsultas nao contam
+        match = re.match(r'SCAN (\w+)$', detail)
+        if match and match.group(1) != 'CONSTANT':
+            scans.append(match.group(1))
+    return plan, scans
+
+class QueryProfiler:
+    """Tempo acumulado por comando SQL normalizado (por processo); comandos acima de SQL_SLOW_MS
+    vao para o log, com o plano de execucao capturado na primeira vez"""
+
+    def __init__(self):
+        self.reset()
+        # Chamado a cada comando SQL: o processo filho zera as estatisticas no fork, sem checar o pid aqui
+        os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, db, sql, params, seconds):
+        key = normalize_sql(sql)
+        route = getattr(sql_context, 'route', None) or threading.current_thread().name
+        slow = seconds * 1000 >= app.config['SQL_SLOW_MS']
+        with self._lock:
+            st = self._stats.get(key)
+            if st is None and len(self._stats) < app.config['SQL_PROFILE_MAX_STATEMENTS']:
+                st = self._stats[key] = {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'slow': 0,
+                                         'routes': {}, 'plan': None, 'full_scans': []}
+            if st is not None:
+                st['calls'] += 1
+                st['seconds'] += seconds
+                st['max_seconds'] = max(st['max_seconds'], seconds)
+                st['routes'][route] = st['routes'].get(route, 0) + 1
+                st['slow'] += slow
+            # Plano so uma vez por comando (executemany nao guarda os parametros)
+            explain = slow and st is not None and st['plan'] is None and params is not None
+            if explain:
+                st['plan'] = []
+        if not slow:
+            return
+        if explain:
+            st['plan'], st['full_scans'] = explain_query(db, sql, params)
+            app.logger.warning('SQL lento (%.1f ms) em %s: %s\n%s%s', seconds * 1000, route, key,
+                               '\n'.join(st['plan'] or ()),
+                               f"\nvarredura completa: {', '.join(st['full_scans'])}" if st['full_scans'] else '')
+        else:
+            app.logger.warning('SQL lento (%.1f ms) em %s: %s', seconds * 1000, route, key)
+
+    ## comandos ordenados por tempo total
+    def top(self, limit):
+        with self._lock:
+            stats = [dict(st, sql=key, routes=dict(st['routes'])) for key, st in self._stats.items()]
+        stats.sort(key=lambda st: st['seconds'], reverse=True)
+        return [{
+            'sql': st['sql'],
+            'calls': st['calls'],
+            'total_ms': round(st['seconds'] * 1000, 3),
+            'avg_ms': round(st['seconds'] * 1000 / st['calls'], 3),
+            'max_ms': round(st['max_seconds'] * 1000, 3),
+            'slow': st['slow'],
+            'routes': st['routes'],
+            'plan': st['plan'],
+            'full_scans': st['full_scans'],
+        } for st in stats[:limit]]
+
+query_profiler = QueryProfiler()
+
+@app.route('/debug/queries', methods=['GET'])
+def get_debug_queries():
+    if not app.config['SQL_DEBUG_VIEW']:
+        abort(404)
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'limit deve ser um número'}), 400
+    return jsonify(query_profiler.top(limit))
+
+@app.route('/debug/queries', methods=['DELETE'])
+def reset_debug_queries():
+    if not app.config['SQL_DEBUG_VIEW']:
+        abort(404)
+    query_profiler.reset()
+    return jsonify({'message': 'Estatísticas de SQL zeradas'})
+
+
+# ==================== ROTAS DE TESTE ====================
+
+@app.route('/dados', methods=['GET'])
+def index():
+    return jsonify({
+        'message': 'API da Biblioteca funcionando!',
+        'endpoints': {
+            'estados': '/estados',
+            'cidades': '/cidades', 
             'usuarios': '/usuarios',
             'autores': '/autores',
             'categorias': '/categorias',
@@ -665,7 +4000,44 @@ def index():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'OK', 'message': 'API funcionando corretamente'})
+    return jsonify({
+        'status': 'OK',
+        'message': 'API funcionando corretamente',
+        'pool': {'leitura': read_pool.stats()},
+        'escritas': write_coordinator.stats(),
+        'cache': response_cache.stats(),
+        'eventos': livro_events.stats(),
+        'analise_precos': price_analytics.stats(),
+        'semelhantes': livro_similares.stats()
+    })
+
+# ==================== CICLO DE VIDA DO PROCESSO ====================
+
+## abrir as conexoes e preencher o cache antes de receber trafego (ex.: worker recem-criado)
+def warm_up():
+    conexoes = [read_pool.acquire() for _ in range(app.config['DB_READ_POOL_SIZE'])]
+    for db in conexoes:
+        # Carrega o schema na conexao (primeira consulta de cada conexao e a mais lenta)
+        db.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+    for db in conexoes:
+        read_pool.release(db)
+    write_coordinator.start()
+    livro_similares.start()
+    with app.test_client() as client:
+        for path in app.config['WARMUP_PATHS']:
+            client.get(path)
+
+## liberar recursos do processo ao encerrar (escritas e miniaturas pendentes, conexoes ociosas)
+def shutdown():
+    global _thumbnail_pool
+    with _thumbnail_lock:
+        pool, _thumbnail_pool = _thumbnail_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+    write_coordinator.close()
+    read_pool.close_idle()
+    livro_events.close()
+    metrics.retire()
 
 # ==================== ERROR HANDLERS ====================
 
@@ -677,6 +4049,10 @@ def not_found(error):
 def bad_request(error):
     return jsonify({'error': 'Requisição inválida'}), 400
 
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'error': 'Requisição excede o tamanho máximo permitido'}), 413
+
 @app.errorhandler(500)
 def internal_error(error):
     return jsonify({'error': 'Erro interno do servidor'}), 500
@@ -686,11 +4062,16 @@ def internal_error(error):
 def api_page():
     return send_from_directory("dist", "index.html")
 
+@app.cli.command('migrate')
+def migrate_command():
+    aplicadas = migrate_db()
+    click.echo(f'{len(aplicadas)} migrações aplicadas' if aplicadas else 'Banco já está atualizado')
+
+@app.cli.command('seed')
+def seed_command():
+    click.echo('Dados de exemplo carregados' if seed_db() else 'Banco já tem dados; nada a fazer')
+
 if __name__ == '__main__':
-    if os.path.exists(app.config['DATABASE']):
-        print("Removendo banco existente...")
-        os.remove(app.config['DATABASE'])
-    
     init_db()
     print("Iniciando servidor Flask...")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -2,32 +2,127 @@
 Configurações da aplicação Flask
 """
 
+import atexit
 import os
+import shutil
+import tempfile
 
 class Config:
     """Configuração base"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     DATABASE = os.environ.get('DATABASE_PATH') or 'biblioteca.db'
-    
+
+    # Paginação de /livros
+    LIVROS_PAGE_SIZE = 50
+    LIVROS_MAX_PAGE_SIZE = 500
+    LIVROS_BULK_MAX_ITEMS = 500
+    # GET /livros/proximos: raio padrão e máximo (km)
+    LIVROS_PROXIMOS_RAIO_KM = 10
+    LIVROS_PROXIMOS_MAX_RAIO_KM = 500
+    # GET /livros/changes: remoções ficam no log por esse tempo (comando compact-changes)
+    LIVROS_CHANGES_RETENTION_DAYS = 30
+
+    # Respostas em streaming (NDJSON ou ?stream=1): linhas lidas por fetchmany
+    STREAM_CHUNK_ROWS = 500
+
+    # Imagens e miniaturas
+    IMAGE_MAX_SIZE = 10 * 1024 * 1024
+    # Corpo máximo: imagem em base64 (+33%) e folga para os demais campos;
+    # requisições maiores são recusadas com 413 só pelo Content-Length
+    MAX_CONTENT_LENGTH = IMAGE_MAX_SIZE * 4 // 3 + 64 * 1024
+    THUMBNAIL_SIZES = (160, 480)
+    THUMBNAIL_WORKERS = 2
+    THUMBNAIL_MAX_PENDING = 100
+
+    # Pool de conexões SQLite de leitura (por processo)
+    DB_READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', 8))
+    DB_POOL_TIMEOUT = 10  # segundos esperando uma conexão livre
+    DB_BUSY_TIMEOUT_MS = 5000
+    DB_CACHE_SIZE_KB = 16 * 1024
+    DB_MMAP_SIZE = 256 * 1024 * 1024
+    DB_STATEMENT_CACHE = 256
+
+    # Escritas: o SQLite aceita um escritor por vez, então cada processo tem uma única
+    # conexão de escrita que aplica as escritas de todas as threads em lotes (um commit por lote)
+    WRITE_BATCH_MAX_SIZE = 64
+    WRITE_BATCH_MAX_DELAY_MS = 2  # espera máxima por outras escritas antes do commit
+
+    # Comandos import-ceps / import-livros: linhas por transação
+    IMPORT_BATCH_SIZE = 10000
+
+    # Cache de respostas de /estados, /cidades, /bairros, /autores e /categorias
+    RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+    # Eventos de livros (GET /eventos/livros, SSE), por processo
+    SSE_MAX_SUBSCRIBERS = 1000  # conexões abertas; acima disso, 503
+    SSE_QUEUE_SIZE = 100  # eventos pendentes por conexão; fila cheia encerra a conexão (consumidor lento)
+    SSE_HISTORY_SIZE = 1000  # eventos recentes guardados para retomar com Last-Event-ID
+    SSE_HEARTBEAT_INTERVAL = 15  # segundos sem eventos até enviar um comentário de keep-alive
+    SSE_POLL_INTERVAL = 1.0  # segundos entre leituras de LIVRO_ALTERACAO (escritas de outros processos)
+
+    # Análise de preços (GET /analytics/precos): foto do mercado em memória, por processo
+    ANALYTICS_PRECOS_INTERVAL = 300  # segundos entre atualizações da foto (só se houve alterações)
+    ANALYTICS_PRECOS_FAIXAS = 20  # faixas do histograma
+    ANALYTICS_PRECOS_MAX_FAIXAS = 100
+
+    # Livros semelhantes (GET /livros/{id}/semelhantes): listas pré-calculadas em LIVRO_SEMELHANTE
+    LIVROS_SEMELHANTES_K = 10  # livros guardados por lista (e máximo de ?limit=)
+    LIVROS_SEMELHANTES_JANELA = 20  # candidatos: vizinhos de preço de cada lado, por autor/categoria/região
+    LIVROS_SEMELHANTES_LOTE = 100  # livros alterados recalculados por rodada, por processo
+    LIVROS_SEMELHANTES_INTERVAL = 5.0  # segundos entre buscas por alterações de outros processos
+
+    # Rotas chamadas por warm_up() antes de um worker receber tráfego (preenchem o cache e carregam
+    # a foto de preços)
+    WARMUP_PATHS = ['/estados', '/cidades', '/autores', '/categorias', '/analytics/precos']
+
+    # Métricas (/metrics): sem METRICS_DIR cada processo expõe só os próprios contadores;
+    # com METRICS_DIR, os workers gravam snapshots ali e /metrics soma todos
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = 1.0  # segundos entre gravações do snapshot de um worker
+
+    # Perfil de SQL: comandos acima de SQL_SLOW_MS vão para o log com o plano de execução;
+    # GET /debug/queries lista os comandos por tempo total (desligado em produção)
+    SQL_SLOW_MS = 100
+    SQL_PROFILE_MAX_STATEMENTS = 1000
+    SQL_DEBUG_VIEW = False
+
+    @classmethod
+    def init_app(cls, app):
+        pass
+
 class DevelopmentConfig(Config):
     """Configuração de desenvolvimento"""
     DEBUG = True
     TESTING = False
+    SQL_DEBUG_VIEW = True
 
 class ProductionConfig(Config):
     """Configuração de produção"""
     DEBUG = False
     TESTING = False
     SECRET_KEY = os.environ.get('SECRET_KEY')
-    
-    if not SECRET_KEY:
-        raise ValueError("SECRET_KEY deve ser definida em produção")
+
+    @classmethod
+    def init_app(cls, app):
+        if not cls.SECRET_KEY:
+            raise ValueError("SECRET_KEY deve ser definida em produção")
 
 class TestingConfig(Config):
     """Configuração de teste"""
     DEBUG = True
     TESTING = True
-    DATABASE = ':memory:'  # Banco em memória para testes
+    SQL_DEBUG_VIEW = True
+    # Sem DATABASE_PATH, cada processo usa um banco novo em um arquivo temporário (apagado na saída).
+    # Um banco em memória sumiria entre as conexões de migrate/seed e não é visível para os
+    # processos de miniaturas
+    DATABASE = os.environ.get('DATABASE_PATH')
+
+    @classmethod
+    def init_app(cls, app):
+        if not app.config['DATABASE']:
+            pasta = tempfile.mkdtemp(prefix='biblioteca_teste_')
+            atexit.register(shutil.rmtree, pasta, ignore_errors=True)
+            app.config['DATABASE'] = os.path.join(pasta, 'biblioteca.db')
 
 # Dicionário de configurações
 config = {
@@ -35,4 +130,4 @@ config = {
     'production': ProductionConfig,
     'testing': TestingConfig,
     'default': DevelopmentConfig
-}
\ No newline at end of file
+}
@@ -0,0 +1,270 @@
+-- Migration 0001: initial schema for SQLite (converted from Oracle DDL)
+
+-- Create ESTADO table
+CREATE TABLE ESTADO (
+    ID_ESTADO INTEGER PRIMARY KEY AUTOINCREMENT,
+    NM_ESTADO TEXT NOT NULL
+);
+
+-- Create CIDADE table
+CREATE TABLE CIDADE (
+    ID_CIDADE INTEGER PRIMARY KEY AUTOINCREMENT,
+    NM_CIDADE TEXT NOT NULL,
+    ID_ESTADO INTEGER NOT NULL,
+    CONSTRAINT CIDADE_ESTADO_FK FOREIGN KEY(ID_ESTADO) REFERENCES ESTADO(ID_ESTADO)
+);
+
+-- Create BAIRRO table
+CREATE TABLE BAIRRO (
+    CEP INTEGER PRIMARY KEY,
+    NM_BAIRRO TEXT NOT NULL,
+    ID_CIDADE INTEGER NOT NULL,
+    CONSTRAINT BAIRRO_CIDADE_FK FOREIGN KEY(ID_CIDADE) REFERENCES CIDADE(ID_CIDADE)
+);
+
+-- Create USUARIO table
+CREATE TABLE USUARIO (
+    LOGIN TEXT PRIMARY KEY,
+    SENHA TEXT NOT NULL,
+    NM_USUARIO TEXT NOT NULL,
+    EMAIL_CONTATO TEXT
+);
+
+-- Create AUTOR table
+CREATE TABLE AUTOR (
+    ID_AUTOR INTEGER PRIMARY KEY AUTOINCREMENT,
+    NM_AUTOR TEXT NOT NULL
+);
+
+-- Create CATEGORIA table
+CREATE TABLE CATEGORIA (
+    ID_CATEGORIA INTEGER PRIMARY KEY AUTOINCREMENT,
+    NM_CATEGORIA TEXT NOT NULL,
+    IMG_CATEGORIA BLOB NOT NULL,
+    HASH_IMG_CATEGORIA TEXT -- sha256 of IMG_CATEGORIA, used as ETag
+);
+
+-- Create LIVRO table
+CREATE TABLE LIVRO (
+    ID_LIVRO INTEGER PRIMARY KEY AUTOINCREMENT,
+    NM_LIVRO TEXT NOT NULL,
+    PRECO REAL NOT NULL,
+    PAGAMENTO_ELETRONICO TEXT NOT NULL CHECK(PAGAMENTO_ELETRONICO IN ('S', 'N')),
+    PAGAMENTO_DINHEIRO TEXT NOT NULL CHECK(PAGAMENTO_DINHEIRO IN ('S', 'N')),
+    ENTREGA_PRESENCIAL TEXT NOT NULL CHECK(ENTREGA_PRESENCIAL IN ('S', 'N')),
+    ENTREGA_DELIVERY TEXT NOT NULL CHECK(ENTREGA_DELIVERY IN ('S', 'N')),
+    IMG_LIVRO BLOB NOT NULL,
+    HASH_IMG_LIVRO TEXT, -- sha256 of IMG_LIVRO, used as ETag
+    CEP INTEGER NOT NULL,
+    LOGIN_COMPRADOR TEXT NOT NULL,
+    LOGIN_VENDEDOR TEXT NOT NULL,
+    CONSTRAINT LIVRO_BAIRRO_FK FOREIGN KEY(CEP) REFERENCES BAIRRO(CEP),
+    CONSTRAINT LIVRO_USUARIO_COMPRADOR_FK FOREIGN KEY(LOGIN_COMPRADOR) REFERENCES USUARIO(LOGIN),
+    CONSTRAINT LIVRO_USUARIO_VENDEDOR_FK FOREIGN KEY(LOGIN_VENDEDOR) REFERENCES USUARIO(LOGIN)
+);
+
+-- Create LIVRO_AUTOR table (many-to-many relationship)
+CREATE TABLE LIVRO_AUTOR (
+    ID_AUTOR INTEGER,
+    ID_LIVRO INTEGER,
+    PRIMARY KEY(ID_AUTOR, ID_LIVRO),
+    CONSTRAINT LIVRO_AUTOR_AUTOR_FK FOREIGN KEY(ID_AUTOR) REFERENCES AUTOR(ID_AUTOR),
+    CONSTRAINT LIVRO_AUTOR_LIVRO_FK FOREIGN KEY(ID_LIVRO) REFERENCES LIVRO(ID_LIVRO)
+);
+
+-- Create LIVRO_CATEGORIA table (many-to-many relationship)
+CREATE TABLE LIVRO_CATEGORIA (
+    ID_CATEGORIA INTEGER,
+    ID_LIVRO INTEGER,
+    PRIMARY KEY(ID_CATEGORIA, ID_LIVRO),
+    CONSTRAINT LIVRO_CATEGORIA_CATEGORIA_FK FOREIGN KEY(ID_CATEGORIA) REFERENCES CATEGORIA(ID_CATEGORIA),
+    CONSTRAINT LIVRO_CATEGORIA_LIVRO_FK FOREIGN KEY(ID_LIVRO) REFERENCES LIVRO(ID_LIVRO)
+);
+
+-- Create IMAGEM_DERIVADA table (thumbnails keyed by the hash of the original image,
+-- so identical uploads share the same derivatives)
+CREATE TABLE IMAGEM_DERIVADA (
+    ID_IMAGEM_DERIVADA INTEGER PRIMARY KEY AUTOINCREMENT,
+    HASH_ORIGEM TEXT NOT NULL,
+    TAMANHO INTEGER NOT NULL,
+    FORMATO TEXT NOT NULL,
+    IMAGEM BLOB NOT NULL,
+    HASH_IMAGEM TEXT NOT NULL,
+    CONSTRAINT IMAGEM_DERIVADA_UK UNIQUE (HASH_ORIGEM, TAMANHO, FORMATO)
+);
+
+-- Create indexes for better performance
+CREATE INDEX idx_cidade_estado ON CIDADE(ID_ESTADO);
+CREATE INDEX idx_bairro_cidade ON BAIRRO(ID_CIDADE);
+CREATE INDEX idx_livro_cep ON LIVRO(CEP);
+CREATE INDEX idx_livro_comprador ON LIVRO(LOGIN_COMPRADOR);
+CREATE INDEX idx_livro_vendedor ON LIVRO(LOGIN_VENDEDOR);
+CREATE INDEX idx_livro_autor_livro ON LIVRO_AUTOR(ID_LIVRO);
+CREATE INDEX idx_livro_autor_autor ON LIVRO_AUTOR(ID_AUTOR);
+CREATE INDEX idx_livro_categoria_livro ON LIVRO_CATEGORIA(ID_LIVRO);
+CREATE INDEX idx_livro_categoria_categoria ON LIVRO_CATEGORIA(ID_CATEGORIA);
+
+-- Indexes for keyset pagination of GET /livros (ORDER BY NM_LIVRO, ID_LIVRO)
+-- Each filter column comes first so a filtered page is still an ordered range scan
+CREATE INDEX idx_livro_nome ON LIVRO(NM_LIVRO, ID_LIVRO);
+CREATE INDEX idx_livro_cep_nome ON LIVRO(CEP, NM_LIVRO, ID_LIVRO);
+CREATE INDEX idx_livro_preco ON LIVRO(PRECO);
+CREATE INDEX idx_livro_eletronico_nome ON LIVRO(PAGAMENTO_ELETRONICO, NM_LIVRO, ID_LIVRO);
+CREATE INDEX idx_livro_dinheiro_nome ON LIVRO(PAGAMENTO_DINHEIRO, NM_LIVRO, ID_LIVRO);
+CREATE INDEX idx_livro_presencial_nome ON LIVRO(ENTREGA_PRESENCIAL, NM_LIVRO, ID_LIVRO);
+CREATE INDEX idx_livro_delivery_nome ON LIVRO(ENTREGA_DELIVERY, NM_LIVRO, ID_LIVRO);
+
+-- Full-text search index for /livros/busca
+-- unicode61 with remove_diacritics 2 folds case and accents ("jose" matches "José")
+CREATE VIRTUAL TABLE LIVRO_BUSCA USING fts5(
+    NM_LIVRO,
+    AUTORES,
+    CATEGORIAS,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+-- Title matches weigh more than author matches, which weigh more than category matches
+INSERT INTO LIVRO_BUSCA(LIVRO_BUSCA, rank) VALUES ('rank', 'bm25(10.0, 5.0, 2.0)');
+
+-- Keep LIVRO_BUSCA in sync (rowid = ID_LIVRO)
+CREATE TRIGGER trg_livro_busca_insert AFTER INSERT ON LIVRO BEGIN
+    INSERT INTO LIVRO_BUSCA (rowid, NM_LIVRO, AUTORES, CATEGORIAS) VALUES (
+        NEW.ID_LIVRO,
+        NEW.NM_LIVRO,
+        (SELECT group_concat(a.NM_AUTOR, ' ') FROM LIVRO_AUTOR la
+         JOIN AUTOR a ON a.ID_AUTOR = la.ID_AUTOR WHERE la.ID_LIVRO = NEW.ID_LIVRO),
+        (SELECT group_concat(c.NM_CATEGORIA, ' ') FROM LIVRO_CATEGORIA lc
+         JOIN CATEGORIA c ON c.ID_CATEGORIA = lc.ID_CATEGORIA WHERE lc.ID_LIVRO = NEW.ID_LIVRO)
+    );
+END;
+
+CREATE TRIGGER trg_livro_busca_update AFTER UPDATE OF NM_LIVRO ON LIVRO BEGIN
+    UPDATE LIVRO_BUSCA SET NM_LIVRO = NEW.NM_LIVRO WHERE rowid = NEW.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_livro_busca_delete AFTER DELETE ON LIVRO BEGIN
+    DELETE FROM LIVRO_BUSCA WHERE rowid = OLD.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_livro_autor_busca_insert AFTER INSERT ON LIVRO_AUTOR BEGIN
+    UPDATE LIVRO_BUSCA SET AUTORES = (
+        SELECT group_concat(a.NM_AUTOR, ' ') FROM LIVRO_AUTOR la
+        JOIN AUTOR a ON a.ID_AUTOR = la.ID_AUTOR WHERE la.ID_LIVRO = NEW.ID_LIVRO
+    ) WHERE rowid = NEW.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_livro_autor_busca_delete AFTER DELETE ON LIVRO_AUTOR BEGIN
+    UPDATE LIVRO_BUSCA SET AUTORES = (
+        SELECT group_concat(a.NM_AUTOR, ' ') FROM LIVRO_AUTOR la
+        JOIN AUTOR a ON a.ID_AUTOR = la.ID_AUTOR WHERE la.ID_LIVRO = OLD.ID_LIVRO
+    ) WHERE rowid = OLD.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_livro_categoria_busca_insert AFTER INSERT ON LIVRO_CATEGORIA BEGIN
+    UPDATE LIVRO_BUSCA SET CATEGORIAS = (
+        SELECT group_concat(c.NM_CATEGORIA, ' ') FROM LIVRO_CATEGORIA lc
+        JOIN CATEGORIA c ON c.ID_CATEGORIA = lc.ID_CATEGORIA WHERE lc.ID_LIVRO = NEW.ID_LIVRO
+    ) WHERE rowid = NEW.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_livro_categoria_busca_delete AFTER DELETE ON LIVRO_CATEGORIA BEGIN
+    UPDATE LIVRO_BUSCA SET CATEGORIAS = (
+        SELECT group_concat(c.NM_CATEGORIA, ' ') FROM LIVRO_CATEGORIA lc
+        JOIN CATEGORIA c ON c.ID_CATEGORIA = lc.ID_CATEGORIA WHERE lc.ID_LIVRO = OLD.ID_LIVRO
+    ) WHERE rowid = OLD.ID_LIVRO;
+END;
+
+-- Renaming an author or category re-indexes the books that reference it
+CREATE TRIGGER trg_autor_busca_update AFTER UPDATE OF NM_AUTOR ON AUTOR BEGIN
+    UPDATE LIVRO_BUSCA SET AUTORES = (
+        SELECT group_concat(a.NM_AUTOR, ' ') FROM LIVRO_AUTOR la
+        JOIN AUTOR a ON a.ID_AUTOR = la.ID_AUTOR WHERE la.ID_LIVRO = LIVRO_BUSCA.rowid
+    ) WHERE rowid IN (SELECT ID_LIVRO FROM LIVRO_AUTOR WHERE ID_AUTOR = NEW.ID_AUTOR);
+END;
+
+CREATE TRIGGER trg_categoria_busca_update AFTER UPDATE OF NM_CATEGORIA ON CATEGORIA BEGIN
+    UPDATE LIVRO_BUSCA SET CATEGORIAS = (
+        SELECT group_concat(c.NM_CATEGORIA, ' ') FROM LIVRO_CATEGORIA lc
+        JOIN CATEGORIA c ON c.ID_CATEGORIA = lc.ID_CATEGORIA WHERE lc.ID_LIVRO = LIVRO_BUSCA.rowid
+    ) WHERE rowid IN (SELECT ID_LIVRO FROM LIVRO_CATEGORIA WHERE ID_CATEGORIA = NEW.ID_CATEGORIA);
+END;
+
+-- Version counters for the response cache of reference-data endpoints.
+-- Every write bumps its table's version, so cached responses in any worker
+-- process become stale as soon as the change commits
+CREATE TABLE CACHE_VERSAO (
+    TABELA TEXT PRIMARY KEY,
+    VERSAO INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO CACHE_VERSAO (TABELA) VALUES ('ESTADO'), ('CIDADE'), ('BAIRRO'), ('AUTOR'), ('CATEGORIA');
+
+CREATE TRIGGER trg_estado_versao_insert AFTER INSERT ON ESTADO BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'ESTADO';
+END;
+
+CREATE TRIGGER trg_estado_versao_update AFTER UPDATE ON ESTADO BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'ESTADO';
+END;
+
+CREATE TRIGGER trg_estado_versao_delete AFTER DELETE ON ESTADO BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'ESTADO';
+END;
+
+CREATE TRIGGER trg_cidade_versao_insert AFTER INSERT ON CIDADE BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'CIDADE';
+END;
+
+CREATE TRIGGER trg_cidade_versao_update AFTER UPDATE ON CIDADE BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'CIDADE';
+END;
+
+CREATE TRIGGER trg_cidade_versao_delete AFTER DELETE ON CIDADE BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'CIDADE';
+END;
+
+CREATE TRIGGER trg_bairro_versao_insert AFTER INSERT ON BAIRRO BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'BAIRRO';
+END;
+
+CREATE TRIGGER trg_bairro_versao_update AFTER UPDATE ON BAIRRO BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'BAIRRO';
+END;
+
+CREATE TRIGGER trg_bairro_versao_delete AFTER DELETE ON BAIRRO BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'BAIRRO';
+END;
+
+CREATE TRIGGER trg_autor_versao_insert AFTER INSERT ON AUTOR BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'AUTOR';
+END;
+
+CREATE TRIGGER trg_autor_versao_update AFTER UPDATE ON AUTOR BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'AUTOR';
+END;
+
+CREATE TRIGGER trg_autor_versao_delete AFTER DELETE ON AUTOR BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'AUTOR';
+END;
+
+CREATE TRIGGER trg_categoria_versao_insert AFTER INSERT ON CATEGORIA BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'CATEGORIA';
+END;
+
+CREATE TRIGGER trg_categoria_versao_update AFTER UPDATE ON CATEGORIA BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'CATEGORIA';
+END;
+
+CREATE TRIGGER trg_categoria_versao_delete AFTER DELETE ON CATEGORIA BEGIN
+    UPDATE CACHE_VERSAO SET VERSAO = VERSAO + 1 WHERE TABELA = 'CATEGORIA';
+END;
+
+-- Checkpoints of the import-ceps / import-livros commands. LINHA is committed in
+-- the same transaction as the rows it covers, so an interrupted import resumes
+-- exactly after the last committed batch. INDICES keeps the SQL of the indexes
+-- dropped for the load, so a resumed import can still rebuild them
+CREATE TABLE IMPORTACAO (
+    ARQUIVO TEXT PRIMARY KEY,
+    LINHA INTEGER NOT NULL DEFAULT 0,
+    INDICES TEXT NOT NULL DEFAULT '[]'
+);
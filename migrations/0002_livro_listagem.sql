@@ -0,0 +1,106 @@
+-- Migration 0002: denormalized read model for book listings (LIVRO_LISTAGEM)
+
+-- One row per book as the listing/detail endpoints return it. The view is the single
+-- definition of a row; triggers and the rebuild-listagem command copy from it.
+CREATE VIEW LIVRO_LISTAGEM_ORIGEM AS
+SELECT l.ID_LIVRO, l.NM_LIVRO, l.PRECO,
+       l.PAGAMENTO_ELETRONICO, l.PAGAMENTO_DINHEIRO, l.ENTREGA_PRESENCIAL, l.ENTREGA_DELIVERY,
+       l.HASH_IMG_LIVRO, l.CEP, l.LOGIN_COMPRADOR, l.LOGIN_VENDEDOR,
+       b.NM_BAIRRO, b.ID_CIDADE, c.NM_CIDADE, c.ID_ESTADO, e.NM_ESTADO,
+       (SELECT json_group_array(json_object('ID_AUTOR', a.ID_AUTOR, 'NM_AUTOR', a.NM_AUTOR))
+        FROM LIVRO_AUTOR la JOIN AUTOR a ON a.ID_AUTOR = la.ID_AUTOR
+        WHERE la.ID_LIVRO = l.ID_LIVRO) AS AUTORES,
+       (SELECT json_group_array(json_object('ID_CATEGORIA', ct.ID_CATEGORIA, 'NM_CATEGORIA', ct.NM_CATEGORIA))
+        FROM LIVRO_CATEGORIA lc JOIN CATEGORIA ct ON ct.ID_CATEGORIA = lc.ID_CATEGORIA
+        WHERE lc.ID_LIVRO = l.ID_LIVRO) AS CATEGORIAS
+FROM LIVRO l
+JOIN BAIRRO b ON l.CEP = b.CEP
+JOIN CIDADE c ON b.ID_CIDADE = c.ID_CIDADE
+JOIN ESTADO e ON c.ID_ESTADO = e.ID_ESTADO;
+
+-- Same columns, same order as the view (rows are copied with SELECT *)
+CREATE TABLE LIVRO_LISTAGEM (
+    ID_LIVRO INTEGER PRIMARY KEY,
+    NM_LIVRO TEXT NOT NULL,
+    PRECO REAL NOT NULL,
+    PAGAMENTO_ELETRONICO TEXT NOT NULL,
+    PAGAMENTO_DINHEIRO TEXT NOT NULL,
+    ENTREGA_PRESENCIAL TEXT NOT NULL,
+    ENTREGA_DELIVERY TEXT NOT NULL,
+    HASH_IMG_LIVRO TEXT,
+    CEP INTEGER NOT NULL,
+    LOGIN_COMPRADOR TEXT NOT NULL,
+    LOGIN_VENDEDOR TEXT NOT NULL,
+    NM_BAIRRO TEXT NOT NULL,
+    ID_CIDADE INTEGER NOT NULL,
+    NM_CIDADE TEXT NOT NULL,
+    ID_ESTADO INTEGER NOT NULL,
+    NM_ESTADO TEXT NOT NULL,
+    AUTORES TEXT NOT NULL,    -- JSON array of {ID_AUTOR, NM_AUTOR}
+    CATEGORIAS TEXT NOT NULL  -- JSON array of {ID_CATEGORIA, NM_CATEGORIA}
+);
+
+-- Book rows
+CREATE TRIGGER trg_listagem_livro_insert AFTER INSERT ON LIVRO BEGIN
+    INSERT OR REPLACE INTO LIVRO_LISTAGEM SELECT * FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_LIVRO = NEW.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_listagem_livro_update AFTER UPDATE OF
+    NM_LIVRO, PRECO, PAGAMENTO_ELETRONICO, PAGAMENTO_DINHEIRO, ENTREGA_PRESENCIAL, ENTREGA_DELIVERY,
+    HASH_IMG_LIVRO, CEP, LOGIN_COMPRADOR, LOGIN_VENDEDOR ON LIVRO BEGIN
+    INSERT OR REPLACE INTO LIVRO_LISTAGEM SELECT * FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_LIVRO = NEW.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_listagem_livro_delete AFTER DELETE ON LIVRO BEGIN
+    DELETE FROM LIVRO_LISTAGEM WHERE ID_LIVRO = OLD.ID_LIVRO;
+END;
+
+-- Author/category lists (only the JSON column is recomputed)
+CREATE TRIGGER trg_listagem_livro_autor_insert AFTER INSERT ON LIVRO_AUTOR BEGIN
+    UPDATE LIVRO_LISTAGEM SET AUTORES = (
+        SELECT AUTORES FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_LIVRO = NEW.ID_LIVRO
+    ) WHERE ID_LIVRO = NEW.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_listagem_livro_autor_delete AFTER DELETE ON LIVRO_AUTOR BEGIN
+    UPDATE LIVRO_LISTAGEM SET AUTORES = (
+        SELECT AUTORES FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_LIVRO = OLD.ID_LIVRO
+    ) WHERE ID_LIVRO = OLD.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_listagem_livro_categoria_insert AFTER INSERT ON LIVRO_CATEGORIA BEGIN
+    UPDATE LIVRO_LISTAGEM SET CATEGORIAS = (
+        SELECT CATEGORIAS FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_LIVRO = NEW.ID_LIVRO
+    ) WHERE ID_LIVRO = NEW.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_listagem_livro_categoria_delete AFTER DELETE ON LIVRO_CATEGORIA BEGIN
+    UPDATE LIVRO_LISTAGEM SET CATEGORIAS = (
+        SELECT CATEGORIAS FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_LIVRO = OLD.ID_LIVRO
+    ) WHERE ID_LIVRO = OLD.ID_LIVRO;
+END;
+
+CREATE TRIGGER trg_listagem_autor_update AFTER UPDATE OF NM_AUTOR ON AUTOR BEGIN
+    UPDATE LIVRO_LISTAGEM SET AUTORES = (
+        SELECT o.AUTORES FROM LIVRO_LISTAGEM_ORIGEM o WHERE o.ID_LIVRO = LIVRO_LISTAGEM.ID_LIVRO
+    ) WHERE ID_LIVRO IN (SELECT ID_LIVRO FROM LIVRO_AUTOR WHERE ID_AUTOR = NEW.ID_AUTOR);
+END;
+
+CREATE TRIGGER trg_listagem_categoria_update AFTER UPDATE OF NM_CATEGORIA ON CATEGORIA BEGIN
+    UPDATE LIVRO_LISTAGEM SET CATEGORIAS = (
+        SELECT o.CATEGORIAS FROM LIVRO_LISTAGEM_ORIGEM o WHERE o.ID_LIVRO = LIVRO_LISTAGEM.ID_LIVRO
+    ) WHERE ID_LIVRO IN (SELECT ID_LIVRO FROM LIVRO_CATEGORIA WHERE ID_CATEGORIA = NEW.ID_CATEGORIA);
+END;
+
+-- Location names (renames are rare; the affected rows are copied again)
+CREATE TRIGGER trg_listagem_bairro_update AFTER UPDATE OF NM_BAIRRO, ID_CIDADE ON BAIRRO BEGIN
+    INSERT OR REPLACE INTO LIVRO_LISTAGEM SELECT * FROM LIVRO_LISTAGEM_ORIGEM WHERE CEP = NEW.CEP;
+END;
+
+CREATE TRIGGER trg_listagem_cidade_update AFTER UPDATE OF NM_CIDADE, ID_ESTADO ON CIDADE BEGIN
+    INSERT OR REPLACE INTO LIVRO_LISTAGEM SELECT * FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_CIDADE = NEW.ID_CIDADE;
+END;
+
+CREATE TRIGGER trg_listagem_estado_update AFTER UPDATE OF NM_ESTADO ON ESTADO BEGIN
+    INSERT OR REPLACE INTO LIVRO_LISTAGEM SELECT * FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_ESTADO = NEW.ID_ESTADO;
+END;
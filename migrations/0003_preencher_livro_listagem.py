@@ -0,0 +1,46 @@
+"""
+Migration 0003: fill LIVRO_LISTAGEM from the existing books, then build its indexes
+
+The listing indexes on LIVRO are dropped at the end: listings, filters and search now read
+LIVRO_LISTAGEM, and each LIVRO index would only slow down writes.
+"""
+
+LOTE = 5000
+
+INDICES = [
+    'CREATE INDEX IF NOT EXISTS idx_listagem_nome ON LIVRO_LISTAGEM(NM_LIVRO, ID_LIVRO)',
+    'CREATE INDEX IF NOT EXISTS idx_listagem_cep_nome ON LIVRO_LISTAGEM(CEP, NM_LIVRO, ID_LIVRO)',
+    'CREATE INDEX IF NOT EXISTS idx_listagem_cidade_nome ON LIVRO_LISTAGEM(ID_CIDADE, NM_LIVRO, ID_LIVRO)',
+    'CREATE INDEX IF NOT EXISTS idx_listagem_estado_nome ON LIVRO_LISTAGEM(ID_ESTADO, NM_LIVRO, ID_LIVRO)',
+    'CREATE INDEX IF NOT EXISTS idx_listagem_preco ON LIVRO_LISTAGEM(PRECO)',
+    'CREATE INDEX IF NOT EXISTS idx_listagem_eletronico_nome ON LIVRO_LISTAGEM(PAGAMENTO_ELETRONICO, NM_LIVRO, ID_LIVRO)',
+    'CREATE INDEX IF NOT EXISTS idx_listagem_dinheiro_nome ON LIVRO_LISTAGEM(PAGAMENTO_DINHEIRO, NM_LIVRO, ID_LIVRO)',
+    'CREATE INDEX IF NOT EXISTS idx_listagem_presencial_nome ON LIVRO_LISTAGEM(ENTREGA_PRESENCIAL, NM_LIVRO, ID_LIVRO)',
+    'CREATE INDEX IF NOT EXISTS idx_listagem_delivery_nome ON LIVRO_LISTAGEM(ENTREGA_DELIVERY, NM_LIVRO, ID_LIVRO)',
+]
+
+INDICES_LIVRO = [
+    'idx_livro_nome', 'idx_livro_cep_nome', 'idx_livro_preco', 'idx_livro_eletronico_nome',
+    'idx_livro_dinheiro_nome', 'idx_livro_presencial_nome', 'idx_livro_delivery_nome',
+]
+
+
+def upgrade(db, progresso):
+    ultimo = progresso or 0
+    while True:
+        ids = db.execute('SELECT ID_LIVRO FROM LIVRO WHERE ID_LIVRO > ? ORDER BY ID_LIVRO LIMIT ?',
+                         (ultimo, LOTE)).fetchall()
+        if not ids:
+            break
+        # OR REPLACE: books already copied by the triggers between batches
+        db.execute('''
+            INSERT OR REPLACE INTO LIVRO_LISTAGEM
+            SELECT * FROM LIVRO_LISTAGEM_ORIGEM WHERE ID_LIVRO BETWEEN ? AND ?
+        ''', (ids[0][0], ids[-1][0]))
+        ultimo = ids[-1][0]
+        yield ultimo
+
+    for sql in INDICES:
+        db.execute(sql)
+    for nome in INDICES_LIVRO:
+        db.execute(f'DROP INDEX IF EXISTS {nome}')
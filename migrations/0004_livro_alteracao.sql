@@ -0,0 +1,36 @@
+-- Migration 0004: change feed of book listings for client-side sync (GET /livros/changes)
+
+-- One row per book: its last change. Every change replaces the book's row with a new,
+-- higher SEQ (AUTOINCREMENT never reuses a value), so a client that stored the highest
+-- SEQ it has seen asks only for rows above it. REMOVIDO = 'S' marks a deleted book
+CREATE TABLE LIVRO_ALTERACAO (
+    SEQ INTEGER PRIMARY KEY AUTOINCREMENT,
+    ID_LIVRO INTEGER NOT NULL UNIQUE,
+    REMOVIDO TEXT NOT NULL DEFAULT 'N' CHECK(REMOVIDO IN ('S', 'N')),
+    ALTERADO_EM INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+);
+
+-- Highest SEQ removed by compact-changes: a client behind it may have missed a deletion
+-- and must sync again from the start
+CREATE TABLE LIVRO_ALTERACAO_LIMITE (
+    ID INTEGER PRIMARY KEY CHECK(ID = 1),
+    SEQ INTEGER NOT NULL
+);
+
+INSERT INTO LIVRO_ALTERACAO_LIMITE (ID, SEQ) VALUES (1, 0);
+
+-- LIVRO_LISTAGEM is already rewritten by the triggers on LIVRO, LIVRO_AUTOR, LIVRO_CATEGORIA,
+-- AUTOR, CATEGORIA and the location tables, so logging its writes covers all of them
+CREATE TRIGGER trg_alteracao_listagem_insert AFTER INSERT ON LIVRO_LISTAGEM BEGIN
+    INSERT OR REPLACE INTO LIVRO_ALTERACAO (ID_LIVRO, REMOVIDO) VALUES (NEW.ID_LIVRO, 'N');
+END;
+
+CREATE TRIGGER trg_alteracao_listagem_update AFTER UPDATE ON LIVRO_LISTAGEM BEGIN
+    INSERT OR REPLACE INTO LIVRO_ALTERACAO (ID_LIVRO, REMOVIDO) VALUES (NEW.ID_LIVRO, 'N');
+END;
+
+CREATE TRIGGER trg_alteracao_listagem_delete AFTER DELETE ON LIVRO_LISTAGEM BEGIN
+    INSERT OR REPLACE INTO LIVRO_ALTERACAO (ID_LIVRO, REMOVIDO) VALUES (OLD.ID_LIVRO, 'S');
+END;
+
+CREATE INDEX idx_alteracao_removido ON LIVRO_ALTERACAO(REMOVIDO, ALTERADO_EM);
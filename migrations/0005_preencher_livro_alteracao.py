@@ -0,0 +1,22 @@
+"""
+Migration 0005: log every existing book as changed, so a client syncing from since=0
+receives the whole catalog through GET /livros/changes
+"""
+
+LOTE = 5000
+
+
+def upgrade(db, progresso):
+    ultimo = progresso or 0
+    while True:
+        ids = db.execute('SELECT ID_LIVRO FROM LIVRO_LISTAGEM WHERE ID_LIVRO > ? ORDER BY ID_LIVRO LIMIT ?',
+                         (ultimo, LOTE)).fetchall()
+        if not ids:
+            return
+        # OR IGNORE: books changed between batches already have a newer entry
+        db.execute('''
+            INSERT OR IGNORE INTO LIVRO_ALTERACAO (ID_LIVRO)
+            SELECT ID_LIVRO FROM LIVRO_LISTAGEM WHERE ID_LIVRO BETWEEN ? AND ? ORDER BY ID_LIVRO
+        ''', (ids[0][0], ids[-1][0]))
+        ultimo = ids[-1][0]
+        yield ultimo
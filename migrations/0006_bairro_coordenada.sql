@@ -0,0 +1,17 @@
+-- Migration 0006: optional coordinates per BAIRRO for proximity search (GET /livros/proximos)
+
+-- R*Tree over points (MIN = MAX). The box columns are 32-bit floats rounded outwards,
+-- good only for the bounding-box prefilter; the exact values used for the distance are
+-- kept in the auxiliary columns
+CREATE VIRTUAL TABLE BAIRRO_COORDENADA USING rtree(
+    CEP,
+    MIN_LAT, MAX_LAT,
+    MIN_LON, MAX_LON,
+    +LATITUDE,
+    +LONGITUDE
+);
+
+-- Virtual tables cannot have foreign keys
+CREATE TRIGGER trg_bairro_coordenada_delete AFTER DELETE ON BAIRRO BEGIN
+    DELETE FROM BAIRRO_COORDENADA WHERE CEP = OLD.CEP;
+END;
@@ -0,0 +1,83 @@
+-- Migration 0007: facet counters for catalog navigation (GET /livros/facetas)
+
+-- Number of books per facet value: categoria/estado/cidade ids, 'S'/'N' for the payment and
+-- delivery flags, and a single 'total' row (VALOR 0). Reading every facet costs O(facet values)
+CREATE TABLE LIVRO_FACETA (
+    FACETA TEXT NOT NULL,
+    VALOR NOT NULL,
+    TOTAL INTEGER NOT NULL,
+    PRIMARY KEY (FACETA, VALOR)
+) WITHOUT ROWID;
+
+-- Facet values of each book, one row per (book, facet). The triggers read it for a single book
+-- (the ID_LIVRO filter is pushed into every branch)
+CREATE VIEW LIVRO_FACETA_ORIGEM AS
+SELECT ID_LIVRO, 'total' AS FACETA, 0 AS VALOR FROM LIVRO_LISTAGEM
+UNION ALL SELECT ID_LIVRO, 'estado', ID_ESTADO FROM LIVRO_LISTAGEM
+UNION ALL SELECT ID_LIVRO, 'cidade', ID_CIDADE FROM LIVRO_LISTAGEM
+UNION ALL SELECT ID_LIVRO, 'pagamento_eletronico', PAGAMENTO_ELETRONICO FROM LIVRO_LISTAGEM
+UNION ALL SELECT ID_LIVRO, 'pagamento_dinheiro', PAGAMENTO_DINHEIRO FROM LIVRO_LISTAGEM
+UNION ALL SELECT ID_LIVRO, 'entrega_presencial', ENTREGA_PRESENCIAL FROM LIVRO_LISTAGEM
+UNION ALL SELECT ID_LIVRO, 'entrega_delivery', ENTREGA_DELIVERY FROM LIVRO_LISTAGEM
+UNION ALL SELECT l.ID_LIVRO, 'categoria', json_extract(c.value, '$.ID_CATEGORIA')
+          FROM LIVRO_LISTAGEM l, json_each(l.CATEGORIAS) c;
+
+-- Counted on LIVRO_LISTAGEM: its triggers already follow LIVRO, LIVRO_CATEGORIA and books moved
+-- between cities/states. A row leaves the counts before it changes and enters them after.
+-- INSERT OR REPLACE deletes the old row without firing DELETE triggers, hence BEFORE INSERT
+CREATE TRIGGER trg_faceta_listagem_replace BEFORE INSERT ON LIVRO_LISTAGEM BEGIN
+    UPDATE LIVRO_FACETA SET TOTAL = TOTAL - 1 WHERE (FACETA, VALOR) IN (
+        SELECT FACETA, VALOR FROM LIVRO_FACETA_ORIGEM WHERE ID_LIVRO = NEW.ID_LIVRO);
+END;
+
+CREATE TRIGGER trg_faceta_listagem_insert AFTER INSERT ON LIVRO_LISTAGEM BEGIN
+    INSERT INTO LIVRO_FACETA (FACETA, VALOR, TOTAL)
+    SELECT FACETA, VALOR, 1 FROM LIVRO_FACETA_ORIGEM WHERE ID_LIVRO = NEW.ID_LIVRO
+    ON CONFLICT (FACETA, VALOR) DO UPDATE SET TOTAL = TOTAL + 1;
+END;
+
+CREATE TRIGGER trg_faceta_listagem_delete BEFORE DELETE ON LIVRO_LISTAGEM BEGIN
+    UPDATE LIVRO_FACETA SET TOTAL = TOTAL - 1 WHERE (FACETA, VALOR) IN (
+        SELECT FACETA, VALOR FROM LIVRO_FACETA_ORIGEM WHERE ID_LIVRO = OLD.ID_LIVRO);
+END;
+
+-- Author changes also update LIVRO_LISTAGEM but do not touch any facet
+CREATE TRIGGER trg_faceta_listagem_update_before BEFORE UPDATE OF
+    ID_ESTADO, ID_CIDADE, PAGAMENTO_ELETRONICO, PAGAMENTO_DINHEIRO, ENTREGA_PRESENCIAL, ENTREGA_DELIVERY,
+    CATEGORIAS ON LIVRO_LISTAGEM BEGIN
+    UPDATE LIVRO_FACETA SET TOTAL = TOTAL - 1 WHERE (FACETA, VALOR) IN (
+        SELECT FACETA, VALOR FROM LIVRO_FACETA_ORIGEM WHERE ID_LIVRO = OLD.ID_LIVRO);
+END;
+
+CREATE TRIGGER trg_faceta_listagem_update_after AFTER UPDATE OF
+    ID_ESTADO, ID_CIDADE, PAGAMENTO_ELETRONICO, PAGAMENTO_DINHEIRO, ENTREGA_PRESENCIAL, ENTREGA_DELIVERY,
+    CATEGORIAS ON LIVRO_LISTAGEM BEGIN
+    INSERT INTO LIVRO_FACETA (FACETA, VALOR, TOTAL)
+    SELECT FACETA, VALOR, 1 FROM LIVRO_FACETA_ORIGEM WHERE ID_LIVRO = NEW.ID_LIVRO
+    ON CONFLICT (FACETA, VALOR) DO UPDATE SET TOTAL = TOTAL + 1;
+END;
+
+-- Initial counts, one facet at a time over the listing indexes (same transaction as the triggers)
+INSERT INTO LIVRO_FACETA (FACETA, VALOR, TOTAL) SELECT 'total', 0, COUNT(*) FROM LIVRO_LISTAGEM;
+INSERT INTO LIVRO_FACETA (FACETA, VALOR, TOTAL)
+SELECT 'estado', ID_ESTADO, COUNT(*) FROM LIVRO_LISTAGEM GROUP BY ID_ESTADO;
+INSERT INTO LIVRO_FACETA (FACETA, VALOR, TOTAL)
+SELECT 'cidade', ID_CIDADE, COUNT(*) FROM LIVRO_LISTAGEM GROUP BY ID_CIDADE;
+INSERT INTO LIVRO_FACETA (FACETA, VALOR, TOTAL)
+SELECT 'pagamento_eletronico', PAGAMENTO_ELETRONICO, COUNT(*) FROM LIVRO_LISTAGEM GROUP BY PAGAMENTO_ELETRONICO;
+INSERT INTO LIVRO_FACETA (FACETA, VALOR, TOTAL)
+SELECT 'pagamento_dinheiro', PAGAMENTO_DINHEIRO, COUNT(*) FROM LIVRO_LISTAGEM GROUP BY PAGAMENTO_DINHEIRO;
+INSERT INTO LIVRO_FACETA (FACETA, VALOR, TOTAL)
+SELECT 'entrega_presencial', ENTREGA_PRESENCIAL, COUNT(*) FROM LIVRO_LISTAGEM GROUP BY ENTREGA_PRESENCIAL;
+INSERT INTO LIVRO_FACETA (FACETA, VALOR, TOTAL)
+SELECT 'entrega_delivery', ENTREGA_DELIVERY, COUNT(*) FROM LIVRO_LISTAGEM GROUP BY ENTREGA_DELIVERY;
+INSERT INTO LIVRO_FACETA (FACETA, VALOR, TOTAL)
+SELECT 'categoria', ID_CATEGORIA, COUNT(*) FROM LIVRO_CATEGORIA
+WHERE ID_LIVRO IN (SELECT ID_LIVRO FROM LIVRO_LISTAGEM)
+GROUP BY ID_CATEGORIA;
+
+-- Scoped facets (filters or a search) are aggregated over the filtered books in one pass. This
+-- index holds the facet and filter columns, so the pass skips the wide listing rows
+CREATE INDEX idx_listagem_faceta ON LIVRO_LISTAGEM(
+    ID_ESTADO, ID_CIDADE, PAGAMENTO_ELETRONICO, PAGAMENTO_DINHEIRO, ENTREGA_PRESENCIAL, ENTREGA_DELIVERY,
+    PRECO, CEP);
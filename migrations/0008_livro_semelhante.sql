@@ -0,0 +1,46 @@
+-- Migration 0008: precomputed "similar books" lists (GET /livros/{id}/semelhantes)
+
+-- Top LIVROS_SEMELHANTES_K neighbours of each book and their similarity. Filled by
+-- rebuild-semelhantes (whole catalog) and kept up to date by the app from LIVRO_SEMELHANTE_PENDENTE.
+-- Reading a book's list is a single range of the primary key
+CREATE TABLE LIVRO_SEMELHANTE (
+    ID_LIVRO INTEGER NOT NULL,
+    ID_SEMELHANTE INTEGER NOT NULL,
+    SIMILARIDADE REAL NOT NULL,
+    PRIMARY KEY (ID_LIVRO, ID_SEMELHANTE)
+) WITHOUT ROWID;
+
+-- Lists that contain a book: re-scored when it changes, cleaned when it is deleted
+CREATE INDEX idx_semelhante_reverso ON LIVRO_SEMELHANTE(ID_SEMELHANTE);
+
+-- Books whose attributes changed since their list was computed
+CREATE TABLE LIVRO_SEMELHANTE_PENDENTE (
+    ID_LIVRO INTEGER PRIMARY KEY
+);
+
+-- Only the model attributes mark a book: price, city/state and the author/category ids
+-- (renaming an author or a category rewrites AUTORES/CATEGORIAS but keeps the ids)
+CREATE TRIGGER trg_semelhante_listagem_insert AFTER INSERT ON LIVRO_LISTAGEM BEGIN
+    INSERT OR IGNORE INTO LIVRO_SEMELHANTE_PENDENTE (ID_LIVRO) VALUES (NEW.ID_LIVRO);
+END;
+
+CREATE TRIGGER trg_semelhante_listagem_update AFTER UPDATE OF
+    PRECO, ID_CIDADE, ID_ESTADO, AUTORES, CATEGORIAS ON LIVRO_LISTAGEM
+WHEN OLD.PRECO IS NOT NEW.PRECO OR OLD.ID_CIDADE IS NOT NEW.ID_CIDADE OR OLD.ID_ESTADO IS NOT NEW.ID_ESTADO
+    OR (SELECT group_concat(json_extract(value, '$.ID_AUTOR')) FROM json_each(OLD.AUTORES))
+       IS NOT (SELECT group_concat(json_extract(value, '$.ID_AUTOR')) FROM json_each(NEW.AUTORES))
+    OR (SELECT group_concat(json_extract(value, '$.ID_CATEGORIA')) FROM json_each(OLD.CATEGORIAS))
+       IS NOT (SELECT group_concat(json_extract(value, '$.ID_CATEGORIA')) FROM json_each(NEW.CATEGORIAS))
+BEGIN
+    INSERT OR IGNORE INTO LIVRO_SEMELHANTE_PENDENTE (ID_LIVRO) VALUES (NEW.ID_LIVRO);
+END;
+
+-- A deleted book leaves its own list and the lists that pointed to it; those are marked to be
+-- refilled
+CREATE TRIGGER trg_semelhante_listagem_delete AFTER DELETE ON LIVRO_LISTAGEM BEGIN
+    DELETE FROM LIVRO_SEMELHANTE_PENDENTE WHERE ID_LIVRO = OLD.ID_LIVRO;
+    DELETE FROM LIVRO_SEMELHANTE WHERE ID_LIVRO = OLD.ID_LIVRO;
+    INSERT OR IGNORE INTO LIVRO_SEMELHANTE_PENDENTE (ID_LIVRO)
+    SELECT ID_LIVRO FROM LIVRO_SEMELHANTE WHERE ID_SEMELHANTE = OLD.ID_LIVRO;
+    DELETE FROM LIVRO_SEMELHANTE WHERE ID_SEMELHANTE = OLD.ID_LIVRO;
+END;
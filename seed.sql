@@ -0,0 +1,50 @@
+-- Sample data for development and testing (loaded by "flask seed" or by
+-- "python app.py" when the database is empty)
+
+-- Estados
+INSERT INTO ESTADO (NM_ESTADO) VALUES ('São Paulo');
+INSERT INTO ESTADO (NM_ESTADO) VALUES ('Rio de Janeiro');
+INSERT INTO ESTADO (NM_ESTADO) VALUES ('Minas Gerais');
+
+-- Cidades
+INSERT INTO CIDADE (NM_CIDADE, ID_ESTADO) VALUES ('São Paulo', 1);
+INSERT INTO CIDADE (NM_CIDADE, ID_ESTADO) VALUES ('Campinas', 1);
+INSERT INTO CIDADE (NM_CIDADE, ID_ESTADO) VALUES ('Rio de Janeiro', 2);
+INSERT INTO CIDADE (NM_CIDADE, ID_ESTADO) VALUES ('Belo Horizonte', 3);
+
+-- Bairros
+INSERT INTO BAIRRO (CEP, NM_BAIRRO, ID_CIDADE) VALUES (01310100, 'Centro', 1);
+INSERT INTO BAIRRO (CEP, NM_BAIRRO, ID_CIDADE) VALUES (04038001, 'Vila Olímpia', 1);
+INSERT INTO BAIRRO (CEP, NM_BAIRRO, ID_CIDADE) VALUES (13010111, 'Centro', 2);
+INSERT INTO BAIRRO (CEP, NM_BAIRRO, ID_CIDADE) VALUES (20040020, 'Centro', 3);
+
+-- Usuários
+INSERT INTO USUARIO (LOGIN, SENHA, NM_USUARIO, EMAIL_CONTATO) VALUES 
+    ('joao123', 'senha123', 'João Silva', 'joao@email.com');
+INSERT INTO USUARIO (LOGIN, SENHA, NM_USUARIO, EMAIL_CONTATO) VALUES 
+    ('maria456', 'senha456', 'Maria Santos', 'maria@email.com');
+INSERT INTO USUARIO (LOGIN, SENHA, NM_USUARIO, EMAIL_CONTATO) VALUES 
+    ('pedro789', 'senha789', 'Pedro Oliveira', 'pedro@email.com');
+
+-- Autores
+INSERT INTO AUTOR (NM_AUTOR) VALUES ('Machado de Assis');
+INSERT INTO AUTOR (NM_AUTOR) VALUES ('Clarice Lispector');
+INSERT INTO AUTOR (NM_AUTOR) VALUES ('José de Alencar');
+INSERT INTO AUTOR (NM_AUTOR) VALUES ('Paulo Coelho');
+INSERT INTO AUTOR (NM_AUTOR) VALUES ('Rick Riodan');
+
+-- Categorias (usando placeholder para imagens)
+INSERT INTO CATEGORIA (NM_CATEGORIA, IMG_CATEGORIA) VALUES 
+    ('Literatura Brasileira', X'89504E470D0A1A0A0000000D49484452');
+INSERT INTO CATEGORIA (NM_CATEGORIA, IMG_CATEGORIA) VALUES 
+    ('Romance', X'89504E470D0A1A0A0000000D49484452');
+INSERT INTO CATEGORIA (NM_CATEGORIA, IMG_CATEGORIA) VALUES 
+    ('Ficção', X'89504E470D0A1A0A0000000D49484452');
+INSERT INTO CATEGORIA (NM_CATEGORIA, IMG_CATEGORIA) VALUES 
+    ('Autoajuda', X'89504E470D0A1A0A0000000D49484452');
+
+-- Livros
+INSERT INTO LIVRO (nm_livro, preco, pagamento_eletronico, pagamento_dinheiro, entrega_presencial, entrega_delivery, img_livro, cep, login_vendedor, LOGIN_COMPRADOR) VALUES 
+    ('Percy Jackson', 50.60, 'S', 'S', 'S', 'N', X'89504E470D0A1A0A0000000D49484452', 04038001, "maria456", "pedro789");
+INSERT INTO LIVRO (nm_livro, preco, pagamento_eletronico, pagamento_dinheiro, entrega_presencial, entrega_delivery, img_livro, cep, login_vendedor, LOGIN_COMPRADOR) VALUES 
+    ('Quincas Borba', 20.13, 'S', 'N', 'S', 'N', X'89504E470D0A1A0A0000000D49484452', 04038001, "pedro789", "maria456");
\ No newline at end of file
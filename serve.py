@@ -0,0 +1,125 @@
+"""
+Servidor de produção (gunicorn com workers pré-criados)
+
+    python serve.py --workers 4 --threads 8
+    python serve.py --workers 4 --gevent    # muitas conexões abertas em /eventos/livros
+"""
+
+import os
+import sys
+
+# Sem FLASK_CONFIG explícito, o servidor de produção usa ProductionConfig
+os.environ.setdefault('FLASK_CONFIG', 'production')
+
+# Com --gevent, threads, locks, filas e sockets precisam ser cooperativos antes de o app
+# criar os seus no import (os workers herdam o app já carregado)
+if '--gevent' in sys.argv:
+    from gevent import monkey
+    monkey.patch_all()
+
+import glob
+import tempfile
+import threading
+import time
+
+import click
+from gunicorn.app.base import BaseApplication
+
+import app as api
+
+
+class Server(BaseApplication):
+    """Aplicação gunicorn com as opções definidas aqui, sem arquivo de configuração"""
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return api.app
+
+
+## worker pronto, antes de aceitar conexões: abre as conexões do pool e preenche o cache
+def post_worker_init(worker):
+    api.warm_up()
+    threading.Thread(target=close_event_streams, args=(worker,), name='fim-eventos', daemon=True).start()
+    worker.log.info('Worker %s aquecido', worker.pid)
+
+
+## worker parou de aceitar conexões (sinal ou max_requests): encerra as conexões de /eventos/livros,
+## que nunca terminam sozinhas, para o desligamento não esperar o graceful_timeout inteiro
+def close_event_streams(worker):
+    while worker.alive:
+        time.sleep(1)
+    api.livro_events.close()
+
+
+## worker saindo (reciclado ou no desligamento): termina escritas e miniaturas e fecha as conexões
+def worker_exit(server, worker):
+    api.shutdown()
+
+
+@click.command()
+@click.option('--bind', default='0.0.0.0:5000', show_default=True, help='Endereço e porta')
+@click.option('--workers', type=int, default=os.cpu_count() or 1, show_default=True,
+              help='Processos de trabalho')
+@click.option('--threads', type=int, default=4, show_default=True, help='Threads por processo')
+@click.option('--gevent', is_flag=True,
+              help='Workers gevent: cada conexão é uma greenlet (conexões ociosas de /eventos/livros não ocupam threads)')
+@click.option('--conexoes', type=int, default=1000, show_default=True,
+              help='Conexões simultâneas por processo com --gevent')
+@click.option('--max-requests', type=int, default=1000, show_default=True,
+              help='Requisições até o worker ser reciclado (0 desliga)')
+@click.option('--graceful-timeout', type=int, default=30, show_default=True,
+              help='Segundos para terminar as requisições em andamento ao desligar')
+def serve(bind, workers, threads, gevent, conexoes, max_requests, graceful_timeout):
+    """Inicia a API com workers pré-criados"""
+    # Migrações pendentes são aplicadas uma vez, no mestre, antes dos workers existirem
+    # (sem dados de exemplo; em banco atualizado é só uma consulta)
+    api.migrate_db()
+    # Conexões abertas no processo mestre não podem ser herdadas pelos workers
+    api.read_pool.close_idle()
+    api.write_coordinator.close()
+    # /metrics soma os snapshots dos workers: sem METRICS_DIR, usa um diretório temporário
+    if not api.app.config['METRICS_DIR']:
+        api.app.config['METRICS_DIR'] = tempfile.mkdtemp(prefix='biblioteca-metrics-')
+    # Snapshots de uma execução anterior não entram na soma (os contadores recomeçam do zero)
+    for path in glob.glob(os.path.join(api.app.config['METRICS_DIR'], 'metrics_*.json')):
+        os.remove(path)
+
+    if gevent:
+        worker_class = 'gevent'
+        sse_max = conexoes
+    else:
+        # Cada conexão de /eventos/livros fica com uma thread: metade sobra para as demais rotas.
+        # Com uma thread só, não sobraria nenhuma para os eventos (e o worker sync seria morto pelo
+        # timeout no meio de um stream)
+        if threads < 2:
+            raise click.UsageError('--threads deve ser pelo menos 2 sem --gevent (uma thread para /eventos/livros)')
+        worker_class = 'gthread'
+        sse_max = threads // 2
+    api.app.config['SSE_MAX_SUBSCRIBERS'] = min(api.app.config['SSE_MAX_SUBSCRIBERS'], sse_max)
+
+    Server({
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        'worker_class': worker_class,
+        'worker_connections': conexoes,
+        # App importado uma vez no mestre; os workers herdam o código já carregado
+        'preload_app': True,
+        # Jitter evita que todos os workers reciclem ao mesmo tempo
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests // 10,
+        'graceful_timeout': graceful_timeout,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+    }).run()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,484 @@
+"""
+Benchmark da API: gera um banco sintético e mede vazão e latência por endpoint
+
+    python test/benchmark.py gerar bench.db --escala 0.02
+    python test/benchmark.py executar bench.db --alvo cliente --threads 8 --duracao 30
+    python test/benchmark.py executar bench.db --alvo servidor --workers 4 --threads 16
+    python test/benchmark.py comparar antes.json depois.json
+
+Com --escala 1 o banco tem o tamanho de produção (1M livros, 900 mil bairros). Cada execução
+roda sobre uma cópia do banco, então execuções seguidas partem dos mesmos dados.
+"""
+
+import base64
+import http.client
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+from datetime import datetime, timezone
+
+import click
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Tamanho do banco com --escala 1
+ESCALA_COMPLETA = {
+    'cidades': 5570,
+    'bairros': 900000,
+    'usuarios': 200000,
+    'autores': 100000,
+    'livros': 1000000,
+}
+
+ESTADOS = [
+    'Acre', 'Alagoas', 'Amapá', 'Amazonas', 'Bahia', 'Ceará', 'Distrito Federal', 'Espírito Santo',
+    'Goiás', 'Maranhão', 'Mato Grosso', 'Mato Grosso do Sul', 'Minas Gerais', 'Pará', 'Paraíba',
+    'Paraná', 'Pernambuco', 'Piauí', 'Rio de Janeiro', 'Rio Grande do Norte', 'Rio Grande do Sul',
+    'Rondônia', 'Roraima', 'Santa Catarina', 'São Paulo', 'Sergipe', 'Tocantins',
+]
+
+SILABAS = ['ba', 'be', 'ca', 'co', 'da', 'de', 'fa', 'go', 'la', 'li', 'ma', 'mo', 'na', 'ne', 'pa',
+           'po', 'ra', 'ri', 'sa', 'so', 'ta', 'te', 'va', 'vi', 'za', 'lu', 'nu', 'tu', 'ção', 'lhe']
+
+CATEGORIAS = 60  # nao acompanha a escala
+
+LOTE = 10000
+
+
+# ==================== GERADOR ====================
+
+## vocabulario deterministico de palavras inventadas (titulos e nomes)
+def vocabulario(rng, tamanho):
+    palavras = set()
+    while len(palavras) < tamanho:
+        palavras.add(''.join(rng.choice(SILABAS) for _ in range(rng.randint(2, 4))))
+    return sorted(palavras)
+
+## indice com distribuicao concentrada nos primeiros (poucos autores/categorias com muitos livros)
+def popular(rng, total):
+    return int(total * rng.random() ** 3)
+
+## JPEG com blocos de cor aleatorios; o tamanho do arquivo fica proximo de uma capa real
+def gerar_jpeg(rng, largura, altura, bloco):
+    pequena = Image.new('RGB', (largura // bloco, altura // bloco))
+    pequena.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+                     for _ in range(pequena.width * pequena.height)])
+    buffer = io.BytesIO()
+    pequena.resize((largura, altura), Image.NEAREST).save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+def inserir_em_lotes(db, sql, linhas):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == LOTE:
+            db.executemany(sql, lote)
+            lote = []
+    if lote:
+        db.executemany(sql, lote)
+
+@click.group()
+def cli():
+    """Benchmark da API"""
+
+@cli.command()
+@click.argument('banco')
+@click.option('--escala', type=float, default=0.02, show_default=True,
+              help='Fração do tamanho de produção (1 = 1M livros, 900 mil bairros)')
+@click.option('--semente', type=int, default=42, show_default=True)
+@click.option('--capas', type=float, default=0.01, show_default=True,
+              help='Fração dos livros com capa de tamanho real (os demais têm imagem pequena)')
+def gerar(banco, escala, semente, capas):
+    """Cria BANCO com as migrações e o preenche com dados sintéticos determinísticos"""
+    if os.path.exists(banco):
+        raise click.ClickException(f'{banco} já existe')
+    os.environ['DATABASE_PATH'] = banco
+    import app as api
+    api.migrate_db()
+    api.read_pool.close_idle()
+    api.write_coordinator.close()
+
+    rng = random.Random(semente)
+    n = {nome: max(1, int(total * escala)) for nome, total in ESCALA_COMPLETA.items()}
+    n['categorias'] = CATEGORIAS
+    palavras = vocabulario(rng, 5000)
+    inicio = time.perf_counter()
+
+    db = sqlite3.connect(banco)
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = OFF')
+    db.execute('BEGIN')
+
+    db.executemany('INSERT INTO ESTADO (ID_ESTADO, NM_ESTADO) VALUES (?, ?)', enumerate(ESTADOS, 1))
+    inserir_em_lotes(db, 'INSERT INTO CIDADE (ID_CIDADE, NM_CIDADE, ID_ESTADO) VALUES (?, ?, ?)',
+                     ((i, f'{rng.choice(palavras).title()} {rng.choice(palavras).title()}',
+                       rng.randint(1, len(ESTADOS))) for i in range(1, n['cidades'] + 1)))
+    # CEPs distintos, espalhados pela faixa de 8 digitos
+    ceps = sorted(rng.sample(range(1000000, 99999999), n['bairros']))
+    inserir_em_lotes(db, 'INSERT INTO BAIRRO (CEP, NM_BAIRRO, ID_CIDADE) VALUES (?, ?, ?)',
+                     ((cep, f'{rng.choice(palavras).title()}', popular(rng, n['cidades']) + 1) for cep in ceps))
+    # Coordenadas em volta do centro da cidade (9 em cada 10 bairros; os demais ficam para a busca
+    # por prefixo de CEP), com gerador proprio para nao mudar o restante dos dados da mesma semente
+    rng_local = random.Random(semente + 1)
+    centros = [(rng_local.uniform(-30, -3), rng_local.uniform(-60, -36)) for _ in range(n['cidades'])]
+    def coordenadas():
+        for cep, id_cidade in db.execute('SELECT CEP, ID_CIDADE FROM BAIRRO'):
+            if rng_local.random() < 0.9:
+                lat = centros[id_cidade - 1][0] + rng_local.gauss(0, 0.08)
+                lon = centros[id_cidade - 1][1] + rng_local.gauss(0, 0.08)
+                yield cep, lat, lat, lon, lon, lat, lon
+    inserir_em_lotes(db, '''
+        INSERT INTO BAIRRO_COORDENADA (CEP, MIN_LAT, MAX_LAT, MIN_LON, MAX_LON, LATITUDE, LONGITUDE)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', list(coordenadas()))
+    inserir_em_lotes(db, 'INSERT INTO USUARIO (LOGIN, SENHA, NM_USUARIO, EMAIL_CONTATO) VALUES (?, ?, ?, ?)',
+                     ((f'usuario{i}', 'senha', f'{rng.choice(palavras).title()} {rng.choice(palavras).title()}',
+                       f'usuario{i}@exemplo.com') for i in range(1, n['usuarios'] + 1)))
+    inserir_em_lotes(db, 'INSERT INTO AUTOR (ID_AUTOR, NM_AUTOR) VALUES (?, ?)',
+                     ((i, f'{rng.choice(palavras).title()} {rng.choice(palavras).title()}')
+                      for i in range(1, n['autores'] + 1)))
+    icone = gerar_jpeg(rng, 128, 128, 16)
+    db.executemany('INSERT INTO CATEGORIA (ID_CATEGORIA, NM_CATEGORIA, IMG_CATEGORIA, HASH_IMG_CATEGORIA) VALUES (?, ?, ?, ?)',
+                   ((i, rng.choice(palavras).title(), icone, api.image_hash(icone))
+                    for i in range(1, n['categorias'] + 1)))
+
+    # Poucas imagens distintas, repetidas: capas reais (~90 KB) e imagens pequenas (~6 KB)
+    grandes = [gerar_jpeg(rng, 600, 900, 20) for _ in range(8)]
+    pequenas = [gerar_jpeg(rng, 120, 180, 12) for _ in range(8)]
+    hashes = {img: api.image_hash(img) for img in grandes + pequenas}
+
+    # Relacoes antes dos livros: o gatilho de insercao em LIVRO ja indexa autores e categorias na busca
+    def relacoes():
+        for id_livro in range(1, n['livros'] + 1):
+            quantidade = 1 if rng.random() < 0.75 else rng.choice((2, 2, 2, 3, 4))
+            for id_autor in {popular(rng, n['autores']) + 1 for _ in range(quantidade)}:
+                yield 'A', id_autor, id_livro
+            for id_categoria in {popular(rng, n['categorias']) + 1 for _ in range(rng.randint(1, 3))}:
+                yield 'C', id_categoria, id_livro
+    autores, categorias = [], []
+    for tipo, chave, id_livro in relacoes():
+        (autores if tipo == 'A' else categorias).append((chave, id_livro))
+    inserir_em_lotes(db, 'INSERT INTO LIVRO_AUTOR (ID_AUTOR, ID_LIVRO) VALUES (?, ?)', autores)
+    inserir_em_lotes(db, 'INSERT INTO LIVRO_CATEGORIA (ID_CATEGORIA, ID_LIVRO) VALUES (?, ?)', categorias)
+
+    def livros():
+        for id_livro in range(1, n['livros'] + 1):
+            img = rng.choice(grandes) if rng.random() < capas else rng.choice(pequenas)
+            yield (id_livro, ' '.join(rng.choice(palavras) for _ in range(rng.randint(2, 5))).capitalize(),
+                   round(min(rng.lognormvariate(3.3, 0.7), 999), 2),
+                   rng.choice('SN'), rng.choice('SN'), rng.choice('SN'), rng.choice('SN'),
+                   img, hashes[img], rng.choice(ceps),
+                   f'usuario{rng.randint(1, n["usuarios"])}', f'usuario{rng.randint(1, n["usuarios"])}')
+    inserir_em_lotes(db, '''
+        INSERT INTO LIVRO (ID_LIVRO, NM_LIVRO, PRECO, PAGAMENTO_ELETRONICO, PAGAMENTO_DINHEIRO,
+                           ENTREGA_PRESENCIAL, ENTREGA_DELIVERY, IMG_LIVRO, HASH_IMG_LIVRO, CEP,
+                           LOGIN_COMPRADOR, LOGIN_VENDEDOR)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', livros())
+
+    db.commit()
+    db.execute('ANALYZE')
+    db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    db.close()
+    click.echo(f"{banco}: {n['livros']} livros, {n['bairros']} bairros, {len(autores)} autorias, "
+               f"{len(categorias)} categorizações em {time.perf_counter() - inicio:.1f}s")
+
+
+# ==================== CARGA ====================
+
+class Carga:
+    """Requisições sorteadas a partir de amostras do banco; cada thread usa o próprio gerador"""
+
+    def __init__(self, banco, escritas):
+        db = sqlite3.connect(banco)
+        self.max_livro = db.execute('SELECT MAX(ID_LIVRO) FROM LIVRO').fetchone()[0]
+        self.max_autor = db.execute('SELECT MAX(ID_AUTOR) FROM AUTOR').fetchone()[0]
+        self.categorias = [r[0] for r in db.execute('SELECT ID_CATEGORIA FROM CATEGORIA')]
+        self.ceps = [r[0] for r in db.execute('SELECT CEP FROM BAIRRO ORDER BY random() LIMIT 2000')]
+        self.logins = [r[0] for r in db.execute('SELECT LOGIN FROM USUARIO ORDER BY random() LIMIT 2000')]
+        self.palavras = sorted({p for r in db.execute('SELECT NM_LIVRO FROM LIVRO ORDER BY random() LIMIT 2000')
+                                for p in r[0].lower().split()})
+        db.close()
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 450), (120, 80, 40)).save(buffer, 'JPEG')
+        self.imagem = base64.b64encode(buffer.getvalue()).decode()
+        self.leituras = [
+            ('GET /livros', 30, lambda r: ('GET', '/livros?limit=50', None)),
+            ('GET /livros?filtros', 10, lambda r: ('GET', f'/livros?preco_max={r.randint(10, 100)}&entrega_delivery=S&limit=50', None)),
+            ('GET /livros?cep', 5, lambda r: ('GET', f'/livros?cep={r.choice(self.ceps)}', None)),
+            ('GET /analytics/precos', 3, lambda r: ('GET', f'/analytics/precos?categoria={r.choice(self.categorias)}&agrupar=estado', None)),
+            ('GET /livros/proximos', 5, lambda r: ('GET', f'/livros/proximos?cep={r.choice(self.ceps)}&raio_km={r.choice((2, 10, 50))}&entrega_delivery=S', None)),
+            ('GET /livros?expand', 5, lambda r: ('GET', '/livros?limit=50&expand=autores,categorias', None)),
+            ('GET /livros/<id>', 25, lambda r: ('GET', f'/livros/{r.randint(1, self.max_livro)}', None)),
+            ('GET /livros/<id>/semelhantes', 5, lambda r: ('GET', f'/livros/{r.randint(1, self.max_livro)}/semelhantes', None)),
+            ('GET /livros/busca', 10, lambda r: ('GET', f'/livros/busca?q={quote(r.choice(self.palavras))}', None)),
+            ('GET /livros/<id>/imagem', 5, lambda r: ('GET', f'/livros/{r.randint(1, self.max_livro)}/imagem', None)),
+            ('GET /bairros/<cep>', 5, lambda r: ('GET', f'/bairros/{r.choice(self.ceps)}', None)),
+            ('GET /categorias', 5, lambda r: ('GET', '/categorias', None)),
+        ]
+        self.escritas = [
+            ('POST /livros', 40, self.novo_livro),
+            ('PUT /livros/<id>', 50, lambda r: ('PUT', f'/livros/{r.randint(1, self.max_livro)}',
+                                                  {'preco': round(r.uniform(5, 200), 2)})),
+            ('POST /autores', 10, lambda r: ('POST', '/autores', {'nm_autor': f'Autor {r.random():.8f}'})),
+        ]
+        self.fracao_escritas = escritas
+
+    def novo_livro(self, r):
+        return ('POST', '/livros', {
+            'nm_livro': ' '.join(r.choice(self.palavras) for _ in range(3)).capitalize(),
+            'preco': round(r.uniform(5, 200), 2),
+            'pagamento_eletronico': 'S', 'pagamento_dinheiro': 'N',
+            'entrega_presencial': 'S', 'entrega_delivery': r.choice('SN'),
+            'cep': r.choice(self.ceps),
+            'login_comprador': r.choice(self.logins), 'login_vendedor': r.choice(self.logins),
+            'img_livro': self.imagem,
+            'autores': [r.randint(1, self.max_autor)],
+            'categorias': [r.choice(self.categorias)],
+        })
+
+    def sortear(self, r):
+        operacoes = self.escritas if r.random() < self.fracao_escritas else self.leituras
+        nome, _, gerar_requisicao = r.choices(operacoes, weights=[peso for _, peso, _ in operacoes])[0]
+        return (nome,) + gerar_requisicao(r)
+
+
+class ClienteTeste:
+    """Requisições pelo app.test_client(), no mesmo processo"""
+
+    def __init__(self, api):
+        self.client = api.app.test_client()
+
+    def request(self, method, path, body):
+        response = self.client.open(path, method=method, json=body)
+        response.get_data()
+        # Fechar devolve ao pool a conexao de respostas em fluxo (imagens)
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class ClienteHttp:
+    """Requisições HTTP com conexão persistente até o servidor"""
+
+    def __init__(self, porta):
+        self.porta = porta
+        self.conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=60)
+
+    def request(self, method, path, body):
+        headers = {}
+        dados = None
+        if body is not None:
+            dados = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conexao.request(method, path, dados, headers)
+            response = self.conexao.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.conexao.close()
+            self.conexao = http.client.HTTPConnection('127.0.0.1', self.porta, timeout=60)
+            return 0
+
+    def close(self):
+        self.conexao.close()
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+## servidor de producao (serve.py) em outro processo, pronto para receber requisicoes
+def iniciar_servidor(banco, workers, threads_servidor):
+    porta = porta_livre()
+    env = dict(os.environ, DATABASE_PATH=banco, SECRET_KEY=os.environ.get('SECRET_KEY', 'benchmark'),
+               METRICS_DIR=tempfile.mkdtemp(prefix='benchmark-metrics-'))
+    processo = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'serve.py'), '--bind', f'127.0.0.1:{porta}',
+         '--workers', str(workers), '--threads', str(threads_servidor), '--max-requests', '0'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise click.ClickException('O servidor terminou ao iniciar')
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=1)
+            conexao.request('GET', '/health')
+            if conexao.getresponse().status == 200:
+                return processo, porta
+        except OSError:
+            time.sleep(0.2)
+    processo.kill()
+    raise click.ClickException('O servidor não respondeu em 60s')
+
+def percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+def resumo(latencias, status, duracao):
+    ordenados = sorted(latencias)
+    if not ordenados:
+        raise click.ClickException('Nenhuma requisição medida (aumente --duracao)')
+    return {
+        'requisicoes': len(ordenados),
+        'erros': sum(n for codigo, n in status.items() if codigo == 0 or codigo >= 500),
+        'status': {str(codigo): n for codigo, n in sorted(status.items())},
+        'req_s': round(len(ordenados) / duracao, 1),
+        'media_ms': round(sum(ordenados) / len(ordenados) * 1000, 3),
+        'p50_ms': round(percentil(ordenados, 0.50) * 1000, 3),
+        'p90_ms': round(percentil(ordenados, 0.90) * 1000, 3),
+        'p99_ms': round(percentil(ordenados, 0.99) * 1000, 3),
+        'max_ms': round(ordenados[-1] * 1000, 3),
+    }
+
+def commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+@cli.command()
+@click.argument('banco')
+@click.option('--alvo', type=click.Choice(['cliente', 'servidor']), default='cliente', show_default=True,
+              help='cliente: app.test_client() no mesmo processo; servidor: serve.py via HTTP')
+@click.option('--threads', type=int, default=8, show_default=True, help='Clientes simultâneos')
+@click.option('--duracao', type=float, default=30, show_default=True, help='Segundos de medição')
+@click.option('--aquecimento', type=float, default=3, show_default=True, help='Segundos antes de medir')
+@click.option('--escritas', type=float, default=0.1, show_default=True, help='Fração de requisições de escrita')
+@click.option('--workers', type=int, default=2, show_default=True, help='Workers do servidor (--alvo servidor)')
+@click.option('--threads-servidor', type=int, default=8, show_default=True, help='Threads por worker')
+@click.option('--semente', type=int, default=42, show_default=True)
+@click.option('--saida', help='Arquivo JSON de resultados (padrão: benchmark-<commit>-<alvo>.json)')
+def executar(banco, alvo, threads, duracao, aquecimento, escritas, workers, threads_servidor, semente, saida):
+    """Mede vazão e latência por endpoint com carga mista de leituras e escritas sobre uma cópia de BANCO"""
+    pasta = tempfile.mkdtemp(prefix='benchmark-')
+    copia = os.path.join(pasta, os.path.basename(banco))
+    shutil.copyfile(banco, copia)
+    carga = Carga(copia, escritas)
+
+    processo = None
+    if alvo == 'cliente':
+        os.environ['DATABASE_PATH'] = copia
+        os.environ.setdefault('SECRET_KEY', 'benchmark')
+        os.environ.setdefault('FLASK_CONFIG', 'production')
+        import app as api
+        api.migrate_db()
+        api.warm_up()
+        criar_cliente = lambda: ClienteTeste(api)
+    else:
+        processo, porta = iniciar_servidor(copia, workers, threads_servidor)
+        criar_cliente = lambda: ClienteHttp(porta)
+
+    medicoes = {}
+    lock = threading.Lock()
+    inicio_medicao = time.monotonic() + aquecimento
+    fim = inicio_medicao + duracao
+
+    def trabalhar(indice):
+        rng = random.Random(semente * 1000 + indice)
+        cliente = criar_cliente()
+        locais = {}
+        while True:
+            nome, method, path, body = carga.sortear(rng)
+            inicio = time.monotonic()
+            if inicio >= fim:
+                break
+            status = cliente.request(method, path, body)
+            if inicio >= inicio_medicao:
+                latencias, contagem = locais.setdefault(nome, ([], {}))
+                latencias.append(time.monotonic() - inicio)
+                contagem[status] = contagem.get(status, 0) + 1
+        cliente.close()
+        with lock:
+            for nome, (latencias, contagem) in locais.items():
+                total_latencias, total_contagem = medicoes.setdefault(nome, ([], {}))
+                total_latencias.extend(latencias)
+                for status, n in contagem.items():
+                    total_contagem[status] = total_contagem.get(status, 0) + n
+
+    try:
+        clientes = [threading.Thread(target=trabalhar, args=(i,)) for i in range(threads)]
+        for t in clientes:
+            t.start()
+        for t in clientes:
+            t.join()
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait()
+        else:
+            api.shutdown()
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    todas = [l for latencias, _ in medicoes.values() for l in latencias]
+    todos_status = {}
+    for _, contagem in medicoes.values():
+        for status, n in contagem.items():
+            todos_status[status] = todos_status.get(status, 0) + n
+    db = sqlite3.connect(banco)
+    resultado = {
+        'commit': commit_atual(),
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'alvo': alvo,
+        'parametros': {'threads': threads, 'duracao': duracao, 'escritas': escritas, 'semente': semente,
+                       'workers': workers if alvo == 'servidor' else None,
+                       'threads_servidor': threads_servidor if alvo == 'servidor' else None},
+        'banco': {'livros': db.execute('SELECT COUNT(*) FROM LIVRO').fetchone()[0],
+                  'bairros': db.execute('SELECT COUNT(*) FROM BAIRRO').fetchone()[0]},
+        'total': resumo(todas, todos_status, duracao),
+        'endpoints': {nome: resumo(latencias, contagem, duracao)
+                      for nome, (latencias, contagem) in sorted(medicoes.items())},
+    }
+    db.close()
+
+    saida = saida or f"benchmark-{resultado['commit'] or 'local'}-{alvo}.json"
+    with open(saida, 'w') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+    click.echo(f"{'endpoint':28} {'req':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'erros':>6}")
+    for nome, r in list(resultado['endpoints'].items()) + [('TOTAL', resultado['total'])]:
+        click.echo(f"{nome:28} {r['requisicoes']:>7} {r['req_s']:>8} {r['p50_ms']:>8} {r['p99_ms']:>8} {r['erros']:>6}")
+    click.echo(f'Resultados em {saida}')
+
+
+# ==================== COMPARACAO ====================
+
+@cli.command()
+@click.argument('antes', type=click.File())
+@click.argument('depois', type=click.File())
+def comparar(antes, depois):
+    """Diferença de vazão e latência por endpoint entre dois resultados"""
+    antes, depois = json.load(antes), json.load(depois)
+    click.echo(f"{antes['commit']} ({antes['alvo']}) -> {depois['commit']} ({depois['alvo']})")
+    click.echo(f"{'endpoint':28} {'req/s':>24} {'p50 ms':>24} {'p99 ms':>24}")
+
+    def variacao(a, b):
+        return f'{a:>8} {b:>8} {(b - a) / a * 100 if a else 0:+5.0f}%'
+
+    linhas = [(nome, antes['endpoints'].get(nome), r) for nome, r in depois['endpoints'].items()]
+    for nome, a, b in linhas + [('TOTAL', antes['total'], depois['total'])]:
+        if a is None:
+            click.echo(f'{nome:28} (novo)')
+            continue
+        click.echo(f"{nome:28} {variacao(a['req_s'], b['req_s'])} "
+                   f"{variacao(a['p50_ms'], b['p50_ms'])} {variacao(a['p99_ms'], b['p99_ms'])}")
+
+
+if __name__ == '__main__':
+    cli()
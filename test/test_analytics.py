@@ -0,0 +1,113 @@
+"""GET /analytics/precos: resumo por grupo contra o SQL direto e atualização da foto"""
+
+import random
+
+import numpy as np
+import pytest
+
+import app as api
+from conftest import CEPS, conectar, novo_livro
+
+
+@pytest.fixture
+def livros(client):
+    sorteio = random.Random(7)
+    for i in range(60):
+        resposta = client.post('/livros', json=novo_livro(
+            nm_livro=f'Livro {i}', preco=round(sorteio.lognormvariate(3, 0.8), 2), cep=sorteio.choice(CEPS),
+            categorias=sorteio.sample([1, 2, 3, 4], sorteio.randint(0, 2))))
+        assert resposta.status_code == 201
+
+
+## precos por grupo lidos direto do banco; por categoria, um livro conta em cada uma das suas
+def precos_esperados(filtros, agrupar=None):
+    db = conectar()
+    try:
+        livros = db.execute('SELECT ID_LIVRO, PRECO, ID_ESTADO, ID_CIDADE FROM LIVRO_LISTAGEM').fetchall()
+        categorias = {}
+        for id_livro, id_categoria in db.execute('SELECT ID_LIVRO, ID_CATEGORIA FROM LIVRO_CATEGORIA'):
+            categorias.setdefault(id_livro, set()).add(id_categoria)
+    finally:
+        db.close()
+
+    grupos = {}
+    for id_livro, preco, id_estado, id_cidade in livros:
+        valores = {'estado': {id_estado}, 'cidade': {id_cidade}, 'categoria': categorias.get(id_livro, set())}
+        if any(valor not in valores[dimensao] for dimensao, valor in filtros.items()):
+            continue
+        if agrupar is None:
+            chaves = {None}
+        elif agrupar in filtros:
+            chaves = {filtros[agrupar]}
+        else:
+            chaves = valores[agrupar]
+        for chave in chaves:
+            grupos.setdefault(chave, []).append(preco)
+    return grupos
+
+
+def conferir(resumo, precos):
+    precos = np.array(precos)
+    assert resumo['total'] == len(precos)
+    esperado = {'min': precos.min(), 'max': precos.max(), 'p10': np.percentile(precos, 10),
+                'mediana': np.percentile(precos, 50), 'p90': np.percentile(precos, 90)}
+    for campo, valor in esperado.items():
+        assert resumo[campo] == pytest.approx(valor, abs=0.006), campo
+
+
+@pytest.mark.parametrize('filtros', [{}, {'estado': 1}, {'categoria': 2}, {'categoria': 2, 'estado': 1},
+                                     {'cidade': 1}])
+@pytest.mark.parametrize('agrupar', ['categoria', 'estado', 'cidade'])
+def test_resumo_por_grupo_igual_ao_sql(client, livros, filtros, agrupar):
+    query = '&'.join(f'{dimensao}={valor}' for dimensao, valor in filtros.items())
+    resposta = client.get(f'/analytics/precos?{query}&agrupar={agrupar}&faixas=5')
+    assert resposta.status_code == 200
+    resultado = resposta.get_json()
+
+    [todos] = precos_esperados(filtros).values()
+    conferir(resultado, todos)
+    contagens, limites = np.histogram(todos, 5)
+    assert resultado['histograma']['contagens'] == contagens.tolist()
+    assert resultado['histograma']['limites'] == pytest.approx(limites, abs=0.006)
+
+    esperados = precos_esperados(filtros, agrupar)
+    coluna = f'ID_{agrupar.upper()}'
+    assert sorted(grupo[coluna] for grupo in resultado['grupos']) == sorted(esperados)
+    for grupo in resultado['grupos']:
+        conferir(grupo, esperados[grupo[coluna]])
+    # Maiores grupos primeiro
+    totais = [grupo['total'] for grupo in resultado['grupos']]
+    assert totais == sorted(totais, reverse=True)
+
+
+def test_filtro_sem_livros(client, livros):
+    resultado = client.get('/analytics/precos?cidade=4&agrupar=estado').get_json()
+    assert resultado['total'] == 0 and resultado['grupos'] == []
+
+
+def test_foto_atualizada_quando_seq_anda(client, livros):
+    antes = client.get('/analytics/precos').get_json()
+    refreshes = api.price_analytics.refreshes
+
+    # Sem escrita, a rodada da thread não recarrega nada
+    api.price_analytics._refresh()
+    assert api.price_analytics.refreshes == refreshes
+
+    client.post('/livros', json=novo_livro(preco=5000.0))
+    client.put('/livros/1', json={'preco': 0.5})
+    # Até a próxima rodada, as requisições seguem com a foto anterior
+    assert client.get('/analytics/precos').get_json()['seq'] == antes['seq']
+
+    api.price_analytics._refresh()
+    assert api.price_analytics.refreshes == refreshes + 1
+    depois = client.get('/analytics/precos').get_json()
+    assert depois['seq'] > antes['seq']
+    assert depois['total'] == antes['total'] + 1
+    assert depois['max'] == 5000.0 and depois['min'] == 0.5
+    [todos] = precos_esperados({}).values()
+    conferir(depois, todos)
+
+
+def test_parametros_invalidos(client):
+    for query in ('estado=x', 'faixas=0', 'faixas=101', 'agrupar=autor'):
+        assert client.get(f'/analytics/precos?{query}').status_code == 400
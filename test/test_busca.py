@@ -0,0 +1,71 @@
+"""GET /livros/busca (FTS5 em LIVRO_BUSCA, mantida por gatilhos)"""
+
+from conftest import novo_livro
+
+
+def buscar(client, q, query=''):
+    resposta = client.get(f'/livros/busca?q={q}{query}')
+    assert resposta.status_code == 200
+    return [livro['ID_LIVRO'] for livro in resposta.get_json()]
+
+
+def criar(client, nome, **campos):
+    resposta = client.post('/livros', json=novo_livro(nm_livro=nome, **campos))
+    assert resposta.status_code == 201
+    return resposta.get_json()['id_livro']
+
+
+def test_busca_ignora_acentos_e_maiusculas(client):
+    id_livro = criar(client, 'Iracema', autores=[3])
+
+    # Autor 3 do seed: José de Alencar
+    assert buscar(client, 'jose alencar') == [id_livro]
+    assert buscar(client, 'IRACÉMA') == [id_livro]
+    # O último termo casa por prefixo (busca durante a digitação)
+    assert buscar(client, 'irac') == [id_livro]
+
+
+def test_busca_por_autor_e_categoria(client):
+    por_autor = criar(client, 'Dom Casmurro', autores=[1])
+    por_categoria = criar(client, 'O Alquimista', categorias=[4])
+
+    assert buscar(client, 'machado') == [por_autor]
+    assert buscar(client, 'autoajuda') == [por_categoria]
+    assert buscar(client, 'alquimista', '&preco_min=1000') == []
+
+
+def test_titulo_pesa_mais_que_autor_e_categoria(client):
+    # "Romance" no título de um livro e na categoria (2, Romance) de outro
+    na_categoria = criar(client, 'Lucíola', categorias=[2])
+    no_titulo = criar(client, 'Romance da Pedra do Reino')
+
+    assert buscar(client, 'romance') == [no_titulo, na_categoria]
+
+
+def test_gatilhos_acompanham_renomeacoes_e_remocoes(client):
+    id_livro = criar(client, 'Senhora', autores=[3], categorias=[1])
+
+    client.put(f'/livros/{id_livro}', json={'nm_livro': 'Lucíola'})
+    assert buscar(client, 'senhora') == []
+    assert buscar(client, 'luciola') == [id_livro]
+
+    client.put('/autores/3', json={'nm_autor': 'J. de Alencar'})
+    assert buscar(client, 'jose') == []
+    assert buscar(client, 'alencar') == [id_livro]
+
+    client.put('/categorias/1', json={'nm_categoria': 'Clássicos'})
+    assert buscar(client, 'classicos') == [id_livro]
+
+    # Autor com livros não sai; tirado do livro, sai da busca dele
+    assert client.delete('/autores/3').status_code == 400
+    client.put(f'/livros/{id_livro}', json={'autores': []})
+    assert buscar(client, 'alencar') == []
+    assert client.delete('/autores/3').status_code == 200
+
+    client.delete(f'/livros/{id_livro}')
+    assert buscar(client, 'luciola') == []
+
+
+def test_busca_sem_termos(client):
+    assert client.get('/livros/busca?q=%20%21').status_code == 400
+    assert client.get('/livros/busca').status_code == 400
@@ -0,0 +1,64 @@
+"""Cache de respostas (cached_response) invalidado pelas versões de CACHE_VERSAO"""
+
+import sqlite3
+
+import pytest
+
+import app as api
+
+
+def test_miss_depois_hit_e_304(client):
+    primeira = client.get('/estados')
+    segunda = client.get('/estados')
+
+    assert primeira.headers['X-Cache'] == 'MISS'
+    assert segunda.headers['X-Cache'] == 'HIT'
+    assert segunda.get_data() == primeira.get_data()
+    assert segunda.headers['ETag'] == primeira.headers['ETag']
+    assert 'no-cache' in segunda.headers['Cache-Control']
+
+    condicional = client.get('/estados', headers={'If-None-Match': primeira.headers['ETag']})
+    assert condicional.status_code == 304
+    assert condicional.get_data() == b''
+    # Query string diferente é outra entrada
+    assert client.get('/cidades?id_estado=1').headers['X-Cache'] == 'MISS'
+
+
+@pytest.mark.parametrize('escrita, url, novo', [
+    (lambda c: c.post('/estados', json={'nm_estado': 'Bahia'}), '/estados', 'Bahia'),
+    (lambda c: c.put('/cidades/2', json={'nm_cidade': 'Campinas SP', 'id_estado': 1}), '/cidades', 'Campinas SP'),
+    (lambda c: c.put('/categorias/1', json={'nm_categoria': 'Clássicos'}), '/categorias', 'Clássicos'),
+    (lambda c: c.post('/autores', json={'nm_autor': 'Cecília Meireles'}), '/autores', 'Cecília Meireles'),
+    # Cidades trazem o nome do estado: escrever em ESTADO também invalida /cidades
+    (lambda c: c.put('/estados/1', json={'nm_estado': 'SP'}), '/cidades', 'SP'),
+])
+def test_escrita_troca_a_versao(client, escrita, url, novo):
+    antes = client.get(url)
+    assert client.get(url).headers['X-Cache'] == 'HIT'
+
+    assert escrita(client).status_code in (200, 201)
+    depois = client.get(url)
+    assert depois.headers['X-Cache'] == 'MISS'
+    assert depois.headers['ETag'] != antes.headers['ETag']
+    assert novo in str(depois.get_json())
+    # O ETag antigo não vale mais
+    assert client.get(url, headers={'If-None-Match': antes.headers['ETag']}).status_code == 200
+
+
+def test_escrita_de_outro_processo_invalida(client):
+    antes = client.get('/autores')
+    # Fora do app (outro worker, sqlite3 na mão): os gatilhos de CACHE_VERSAO valem do mesmo jeito
+    db = sqlite3.connect(api.app.config['DATABASE'])
+    db.execute("UPDATE AUTOR SET NM_AUTOR = 'Rick Riordan' WHERE ID_AUTOR = 5")
+    db.commit()
+    db.close()
+
+    depois = client.get('/autores')
+    assert depois.headers['X-Cache'] == 'MISS'
+    assert 'Rick Riordan' in str(depois.get_json())
+    assert depois.headers['ETag'] != antes.headers['ETag']
+
+
+def test_respostas_de_erro_nao_entram_no_cache(client):
+    assert client.get('/estados/999').status_code == 404
+    assert api.response_cache.stats()['entries'] == 0
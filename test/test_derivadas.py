@@ -0,0 +1,246 @@
+"""Tabelas derivadas mantidas por gatilhos, conferidas contra um recálculo depois de escritas mistas"""
+
+import numpy as np
+import pytest
+
+import app as api
+from conftest import CEPS, LOGINS, conectar, novo_livro, processar_semelhantes
+
+
+## mistura de escritas pela API e direto no banco: insert, update, INSERT OR REPLACE e delete
+def escritas_mistas(client):
+    ids = []
+    for i in range(6):
+        resposta = client.post('/livros', json=novo_livro(
+            nm_livro=f'Livro {i}', preco=10.0 + i, cep=CEPS[i % len(CEPS)],
+            pagamento_dinheiro='SN'[i % 2], autores=[1 + i % 5], categorias=[1 + i % 4, 1 + (i + 1) % 4]))
+        assert resposta.status_code == 201
+        ids.append(resposta.get_json()['id_livro'])
+
+    assert client.put(f'/livros/{ids[0]}', json={'preco': 99.0, 'cep': CEPS[3],
+                                                 'categorias': [2]}).status_code == 200
+    assert client.put(f'/livros/{ids[1]}', json={'entrega_delivery': 'S', 'autores': []}).status_code == 200
+    assert client.put('/livros/1', json={'nm_livro': 'Percy Jackson e o Ladrão de Raios'}).status_code == 200
+
+    # Linha inteira trocada sem passar pela API (REPLACE apaga a antiga sem gatilhos de DELETE)
+    def substituir(db):
+        db.execute('''
+            INSERT OR REPLACE INTO LIVRO (ID_LIVRO, NM_LIVRO, PRECO, PAGAMENTO_ELETRONICO, PAGAMENTO_DINHEIRO,
+                                          ENTREGA_PRESENCIAL, ENTREGA_DELIVERY, IMG_LIVRO, CEP,
+                                          LOGIN_COMPRADOR, LOGIN_VENDEDOR)
+            VALUES (?, 'Substituído', 77.0, 'N', 'S', 'N', 'S', X'00', ?, ?, ?)
+        ''', (ids[2], CEPS[2], LOGINS[2], LOGINS[0]))
+    api.write_coordinator.execute(substituir)
+
+    # Nomes e localização mudam em várias listagens de uma vez
+    assert client.put('/autores/1', json={'nm_autor': 'J. M. Machado de Assis'}).status_code == 200
+    assert client.put('/categorias/2', json={'nm_categoria': 'Romance Clássico'}).status_code == 200
+    assert client.put(f'/bairros/{CEPS[1]}', json={'nm_bairro': 'Vila Olímpia', 'id_cidade': 2}).status_code == 200
+
+    assert client.delete(f'/livros/{ids[3]}').status_code == 200
+    assert client.delete('/livros/2').status_code == 200
+    return ids
+
+
+def test_listagem_igual_a_origem(client):
+    ids = escritas_mistas(client)
+
+    db = conectar()
+    try:
+        assert api.listagem_drift(db, 0, 2 ** 62) == []
+        listados = {row[0] for row in db.execute('SELECT ID_LIVRO FROM LIVRO_LISTAGEM')}
+        assert listados == {row[0] for row in db.execute('SELECT ID_LIVRO FROM LIVRO')}
+    finally:
+        db.close()
+    assert ids[3] not in listados
+    livro = client.get(f'/livros/{ids[2]}').get_json()
+    assert livro['NM_LIVRO'] == 'Substituído'
+
+
+def test_rebuild_listagem_corrige_divergencias(client):
+    escritas_mistas(client)
+    api.write_coordinator.execute(lambda db: db.execute("UPDATE LIVRO_LISTAGEM SET NM_LIVRO = 'errado'"))
+
+    runner = api.app.test_cli_runner()
+    assert 'livros divergentes' in runner.invoke(args=['rebuild-listagem', '--verificar']).output
+    resultado = runner.invoke(args=['rebuild-listagem'])
+    assert resultado.exit_code == 0, resultado.output
+    db = conectar()
+    try:
+        assert api.listagem_drift(db, 0, 2 ** 62) == []
+    finally:
+        db.close()
+
+
+## aplicar /livros/changes a partir de since até o fim, como um cliente sincronizando
+def sincronizar(client, livros, since):
+    seq_minimo = ''
+    while True:
+        resposta = client.get(f'/livros/changes?since={since}&limit=3{seq_minimo}')
+        assert resposta.status_code == 200
+        pagina = resposta.get_json()
+        if 'seq_minimo' in pagina:
+            seq_minimo = f'&seq_minimo={pagina["seq_minimo"]}'
+        for livro in pagina['upserts']:
+            livros[livro['ID_LIVRO']] = livro
+        for id_livro in pagina['deletes']:
+            livros.pop(id_livro, None)
+        since = pagina['seq']
+        if not pagina['has_more']:
+            return since
+
+
+def test_alteracoes_uma_por_livro_com_remocoes_marcadas(client):
+    ids = escritas_mistas(client)
+
+    db = conectar()
+    try:
+        alteracoes = dict(db.execute('SELECT ID_LIVRO, REMOVIDO FROM LIVRO_ALTERACAO'))
+        existentes = {row[0] for row in db.execute('SELECT ID_LIVRO FROM LIVRO')}
+    finally:
+        db.close()
+    assert {id_livro for id_livro, removido in alteracoes.items() if removido == 'N'} == existentes
+    assert {id_livro for id_livro, removido in alteracoes.items() if removido == 'S'} == {ids[3], 2}
+
+
+def test_sincronizacao_incremental_igual_a_completa(client):
+    livros = {}
+    since = sincronizar(client, livros, 0)
+    escritas_mistas(client)
+    sincronizar(client, livros, since)
+
+    completa = {}
+    sincronizar(client, completa, 0)
+    assert livros == completa
+    db = conectar()
+    try:
+        assert set(livros) == {row[0] for row in db.execute('SELECT ID_LIVRO FROM LIVRO')}
+    finally:
+        db.close()
+
+
+def test_since_anterior_a_compactacao_recebe_410(client):
+    since = sincronizar(client, {}, 0)
+    escritas_mistas(client)
+
+    resultado = api.app.test_cli_runner().invoke(args=['compact-changes', '--dias', '-1'])
+    assert resultado.exit_code == 0, resultado.output
+    assert resultado.output.startswith('2 remoções apagadas')
+
+    resposta = client.get(f'/livros/changes?since={since}')
+    assert resposta.status_code == 410
+    seq_minimo = resposta.get_json()['seq_minimo']
+    assert client.get(f'/livros/changes?since={seq_minimo}').status_code == 200
+    livros = {}
+    sincronizar(client, livros, 0)
+    assert len(livros) == len(client.get('/livros?limit=100').get_json())
+
+
+def test_compactacao_no_meio_da_sincronizacao_completa_recebe_410(client):
+    escritas_mistas(client)
+    primeira = client.get('/livros/changes?limit=3').get_json()
+    assert primeira['has_more'] and primeira['seq_minimo'] == 0
+
+    api.app.test_cli_runner().invoke(args=['compact-changes', '--dias', '-1'])
+    resposta = client.get(f'/livros/changes?since={primeira["seq"]}&limit=3&seq_minimo=0')
+    assert resposta.status_code == 410
+    assert client.get('/livros/changes?since=1&seq_minimo=x').status_code == 400
+
+
+def test_facetas_iguais_a_contagem_da_listagem(client):
+    escritas_mistas(client)
+
+    db = conectar()
+    try:
+        contadas = set(map(tuple, db.execute('SELECT FACETA, VALOR, TOTAL FROM LIVRO_FACETA WHERE TOTAL > 0')))
+        recalculadas = set(map(tuple, db.execute('''
+            SELECT FACETA, VALOR, COUNT(*) FROM LIVRO_FACETA_ORIGEM GROUP BY 1, 2''')))
+        assert db.execute('SELECT COUNT(*) FROM LIVRO_FACETA WHERE TOTAL < 0').fetchone()[0] == 0
+    finally:
+        db.close()
+    assert contadas == recalculadas
+    # Catálogo inteiro (LIVRO_FACETA) e um filtro que não exclui nada (agregação na hora) batem
+    assert client.get('/livros/facetas').get_json() == client.get('/livros/facetas?preco_min=0').get_json()
+
+
+## semelhança de todos os pares do catálogo, calculada do zero: {(livro, outro): semelhança}
+def recalcular_semelhancas(db):
+    atributos = api.carregar_atributos(db)
+    valores = api.valores_atributos(atributos)
+    quadrados, normas = api.pesos_atributos(valores, *api.frequencias_catalogo(db, valores))
+    total = len(atributos.ids)
+    a, b = np.nonzero(~np.eye(total, dtype=bool))
+    semelhancas = np.round(api.similaridades(valores, quadrados, normas, a, b), 4)
+    return {(int(atributos.ids[i]), int(atributos.ids[j])): s for i, j, s in zip(a, b, semelhancas.tolist())}
+
+
+## livros com um autor em comum, da mesma cidade ou com uma categoria em comum no mesmo estado
+def relacionados_diretos(id_livro):
+    db = conectar()
+    try:
+        return {row[0] for row in db.execute('''
+            SELECT a.ID_LIVRO FROM LIVRO_AUTOR a JOIN LIVRO_AUTOR b ON b.ID_AUTOR = a.ID_AUTOR
+            WHERE b.ID_LIVRO = :id
+            UNION SELECT l.ID_LIVRO FROM LIVRO_LISTAGEM l JOIN LIVRO_LISTAGEM o ON o.ID_CIDADE = l.ID_CIDADE
+            WHERE o.ID_LIVRO = :id
+            UNION SELECT a.ID_LIVRO FROM LIVRO_CATEGORIA a JOIN LIVRO_CATEGORIA b ON b.ID_CATEGORIA = a.ID_CATEGORIA
+            JOIN LIVRO_LISTAGEM la ON la.ID_LIVRO = a.ID_LIVRO JOIN LIVRO_LISTAGEM lb ON lb.ID_LIVRO = b.ID_LIVRO
+            WHERE b.ID_LIVRO = :id AND la.ID_ESTADO = lb.ID_ESTADO
+        ''', {'id': id_livro})} - {id_livro}
+    finally:
+        db.close()
+
+
+def test_semelhantes_dos_livros_alterados_iguais_ao_recalculo(client):
+    ids = escritas_mistas(client)
+    db = conectar()
+    try:
+        alterados = {row[0] for row in db.execute('SELECT ID_LIVRO FROM LIVRO_SEMELHANTE_PENDENTE')}
+    finally:
+        db.close()
+    processar_semelhantes()
+
+    k = api.app.config['LIVROS_SEMELHANTES_K']
+    db = conectar()
+    try:
+        assert db.execute('SELECT COUNT(*) FROM LIVRO_SEMELHANTE_PENDENTE').fetchone()[0] == 0
+        linhas = db.execute('SELECT ID_LIVRO, ID_SEMELHANTE, SIMILARIDADE FROM LIVRO_SEMELHANTE').fetchall()
+        existentes = {row[0] for row in db.execute('SELECT ID_LIVRO FROM LIVRO_LISTAGEM')}
+        esperadas = recalcular_semelhancas(db)
+    finally:
+        db.close()
+
+    assert {ids[3], 2} & alterados == set()
+    listas = {}
+    for id_livro, semelhante, semelhanca in linhas:
+        assert id_livro != semelhante
+        assert {id_livro, semelhante} <= existentes
+        listas.setdefault(id_livro, {})[semelhante] = semelhanca
+        # Pares com um livro alterado foram calculados com os pesos atuais
+        if {id_livro, semelhante} & alterados:
+            assert semelhanca == pytest.approx(esperadas[id_livro, semelhante], abs=1e-4)
+    assert all(len(lista) <= k for lista in listas.values())
+    # Livros que as sementes alcançam direto (autor, cidade, categoria no estado) entre os k mais semelhantes
+    for id_livro in alterados & existentes:
+        relacionados = relacionados_diretos(id_livro)
+        melhores = sorted((-s, outro) for (livro, outro), s in esperadas.items()
+                          if livro == id_livro and s > 0 and outro in relacionados)
+        assert {outro for _, outro in melhores[:k]} <= set(listas.get(id_livro, {}))
+
+
+def test_rebuild_semelhantes_igual_a_atualizacao_incremental(client):
+    escritas_mistas(client)
+    processar_semelhantes()
+    # Sem novas escritas, os pesos de todos os pares passam a ser os atuais
+    resultado = api.app.test_cli_runner().invoke(args=['rebuild-semelhantes'])
+    assert resultado.exit_code == 0, resultado.output
+
+    db = conectar()
+    try:
+        linhas = db.execute('SELECT ID_LIVRO, ID_SEMELHANTE, SIMILARIDADE FROM LIVRO_SEMELHANTE').fetchall()
+        esperadas = recalcular_semelhancas(db)
+    finally:
+        db.close()
+    assert linhas
+    for id_livro, semelhante, semelhanca in linhas:
+        assert semelhanca == pytest.approx(esperadas[id_livro, semelhante], abs=1e-4)
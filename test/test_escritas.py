@@ -0,0 +1,84 @@
+"""WriteCoordinator: escritas de várias threads em um lote, cada uma no próprio savepoint"""
+
+import sqlite3
+import threading
+
+import pytest
+
+import app as api
+from conftest import conectar, novo_livro
+
+
+## enfileirar as escritas juntas: a primeira segura o escritor até as demais estarem na fila
+def em_um_lote(*escritas):
+    liberar = threading.Event()
+    primeira = api.write_coordinator.submit(lambda db: liberar.wait(5))
+    futures = [api.write_coordinator.submit(escrita) for escrita in escritas]
+    liberar.set()
+    primeira.result()
+    return futures
+
+
+def inserir_autor(nome):
+    return lambda db: db.execute('INSERT INTO AUTOR (NM_AUTOR) VALUES (?)', (nome,)).lastrowid
+
+
+def falhar_depois_de_inserir(erro):
+    def escrita(db):
+        db.execute("INSERT INTO AUTOR (NM_AUTOR) VALUES ('Desfeito')")
+        raise erro
+    return escrita
+
+
+def nomes_autores():
+    db = conectar()
+    try:
+        return {row[0] for row in db.execute('SELECT NM_AUTOR FROM AUTOR')}
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize('erro', [sqlite3.IntegrityError('falha'), ValueError('falha')])
+def test_escrita_com_erro_nao_desfaz_o_lote(app, erro):
+    antes, falha, depois = em_um_lote(inserir_autor('Antes'), falhar_depois_de_inserir(erro),
+                                      inserir_autor('Depois'))
+
+    assert isinstance(antes.result(), int)
+    assert isinstance(depois.result(), int)
+    with pytest.raises(type(erro)):
+        falha.result()
+    # A escrita que falhou sai inteira (inclusive o que gravou antes do erro); as outras ficam
+    nomes = nomes_autores()
+    assert {'Antes', 'Depois'} <= nomes
+    assert 'Desfeito' not in nomes
+    # As três escritas foram no mesmo commit
+    assert api.write_coordinator.largest_batch >= 3
+    assert api.write_coordinator.stats()['errors'] == 1
+
+
+def test_restricao_violada_vira_erro_so_da_requisicao(client):
+    # CEP inexistente: a chave estrangeira falha dentro do savepoint da própria escrita
+    respostas = []
+
+    def criar(cep):
+        respostas.append(client.post('/livros', json=novo_livro(cep=cep)).status_code)
+
+    threads = [threading.Thread(target=criar, args=(cep,)) for cep in (1310100, 999, 4038001, 998)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(respostas) == [201, 201, 400, 400]
+    db = conectar()
+    try:
+        assert db.execute('SELECT COUNT(*) FROM LIVRO WHERE CEP IN (1310100, 4038001)').fetchone()[0] >= 2
+        assert db.execute('SELECT COUNT(*) FROM LIVRO WHERE CEP IN (999, 998)').fetchone()[0] == 0
+    finally:
+        db.close()
+
+
+def test_escritas_apos_close_reabrem_o_escritor(app):
+    api.write_coordinator.close()
+    assert api.write_coordinator.execute(inserir_autor('Reaberto'))
+    assert 'Reaberto' in nomes_autores()
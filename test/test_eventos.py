@@ -0,0 +1,106 @@
+"""GET /eventos/livros (Server-Sent Events): entrega, filtros e retomada com Last-Event-ID"""
+
+import json
+import time
+
+import pytest
+
+import app as api
+from conftest import CEPS, novo_livro
+
+
+@pytest.fixture
+def eventos(client, monkeypatch):
+    # Pings frequentes: a leitura do stream nunca fica presa esperando um evento que não vem
+    monkeypatch.setitem(api.app.config, 'SSE_HEARTBEAT_INTERVAL', 0.05)
+    abertos = []
+
+    def abrir(query='', last_event_id=None):
+        headers = {'Last-Event-ID': str(last_event_id)} if last_event_id is not None else {}
+        resposta = client.get(f'/eventos/livros{query}', headers=headers)
+        assert resposta.status_code == 200
+        abertos.append(resposta)
+        return Stream(resposta)
+
+    yield abrir
+    for resposta in abertos:
+        resposta.close()
+
+
+class Stream:
+    """Frames de uma resposta SSE lidos um a um pelo gerador da resposta"""
+
+    def __init__(self, resposta):
+        self.frames = iter(resposta.response)
+        assert next(self.frames) == b': conectado\n\n'
+
+    ## próximos eventos (id, tipo, dados), ignorando pings, até ter quantos ou acabar o prazo
+    def ler(self, quantos, prazo=5.0):
+        eventos = []
+        fim = time.monotonic() + prazo
+        while len(eventos) < quantos and time.monotonic() < fim:
+            frame = next(self.frames).decode('utf-8')
+            if frame.startswith(':'):
+                continue
+            campos = dict(linha.split(': ', 1) for linha in frame.strip().split('\n'))
+            eventos.append((int(campos['id']) if 'id' in campos else None, campos['event'],
+                            json.loads(campos['data'])))
+        return eventos
+
+
+def test_eventos_de_criacao_alteracao_e_remocao(client, eventos):
+    stream = eventos()
+
+    id_livro = client.post('/livros', json=novo_livro(nm_livro='Novo')).get_json()['id_livro']
+    [criado] = stream.ler(1)
+    client.put(f'/livros/{id_livro}', json={'preco': 5.0})
+    [alterado] = stream.ler(1)
+    client.delete(f'/livros/{id_livro}')
+    [removido] = stream.ler(1)
+
+    assert criado[1] == 'create' and criado[2]['NM_LIVRO'] == 'Novo'
+    assert alterado[1] == 'update' and alterado[2]['PRECO'] == 5.0
+    assert removido[1:] == ('delete', {'ID_LIVRO': id_livro})
+    assert criado[0] < alterado[0] < removido[0]
+
+
+## quatro escritas, cada uma esperada no stream aberto; devolve os eventos na ordem
+def gerar_eventos(client, stream):
+    recebidos = []
+    for cep in (CEPS[0], CEPS[2], CEPS[0], CEPS[3]):
+        client.post('/livros', json=novo_livro(cep=cep))
+        recebidos.extend(stream.ler(1))
+    return recebidos
+
+
+def test_reconexao_com_last_event_id_reenvia_o_que_faltou(client, eventos):
+    recebidos = gerar_eventos(client, eventos())
+
+    retomado = eventos(last_event_id=recebidos[0][0])
+    assert retomado.ler(3) == recebidos[1:]
+    # Depois do historico, continua ao vivo
+    client.put('/livros/1', json={'preco': 1.0})
+    [ao_vivo] = retomado.ler(1)
+    assert ao_vivo[1] == 'update' and ao_vivo[2]['ID_LIVRO'] == 1
+
+    # Filtros valem também para o que é reenviado
+    filtrado = eventos(f'?cep={CEPS[0]}', last_event_id=recebidos[0][0])
+    assert filtrado.ler(1) == [recebidos[2]]
+
+
+def test_historico_insuficiente_envia_reset(client, eventos, monkeypatch):
+    monkeypatch.setitem(api.app.config, 'SSE_HISTORY_SIZE', 2)
+    recebidos = gerar_eventos(client, eventos())
+
+    [reset] = eventos(last_event_id=recebidos[0][0]).ler(1)
+    assert reset == (None, 'reset', {'since': recebidos[0][0]})
+    # O cliente completa por /livros/changes a partir do mesmo id
+    changes = client.get(f'/livros/changes?since={recebidos[0][0]}').get_json()
+    assert [livro['ID_LIVRO'] for livro in changes['upserts']] == [evento[2]['ID_LIVRO'] for evento in recebidos[1:]]
+
+    # Ainda no historico: reenvio normal
+    assert eventos(last_event_id=recebidos[1][0]).ler(2) == recebidos[2:]
+
+
+def test_last_event_id_invalido(client):
+    assert client.get('/eventos/livros', headers={'Last-Event-ID': 'abc'}).status_code == 400
@@ -0,0 +1,98 @@
+"""Formatos alternativos das listagens: ?format=columns, NDJSON e ?stream=1"""
+
+import json
+
+import pytest
+
+import app as api
+from conftest import CEPS, LOGINS, novo_livro
+
+
+@pytest.fixture
+def livros(client, monkeypatch):
+    # Lotes pequenos: o streaming passa por várias partes e separadores
+    monkeypatch.setitem(api.app.config, 'STREAM_CHUNK_ROWS', 2)
+    for i, cep in enumerate(CEPS * 2):
+        resposta = client.post('/livros', json=novo_livro(
+            nm_livro=f'Livro {i % 3}', preco=10.0 + i, cep=cep, login_vendedor=LOGINS[i % 3],
+            pagamento_dinheiro='SN'[i % 2], entrega_delivery='SN'[i // 2 % 2]))
+        assert resposta.status_code == 201
+
+
+## remontar as linhas de {columns, values, dictionaries, flags}
+def decodificar(colunar):
+    linhas = [{} for _ in colunar['values'][0]] if colunar['values'] else []
+    for nome, valores in zip(colunar['columns'], colunar['values']):
+        for linha, valor in zip(linhas, valores):
+            if nome in colunar['flags']:
+                for bit, flag in enumerate(colunar['flags'][nome]):
+                    linha[flag] = 'S' if valor >> bit & 1 else 'N'
+            elif nome in colunar['dictionaries']:
+                linha[nome] = colunar['dictionaries'][nome][valor]
+            else:
+                linha[nome] = valor
+    return linhas
+
+
+def ndjson(client, url):
+    resposta = client.get(url, headers={'Accept': 'application/x-ndjson'})
+    assert resposta.status_code == 200 and resposta.mimetype == 'application/x-ndjson'
+    return [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+
+
+@pytest.mark.parametrize('query', ['', 'estado=1', 'pagamento_dinheiro=S&preco_max=15', 'cidade=999'])
+def test_colunar_volta_as_mesmas_linhas(client, livros, query):
+    pagina = client.get(f'/livros?{query}&limit=4')
+    colunar = client.get(f'/livros?{query}&limit=4&format=columns')
+
+    assert decodificar(colunar.get_json()) == pagina.get_json()
+    assert colunar.headers.get('X-Next-Cursor') == pagina.headers.get('X-Next-Cursor')
+    if 'X-Next-Cursor' in pagina.headers:
+        cursor = pagina.headers['X-Next-Cursor']
+        seguinte = client.get(f'/livros?{query}&limit=4&after={cursor}&format=columns')
+        assert decodificar(seguinte.get_json()) == client.get(f'/livros?{query}&limit=4&after={cursor}').get_json()
+
+
+def test_colunar_compacta_textos_e_flags(client, livros):
+    colunar = client.get('/livros?format=columns').get_json()
+
+    assert 'FLAGS' in colunar['columns'] and 'PAGAMENTO_DINHEIRO' not in colunar['columns']
+    # Cada texto distinto aparece uma vez no dicionário; os valores são índices
+    vendedores = colunar['dictionaries']['LOGIN_VENDEDOR']
+    assert sorted(vendedores) == sorted(LOGINS)
+    assert set(colunar['values'][colunar['columns'].index('LOGIN_VENDEDOR')]) == set(range(len(vendedores)))
+    assert set(colunar['dictionaries']['NM_ESTADO']) == {'São Paulo', 'Rio de Janeiro'}
+    assert client.get('/livros?format=columns&expand=autores').status_code == 400
+
+
+@pytest.mark.parametrize('url', ['/cidades', '/bairros'])
+def test_colunar_de_cidades_e_bairros(client, url):
+    assert decodificar(client.get(f'{url}?format=columns').get_json()) == client.get(url).get_json()
+
+
+@pytest.mark.parametrize('query', ['', 'cep=1310100', 'entrega_delivery=N&preco_min=12', 'expand=autores,categorias'])
+def test_ndjson_e_stream_iguais_ao_array(client, livros, query):
+    # Sem limit o streaming exporta tudo: igual a seguir as páginas do JSON
+    paginas = []
+    url = f'/livros?{query}&limit=3'
+    while url:
+        resposta = client.get(url)
+        paginas.extend(resposta.get_json())
+        cursor = resposta.headers.get('X-Next-Cursor')
+        url = cursor and f'/livros?{query}&limit=3&after={cursor}'
+
+    assert ndjson(client, f'/livros?{query}') == paginas
+    stream = client.get(f'/livros?{query}&stream=1')
+    assert stream.is_streamed and stream.get_json() == paginas
+
+    # Com cursor e limit explícitos, a mesma página do JSON
+    primeira = client.get(f'/livros?{query}&limit=3')
+    if 'X-Next-Cursor' in primeira.headers:
+        pagina = f'/livros?{query}&limit=3&after={primeira.headers["X-Next-Cursor"]}'
+        assert ndjson(client, pagina) == client.get(pagina).get_json()
+
+
+@pytest.mark.parametrize('url', ['/cidades', '/bairros'])
+def test_ndjson_de_cidades_e_bairros(client, url):
+    assert ndjson(client, url) == client.get(url).get_json()
+    assert client.get(f'{url}?stream=1').get_json() == client.get(url).get_json()
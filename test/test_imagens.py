@@ -0,0 +1,66 @@
+"""Imagens: validação do upload em base64 e download pelo pool de leitura"""
+
+import base64
+
+import app as api
+from conftest import novo_livro, png
+
+
+def test_base64_que_nao_e_imagem_e_recusado(client):
+    falsa = base64.b64encode(b'<html>nao e imagem</html>').decode('ascii')
+
+    resposta = client.post('/livros', json=novo_livro(img_livro=falsa))
+    assert resposta.status_code == 415
+    assert resposta.get_json()['error'] == 'Formato de imagem não suportado'
+    assert client.put('/livros/1', json={'img_livro': falsa}).status_code == 415
+    assert client.post('/livros', json=novo_livro(img_livro='abc')).status_code == 400
+
+
+def test_base64_acima_do_tamanho_maximo(client, monkeypatch):
+    monkeypatch.setitem(api.app.config, 'IMAGE_MAX_SIZE', len(png()) - 1)
+    resposta = client.post('/livros', json=novo_livro())
+    assert resposta.status_code == 413
+
+
+def test_base64_valido_grava_a_imagem_inteira(client):
+    id_livro = client.post('/livros', json=novo_livro()).get_json()['id_livro']
+
+    resposta = client.get(f'/livros/{id_livro}/imagem')
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'image/png'
+    assert resposta.get_data() == png()
+
+
+def test_download_usa_a_conexao_da_propria_requisicao(client, monkeypatch):
+    # Com uma conexão só no pool, uma segunda por download esperaria para sempre pela primeira
+    monkeypatch.setitem(api.app.config, 'DB_READ_POOL_SIZE', 1)
+    monkeypatch.setitem(api.app.config, 'DB_POOL_TIMEOUT', 0.2)
+    id_livro = client.post('/livros', json=novo_livro()).get_json()['id_livro']
+
+    resposta = client.get(f'/livros/{id_livro}/imagem')
+    assert resposta.status_code == 200
+    # O BLOB ainda não foi lido: a conexão segue com a resposta até ela ser fechada
+    assert api.read_pool.in_use == 1
+    assert resposta.get_data() == png()
+    resposta.close()
+    assert api.read_pool.in_use == 0
+
+
+def test_downloads_simultaneos_e_range(client, monkeypatch):
+    monkeypatch.setitem(api.app.config, 'DB_READ_POOL_SIZE', 2)
+    monkeypatch.setitem(api.app.config, 'DB_POOL_TIMEOUT', 0.2)
+    id_livro = client.post('/livros', json=novo_livro()).get_json()['id_livro']
+
+    abertas = [client.get(f'/livros/{id_livro}/imagem') for _ in range(2)]
+    assert api.read_pool.in_use == 2
+    for resposta in abertas:
+        assert resposta.get_data() == png()
+        resposta.close()
+
+    parcial = client.get(f'/livros/{id_livro}/imagem', headers={'Range': 'bytes=0-7'})
+    assert parcial.status_code == 206
+    assert parcial.get_data() == png()[:8]
+    parcial.close()
+    # Range fora da imagem: 416 sem deixar a conexão presa
+    assert client.get(f'/livros/{id_livro}/imagem', headers={'Range': 'bytes=100000-'}).status_code == 416
+    assert api.read_pool.in_use == 0
@@ -0,0 +1,125 @@
+"""flask import-livros: linhas inválidas ignoradas, relações por nome e retomada pelo checkpoint"""
+
+import base64
+import json
+
+import pytest
+
+import app as api
+from conftest import conectar, novo_livro, png
+
+
+def linha(**campos):
+    livro = novo_livro(**campos)
+    livro.setdefault('autores', [])
+    livro.setdefault('categorias', [])
+    return json.dumps(livro, ensure_ascii=False)
+
+
+def sem_imagem():
+    livro = json.loads(linha(nm_livro='Sem imagem'))
+    del livro['img_livro']
+    return json.dumps(livro)
+
+
+@pytest.fixture
+def catalogo(tmp_path):
+    arquivo = tmp_path / 'catalogo.jsonl'
+    arquivo.write_text('\n'.join([
+        linha(nm_livro='Dom Casmurro', autores=['Machado de Assis', 'Autor Novo'], categorias=['Romance']),
+        '{"nm_livro": ',
+        sem_imagem(),
+        linha(nm_livro='Não é imagem', img_livro=base64.b64encode(b'<html></html>').decode('ascii')),
+        linha(nm_livro='Base64 inválido', img_livro='abc'),
+        linha(nm_livro='A Hora da Estrela', autores=['Clarice Lispector'], categorias=['Ficção', ' Romance ']),
+        linha(nm_livro='Categoria nova', categorias=['Poesia']),
+        linha(nm_livro='Memórias Póstumas', autores=['Autor Novo']),
+    ]) + '\n', encoding='utf-8')
+    return str(arquivo)
+
+
+def importar(*args):
+    return api.app.test_cli_runner().invoke(args=['import-livros', *args])
+
+
+def importados():
+    db = conectar()
+    try:
+        livros = {row['NM_LIVRO']: row for row in db.execute(
+            'SELECT ID_LIVRO, NM_LIVRO, IMG_LIVRO, HASH_IMG_LIVRO FROM LIVRO WHERE ID_LIVRO > 2')}
+        autores = {(nome, autor) for nome, autor in db.execute('''
+            SELECT l.NM_LIVRO, a.NM_AUTOR FROM LIVRO_AUTOR la
+            JOIN LIVRO l ON l.ID_LIVRO = la.ID_LIVRO JOIN AUTOR a ON a.ID_AUTOR = la.ID_AUTOR
+            WHERE l.ID_LIVRO > 2''')}
+        categorias = {(nome, categoria) for nome, categoria in db.execute('''
+            SELECT l.NM_LIVRO, c.NM_CATEGORIA FROM LIVRO_CATEGORIA lc
+            JOIN LIVRO l ON l.ID_LIVRO = lc.ID_LIVRO JOIN CATEGORIA c ON c.ID_CATEGORIA = lc.ID_CATEGORIA
+            WHERE l.ID_LIVRO > 2''')}
+        listagem = {row[0] for row in db.execute('SELECT ID_LIVRO FROM LIVRO_LISTAGEM WHERE ID_LIVRO > 2')}
+        return livros, autores, categorias, listagem
+    finally:
+        db.close()
+
+
+def test_linhas_invalidas_sao_ignoradas(app, catalogo):
+    resultado = importar(catalogo)
+    assert resultado.exit_code == 0, resultado.output
+
+    for aviso in ('linha 2: JSON inválido', 'linha 3: img_livro é obrigatório',
+                  'linha 4: Formato de imagem não suportado', 'linha 5: Imagem deve estar em base64',
+                  'linha 7: Categoria Poesia não encontrada'):
+        assert aviso in resultado.output
+    assert '3 linhas importadas, 5 ignoradas' in resultado.output
+
+    livros, autores, categorias, listagem = importados()
+    assert set(livros) == {'Dom Casmurro', 'A Hora da Estrela', 'Memórias Póstumas'}
+    assert all(bytes(row['IMG_LIVRO']) == png() and row['HASH_IMG_LIVRO'] == api.image_hash(png())
+               for row in livros.values())
+    # Autores novos são criados uma vez só; os existentes são reaproveitados
+    assert autores == {('Dom Casmurro', 'Machado de Assis'), ('Dom Casmurro', 'Autor Novo'),
+                       ('A Hora da Estrela', 'Clarice Lispector'), ('Memórias Póstumas', 'Autor Novo')}
+    assert categorias == {('Dom Casmurro', 'Romance'), ('A Hora da Estrela', 'Ficção'),
+                          ('A Hora da Estrela', 'Romance')}
+    assert listagem == {row['ID_LIVRO'] for row in livros.values()}
+
+
+def test_retoma_do_checkpoint(app, catalogo, monkeypatch):
+    gravar = api.import_livros_batch
+    lotes = []
+
+    def interromper_no_segundo_lote(db, batch, refs):
+        lotes.append([numero for numero, _ in batch])
+        if len(lotes) == 2:
+            raise KeyboardInterrupt
+        return gravar(db, batch, refs)
+
+    monkeypatch.setattr(api, 'import_livros_batch', interromper_no_segundo_lote)
+    resultado = importar(catalogo, '--lote', '3')
+    assert resultado.exit_code != 0
+    assert 'rode o mesmo comando para retomar' in resultado.output
+
+    # Só o primeiro lote foi gravado, com o checkpoint junto; os índices seguem removidos
+    db = conectar()
+    try:
+        assert db.execute('SELECT LINHA FROM IMPORTACAO').fetchone()[0] == 3
+        assert db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_listagem_cep_nome'").fetchone()[0] == 0
+    finally:
+        db.close()
+    assert set(importados()[0]) == {'Dom Casmurro'}
+
+    monkeypatch.setattr(api, 'import_livros_batch', gravar)
+    resultado = importar(catalogo, '--lote', '3')
+    assert resultado.exit_code == 0, resultado.output
+    assert 'Retomando após a linha 3' in resultado.output
+    assert '2 linhas importadas, 3 ignoradas' in resultado.output
+
+    livros, autores, _, _ = importados()
+    assert set(livros) == {'Dom Casmurro', 'A Hora da Estrela', 'Memórias Póstumas'}
+    assert sum(autor == 'Autor Novo' for _, autor in autores) == 2
+    db = conectar()
+    try:
+        assert db.execute('SELECT COUNT(*) FROM IMPORTACAO').fetchone()[0] == 0
+        assert db.execute("SELECT COUNT(*) FROM AUTOR WHERE NM_AUTOR = 'Autor Novo'").fetchone()[0] == 1
+        assert db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_listagem_cep_nome'").fetchone()[0] == 1
+    finally:
+        db.close()
@@ -0,0 +1,169 @@
+"""GET /livros com cursor (keyset) e POST/PUT /livros/lote"""
+
+import base64
+import json
+
+import app as api
+from conftest import CEPS, conectar, novo_livro
+
+NOMES = ['Memórias Póstumas', 'Dom Casmurro', 'Dom Casmurro', 'Iracema', 'Dom Casmurro', 'A Hora da Estrela',
+         'O Alquimista']
+
+
+def criar_livros(client, nomes=NOMES):
+    for i, nome in enumerate(nomes):
+        assert client.post('/livros', json=novo_livro(nm_livro=nome, preco=10.0 * (i + 1))).status_code == 201
+
+
+## seguir X-Next-Cursor até a última página; devolve os ids na ordem recebida e as respostas
+def paginar(client, query, after=None):
+    ids, respostas = [], []
+    url = f'/livros?{query}' + (f'&after={after}' if after else '')
+    while True:
+        resposta = client.get(url)
+        assert resposta.status_code == 200
+        respostas.append(resposta)
+        ids.extend(livro['ID_LIVRO'] for livro in resposta.get_json())
+        cursor = resposta.headers.get('X-Next-Cursor')
+        if cursor is None:
+            return ids, respostas
+        url = f'/livros?{query}&after={cursor}'
+
+
+def ordem_esperada(where='1'):
+    db = conectar()
+    try:
+        return [row[0] for row in db.execute(f'SELECT ID_LIVRO FROM LIVRO WHERE {where} ORDER BY NM_LIVRO, ID_LIVRO')]
+    finally:
+        db.close()
+
+
+def test_cursor_percorre_o_catalogo_em_ordem_sem_repetir(client):
+    criar_livros(client)
+
+    ids, respostas = paginar(client, 'limit=2')
+    # Nomes repetidos desempatam pelo ID, então nenhum livro se repete ou some entre páginas
+    assert ids == ordem_esperada()
+    assert len(respostas) == 5
+    assert 'after=' in respostas[0].headers['Link'] and 'rel="next"' in respostas[0].headers['Link']
+
+
+def test_cursor_mantem_os_filtros(client):
+    criar_livros(client)
+
+    ids, respostas = paginar(client, 'limit=2&preco_max=45')
+    assert ids == ordem_esperada('PRECO <= 45')
+    assert 'preco_max=45' in respostas[0].headers['Link']
+
+
+def test_livro_inserido_antes_do_cursor_nao_desloca_as_paginas(client):
+    criar_livros(client)
+    primeira = client.get('/livros?limit=3')
+    vistos = [livro['ID_LIVRO'] for livro in primeira.get_json()]
+
+    assert client.post('/livros', json=novo_livro(nm_livro='AAA Primeiro')).status_code == 201
+    resto, _ = paginar(client, 'limit=3', primeira.headers['X-Next-Cursor'])
+    assert vistos + resto == [id_livro for id_livro in ordem_esperada() if id_livro != max(ordem_esperada())]
+
+
+def test_cursor_invalido(client):
+    valido_mas_errado = base64.urlsafe_b64encode(json.dumps(['Dom', 'x']).encode()).decode().rstrip('=')
+    for cursor in ('@@@', 'e30', valido_mas_errado):
+        resposta = client.get(f'/livros?after={cursor}')
+        assert resposta.status_code == 400
+        assert resposta.get_json()['error'] == 'Filtros ou cursor de paginação inválidos'
+    assert api.decode_cursor(api.encode_cursor('Dom Casmurro', 4)) == ('Dom Casmurro', 4)
+
+
+def resultados(resposta):
+    return {item['index']: item for item in resposta.get_json()['results']}
+
+
+def test_lote_valido_cria_todos(client):
+    resposta = client.post('/livros/lote', json=[novo_livro(nm_livro=f'Lote {i}') for i in range(3)])
+
+    assert resposta.status_code == 201
+    ids = [item['id_livro'] for item in resposta.get_json()['results']]
+    assert ids == sorted(ids) and len(set(ids)) == 3
+    for id_livro in ids:
+        assert client.get(f'/livros/{id_livro}/imagem').status_code == 200
+
+
+def test_lote_com_itens_invalidos_grava_os_demais(client):
+    resposta = client.post('/livros/lote', json=[
+        novo_livro(nm_livro='Válido'),
+        {'nm_livro': 'Sem campos'},
+        novo_livro(cep=999),
+        novo_livro(img_livro=base64.b64encode(b'isto nao e uma imagem').decode('ascii')),
+        novo_livro(img_livro='abc'),
+        novo_livro(nm_livro='Válido com relações', autores=[1, 2], categorias=[3]),
+        novo_livro(autores=[999]),
+    ])
+
+    assert resposta.status_code == 207
+    itens = resultados(resposta)
+    assert itens[1]['error'] == 'preco é obrigatório'
+    assert itens[2]['error'] == 'CEP 999 não encontrado'
+    assert itens[3]['error'] == 'Formato de imagem não suportado'
+    assert itens[4]['error'] == 'Imagem deve estar em base64'
+    assert itens[6]['error'] == 'Autor não encontrado'
+    livro = client.get(f'/livros/{itens[5]["id_livro"]}?expand=autores,categorias').get_json()
+    assert [autor['ID_AUTOR'] for autor in livro['autores']] == [1, 2]
+    assert [categoria['ID_CATEGORIA'] for categoria in livro['categorias']] == [3]
+    assert client.get(f'/livros/{itens[0]["id_livro"]}').status_code == 200
+
+
+def test_lote_sem_itens_validos_e_recusado(client):
+    resposta = client.post('/livros/lote', json=[novo_livro(cep=999), {'nm_livro': ''}])
+    assert resposta.status_code == 400
+    assert len(resposta.get_json()['results']) == 2
+    assert client.post('/livros/lote', json=[]).status_code == 400
+    db = conectar()
+    try:
+        assert db.execute('SELECT COUNT(*) FROM LIVRO').fetchone()[0] == 2
+    finally:
+        db.close()
+
+
+def test_lote_acima_do_maximo(client, monkeypatch):
+    monkeypatch.setitem(api.app.config, 'LIVROS_BULK_MAX_ITEMS', 2)
+    resposta = client.post('/livros/lote', json=[novo_livro() for _ in range(3)])
+    assert resposta.status_code == 400
+    assert resposta.get_json()['error'] == 'Máximo de 2 livros por lote'
+
+
+def test_lote_put_resultado_por_item(client):
+    resposta = client.put('/livros/lote', json=[
+        {'id_livro': 1, 'preco': 12.5, 'categorias': [1, 2]},
+        {'id_livro': 999, 'preco': 1.0},
+        {'id_livro': 2, 'cep': 999},
+        {'id_livro': 2, 'nm_livro': 'Quincas Borba (2ª ed.)'},
+    ])
+
+    assert resposta.status_code == 207
+    itens = resultados(resposta)
+    assert itens[0]['id_livro'] == 1 and itens[3]['id_livro'] == 2
+    assert itens[1]['error'] == 'Livro não encontrado'
+    assert itens[2]['error'] == 'CEP 999 não encontrado'
+    livro = client.get('/livros/1?expand=categorias').get_json()
+    assert livro['PRECO'] == 12.5
+    assert [categoria['ID_CATEGORIA'] for categoria in livro['categorias']] == [1, 2]
+    assert client.get('/livros/2').get_json()['NM_LIVRO'] == 'Quincas Borba (2ª ed.)'
+
+
+def test_referencia_removida_antes_da_gravacao_vira_erro_do_item(client, monkeypatch):
+    # O bairro sai depois da validação do lote e antes da escrita: a conferência dentro do escritor pega
+    preparar = api.prepare_livros_lote
+
+    def preparar_e_remover(itens, partial=False):
+        resultado = preparar(itens, partial)
+        assert client.delete(f'/bairros/{CEPS[3]}').status_code == 200
+        return resultado
+
+    monkeypatch.setattr(api, 'prepare_livros_lote', preparar_e_remover)
+    resposta = client.post('/livros/lote', json=[novo_livro(cep=CEPS[3]), novo_livro(cep=CEPS[0])])
+
+    assert resposta.status_code == 207
+    itens = resultados(resposta)
+    assert itens[0]['error'] == f'CEP {CEPS[3]} não encontrado'
+    assert client.get(f'/livros/{itens[1]["id_livro"]}').get_json()['CEP'] == CEPS[0]
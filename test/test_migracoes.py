@@ -0,0 +1,165 @@
+"""Executor de migrações: retomada de migrações .py, bancos anteriores às migrações e FLASK_CONFIG=testing"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import app as api
+from conftest import ROOT
+
+MIGRACAO_LOTES = '''
+import os
+
+def upgrade(db, progresso):
+    ultimo = progresso or 0
+    while ultimo < 10:
+        if os.environ.get('MIGRACAO_FALHAR_EM') == str(ultimo):
+            raise RuntimeError('interrompida')
+        db.execute('INSERT INTO ITEM (ID) VALUES (?), (?)', (ultimo + 1, ultimo + 2))
+        ultimo += 2
+        yield ultimo
+'''
+
+# Objetos do antigo schema.sql (o resto da migração 0001 veio depois)
+TABELAS_LEGADO = {'ESTADO', 'CIDADE', 'BAIRRO', 'USUARIO', 'AUTOR', 'CATEGORIA', 'LIVRO', 'LIVRO_AUTOR',
+                  'LIVRO_CATEGORIA'}
+INDICES_LEGADO = {'idx_cidade_estado', 'idx_bairro_cidade', 'idx_livro_cep', 'idx_livro_comprador',
+                  'idx_livro_vendedor', 'idx_livro_autor_livro', 'idx_livro_autor_autor',
+                  'idx_livro_categoria_livro', 'idx_livro_categoria_categoria'}
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    caminho = str(tmp_path / 'migracoes.db')
+    monkeypatch.setitem(api.app.config, 'DATABASE', caminho)
+    return caminho
+
+
+@pytest.fixture
+def migracoes(tmp_path, monkeypatch):
+    pasta = tmp_path / 'migrations'
+    pasta.mkdir()
+    monkeypatch.setattr(api, 'MIGRATIONS_DIR', str(pasta))
+    return pasta
+
+
+def consultar(caminho, sql):
+    db = sqlite3.connect(caminho)
+    try:
+        return db.execute(sql).fetchall()
+    finally:
+        db.close()
+
+
+def test_migracao_py_interrompida_continua_do_ultimo_lote(banco, migracoes, monkeypatch, capsys):
+    (migracoes / '0001_item.sql').write_text('CREATE TABLE ITEM (ID INTEGER PRIMARY KEY);\n')
+    (migracoes / '0002_preencher_item.py').write_text(MIGRACAO_LOTES)
+
+    monkeypatch.setenv('MIGRACAO_FALHAR_EM', '6')
+    with pytest.raises(RuntimeError):
+        api.migrate_db()
+    # Lotes anteriores à falha ficam gravados com o progresso; a versão ainda não foi aplicada
+    assert consultar(banco, 'SELECT COUNT(*) FROM ITEM') == [(6,)]
+    assert consultar(banco, 'SELECT VERSAO, PROGRESSO, APLICADA_EM FROM VERSAO_SCHEMA ORDER BY VERSAO')[1] \
+        == (2, '6', None)
+
+    monkeypatch.delenv('MIGRACAO_FALHAR_EM')
+    assert api.migrate_db() == [2]
+    assert 'Retomando migração 0002 a partir de 6' in capsys.readouterr().out
+    # Recomeçar do zero repetiria as chaves e falharia
+    assert consultar(banco, 'SELECT MIN(ID), MAX(ID), COUNT(*) FROM ITEM') == [(1, 10, 10)]
+    assert consultar(banco, 'SELECT PROGRESSO, APLICADA_EM IS NOT NULL FROM VERSAO_SCHEMA WHERE VERSAO = 2') \
+        == [(None, 1)]
+    assert api.migrate_db() == []
+
+
+def test_migracao_sql_com_erro_nao_deixa_nada(banco, migracoes):
+    (migracoes / '0001_item.sql').write_text('CREATE TABLE ITEM (ID INTEGER PRIMARY KEY);\n')
+    (migracoes / '0002_quebrada.sql').write_text('CREATE TABLE OUTRA (ID INTEGER);\nINSERT INTO NADA VALUES (1);\n')
+
+    with pytest.raises(sqlite3.OperationalError):
+        api.migrate_db()
+    assert consultar(banco, "SELECT name FROM sqlite_master WHERE name = 'OUTRA'") == []
+    assert consultar(banco, 'SELECT MAX(VERSAO) FROM VERSAO_SCHEMA') == [(1,)]
+
+
+## banco como o antigo schema.sql criava: só as tabelas e índices originais, sem os hashes das imagens
+def criar_banco_legado(caminho):
+    db = sqlite3.connect(caminho)
+    try:
+        with open(os.path.join(ROOT, 'migrations', '0001_schema_inicial.sql'), encoding='utf-8') as f:
+            db.executescript(f.read())
+        objetos = db.execute("SELECT type, name FROM sqlite_master WHERE sql IS NOT NULL").fetchall()
+        for tipo, nome in objetos:
+            if tipo == 'trigger':
+                db.execute(f'DROP TRIGGER {nome}')
+        for tipo, nome in objetos:
+            if tipo == 'index' and nome not in INDICES_LEGADO:
+                db.execute(f'DROP INDEX IF EXISTS {nome}')
+        for tipo, nome in objetos:
+            if tipo == 'table' and nome not in TABELAS_LEGADO and nome != 'sqlite_sequence':
+                db.execute(f'DROP TABLE IF EXISTS {nome}')
+        db.execute('ALTER TABLE LIVRO DROP COLUMN HASH_IMG_LIVRO')
+        db.execute('ALTER TABLE CATEGORIA DROP COLUMN HASH_IMG_CATEGORIA')
+        with open(os.path.join(ROOT, 'seed.sql'), encoding='utf-8') as f:
+            db.executescript(f.read())
+        db.commit()
+    finally:
+        db.close()
+
+
+def estrutura(caminho):
+    return consultar(caminho, '''
+        SELECT m.type, m.name, p.name, p.type, p."notnull"
+        FROM sqlite_master m LEFT JOIN pragma_table_info(m.name) p ON m.type = 'table'
+        ORDER BY m.name, p.name
+    ''')
+
+
+def test_banco_legado_e_completado_ate_a_migracao_0001(banco, tmp_path, monkeypatch):
+    criar_banco_legado(banco)
+    api.migrate_db()
+
+    novo = str(tmp_path / 'novo.db')
+    monkeypatch.setitem(api.app.config, 'DATABASE', novo)
+    api.migrate_db()
+    assert estrutura(banco) == estrutura(novo)
+
+    # Dados existentes preenchidos: hashes, busca e as tabelas derivadas das migrações seguintes
+    assert consultar(banco, 'SELECT COUNT(*) FROM LIVRO WHERE HASH_IMG_LIVRO IS NULL') == [(0,)]
+    assert consultar(banco, 'SELECT COUNT(*) FROM CATEGORIA WHERE HASH_IMG_CATEGORIA IS NULL') == [(0,)]
+    assert consultar(banco, "SELECT rowid FROM LIVRO_BUSCA WHERE LIVRO_BUSCA MATCH 'percy'") == [(1,)]
+    assert consultar(banco, 'SELECT COUNT(*) FROM LIVRO_LISTAGEM') == consultar(banco, 'SELECT COUNT(*) FROM LIVRO')
+    assert consultar(banco, 'SELECT MAX(VERSAO) FROM VERSAO_SCHEMA') == [(api.list_migrations()[-1][0],)]
+
+
+def test_banco_legado_incompativel_e_recusado_sem_alteracoes(banco):
+    db = sqlite3.connect(banco)
+    db.execute('CREATE TABLE LIVRO (ID_LIVRO INTEGER PRIMARY KEY)')
+    db.close()
+
+    with pytest.raises(RuntimeError, match='LIVRO.NM_LIVRO'):
+        api.migrate_db()
+    assert consultar(banco, "SELECT name FROM sqlite_master") == [('LIVRO',)]
+
+
+def test_configuracao_testing_cria_e_apaga_banco_temporario():
+    codigo = textwrap.dedent('''
+        import app
+        app.init_db()
+        client = app.app.test_client()
+        assert client.get('/estados').status_code == 200
+        assert len(client.get('/livros').get_json()) == 2
+        print(app.app.config['DATABASE'])
+        app.write_coordinator.close()
+    ''')
+    env = {key: value for key, value in os.environ.items() if key != 'DATABASE_PATH'}
+    env['FLASK_CONFIG'] = 'testing'
+    resultado = subprocess.run([sys.executable, '-c', codigo], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert resultado.returncode == 0, resultado.stderr
+    caminho = resultado.stdout.strip().splitlines()[-1]
+    assert not os.path.exists(os.path.dirname(caminho))
@@ -0,0 +1,150 @@
+"""Miniaturas: geração (render_thumbnails), agendamento por hash e GET .../imagem?size="""
+
+import base64
+import io
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import app as api
+from conftest import conectar, novo_livro
+
+
+def imagem(largura=800, altura=400):
+    out = io.BytesIO()
+    Image.new('RGB', (largura, altura), (20, 120, 200)).save(out, 'PNG')
+    return out.getvalue()
+
+
+def criar(client, dados):
+    resposta = client.post('/livros', json=novo_livro(img_livro=base64.b64encode(dados).decode('ascii')))
+    assert resposta.status_code == 201
+    id_livro = resposta.get_json()['id_livro']
+    db = conectar()
+    try:
+        return id_livro, db.execute('SELECT HASH_IMG_LIVRO FROM LIVRO WHERE ID_LIVRO = ?', (id_livro,)).fetchone()[0]
+    finally:
+        db.close()
+
+
+def derivadas(img_hash):
+    db = conectar()
+    try:
+        return {(row[0], row[1]): row[2] for row in db.execute(
+            'SELECT TAMANHO, FORMATO, IMAGEM FROM IMAGEM_DERIVADA WHERE HASH_ORIGEM = ?', (img_hash,))}
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def pool(app, monkeypatch):
+    # Threads no lugar dos processos: o agendamento e o callback são os mesmos
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setitem(api.app.config, 'THUMBNAIL_MAX_PENDING', 100)
+    monkeypatch.setattr(api, 'get_thumbnail_pool', lambda: executor)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def test_tamanhos_e_formatos(client):
+    id_livro, img_hash = criar(client, imagem())
+
+    assert api.render_thumbnails(api.app.config['DATABASE'], 'LIVRO', id_livro, img_hash, (160, 480)) == 4
+    geradas = derivadas(img_hash)
+    assert set(geradas) == {(160, 'image/webp'), (160, 'image/jpeg'), (480, 'image/webp'), (480, 'image/jpeg')}
+    for (tamanho, formato), dados in geradas.items():
+        miniatura = Image.open(io.BytesIO(dados))
+        assert miniatura.format == api.THUMBNAIL_FORMATS[formato]
+        # Proporção mantida, lado maior no tamanho pedido
+        assert miniatura.size == (tamanho, tamanho // 2)
+
+    # Imagem menor que a miniatura não é ampliada
+    id_pequena, hash_pequena = criar(client, imagem(40, 30))
+    api.render_thumbnails(api.app.config['DATABASE'], 'LIVRO', id_pequena, hash_pequena, (160,))
+    assert Image.open(io.BytesIO(derivadas(hash_pequena)[160, 'image/jpeg'])).size == (40, 30)
+
+
+def test_imagem_trocada_ou_invalida_nao_gera_nada(client):
+    id_livro, img_hash = criar(client, imagem())
+    client.put(f'/livros/{id_livro}', json={'img_livro': base64.b64encode(imagem(300, 300)).decode('ascii')})
+    assert api.render_thumbnails(api.app.config['DATABASE'], 'LIVRO', id_livro, img_hash, (160,)) == 0
+
+    # Livros do seed: só o cabeçalho PNG, que não decodifica
+    db = conectar()
+    try:
+        seed_hash = db.execute('SELECT HASH_IMG_LIVRO FROM LIVRO WHERE ID_LIVRO = 1').fetchone()[0]
+    finally:
+        db.close()
+    assert api.render_thumbnails(api.app.config['DATABASE'], 'LIVRO', 1, seed_hash, (160,)) == 0
+    assert derivadas(img_hash) == {} and derivadas(seed_hash) == {}
+
+
+def test_imagens_iguais_processadas_uma_vez(client, pool, monkeypatch):
+    chamadas = []
+    render = api.render_thumbnails
+
+    def contar(*args):
+        chamadas.append(args)
+        return render(*args)
+
+    monkeypatch.setattr(api, 'render_thumbnails', contar)
+    dados = imagem()
+    _, img_hash = criar(client, dados)
+    criar(client, dados)
+    pool.shutdown(wait=True)
+    # Outro upload igual depois de pronto: as derivadas existentes bastam
+    criar(client, dados)
+
+    assert len(chamadas) == 1
+    assert len(derivadas(img_hash)) == 4
+    assert img_hash not in api._thumbnail_pending
+
+
+def test_falha_na_geracao_vai_para_o_log(client, pool, monkeypatch, caplog):
+    def travado(*args):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(api, 'render_thumbnails', travado)
+    with caplog.at_level(logging.ERROR, logger=api.app.logger.name):
+        _, img_hash = criar(client, imagem())
+        pool.shutdown(wait=True)
+
+    assert img_hash not in api._thumbnail_pending
+    [registro] = [r for r in caplog.records if img_hash in r.getMessage()]
+    assert 'database is locked' in str(registro.exc_info[1])
+
+
+def test_size_negocia_o_formato_e_cai_no_original(client):
+    dados = imagem()
+    id_livro, img_hash = criar(client, dados)
+    url = f'/livros/{id_livro}/imagem'
+
+    # Antes das miniaturas: o original, sem cache longo
+    resposta = client.get(f'{url}?size=160&v={img_hash}')
+    assert resposta.mimetype == 'image/png' and resposta.get_data() == dados
+    assert 'immutable' not in resposta.headers['Cache-Control']
+    assert 'Accept' in resposta.headers['Vary']
+
+    api.render_thumbnails(api.app.config['DATABASE'], 'LIVRO', id_livro, img_hash, (160, 480))
+    geradas = derivadas(img_hash)
+    webp = client.get(f'{url}?size=160&v={img_hash}', headers={'Accept': 'image/webp,*/*'})
+    assert webp.mimetype == 'image/webp' and webp.get_data() == geradas[160, 'image/webp']
+    assert 'immutable' in webp.headers['Cache-Control']
+    jpeg = client.get(f'{url}?size=480', headers={'Accept': 'image/*'})
+    assert jpeg.mimetype == 'image/jpeg' and jpeg.get_data() == geradas[480, 'image/jpeg']
+    assert jpeg.headers['Cache-Control'] == 'no-cache'
+
+    assert client.get(f'{url}?size=100').status_code == 400
+
+
+def test_build_thumbnails_completa_as_que_faltam(client):
+    _, img_hash = criar(client, imagem())
+
+    resultado = api.app.test_cli_runner().invoke(args=['build-thumbnails'])
+    assert resultado.exit_code == 0, resultado.output
+    # Livros e categorias do seed não decodificam: só a imagem nova gera miniaturas
+    assert resultado.output.strip().endswith(', 4 miniaturas geradas')
+    assert len(derivadas(img_hash)) == 4
@@ -0,0 +1,117 @@
+"""GET /livros/proximos (R*Tree de BAIRRO_COORDENADA ou prefixo do CEP) e flask import-coordenadas"""
+
+import pytest
+
+import app as api
+from conftest import CEPS, conectar, novo_livro
+
+# Coordenadas aproximadas dos CEPs do seed
+COORDENADAS = {
+    1310100: (-23.5613, -46.6565),   # Av. Paulista
+    4038001: (-23.5899, -46.6360),   # Vila Mariana, ~3,8 km
+    13010111: (-22.9056, -47.0608),  # Campinas, ~84 km
+    20040020: (-22.9035, -43.1780),  # Rio de Janeiro, ~360 km
+}
+
+
+def importar_coordenadas(tmp_path, linhas, delimitador=','):
+    arquivo = tmp_path / 'coordenadas.csv'
+    cabecalho = delimitador.join(['cep', 'latitude', 'longitude'])
+    arquivo.write_text('\n'.join([cabecalho] + linhas) + '\n', encoding='utf-8')
+    return api.app.test_cli_runner().invoke(args=['import-coordenadas', str(arquivo), '--delimitador', delimitador])
+
+
+def criar(client, nome, cep):
+    resposta = client.post('/livros', json=novo_livro(nm_livro=nome, cep=cep))
+    assert resposta.status_code == 201
+    return resposta.get_json()['id_livro']
+
+
+def proximos(client, query):
+    resposta = client.get(f'/livros/proximos?{query}')
+    assert resposta.status_code == 200
+    return resposta.headers['X-Proximidade'], resposta.get_json()
+
+
+@pytest.fixture
+def livros(client):
+    # Livros 1 e 2 do seed estão no CEP 4038001
+    return {cep: criar(client, f'Livro {cep}', cep) for cep in (CEPS[0], CEPS[2], CEPS[3])}
+
+
+@pytest.fixture
+def coordenadas(app, tmp_path):
+    resultado = importar_coordenadas(tmp_path, [f'{cep},{lat},{lon}' for cep, (lat, lon) in COORDENADAS.items()])
+    assert resultado.exit_code == 0, resultado.output
+
+
+def test_import_coordenadas(app, tmp_path):
+    resultado = importar_coordenadas(tmp_path, [
+        '01310-100;-23.5613;-46.6565',
+        '99999999;-23.5;-46.6',
+        '04038001;-95;-46.6',
+        '13010111;;',
+        '20040020;-22.9035;-43.1780',
+    ], ';')
+    assert resultado.exit_code == 0, resultado.output
+    for aviso in ('linha 2: CEP 99999999 não encontrado', 'linha 3: latitude ou longitude fora da faixa',
+                  'linha 4: cep, latitude e longitude são obrigatórios'):
+        assert aviso in resultado.output
+    assert '2 linhas importadas, 3 ignoradas' in resultado.output
+
+    db = conectar()
+    try:
+        assert {tuple(row) for row in db.execute('SELECT CEP, LATITUDE, LONGITUDE FROM BAIRRO_COORDENADA')} == {
+            (1310100, -23.5613, -46.6565), (20040020, -22.9035, -43.1780)}
+    finally:
+        db.close()
+
+
+def test_ordem_por_distancia_e_raio(client, livros, coordenadas):
+    modo, resultado = proximos(client, f'cep={CEPS[0]}&raio_km=100')
+    assert modo == 'coordenadas'
+    # Rio de Janeiro fica fora dos 100 km
+    assert [livro['ID_LIVRO'] for livro in resultado] == [livros[CEPS[0]], 1, 2, livros[CEPS[2]]]
+    origem = COORDENADAS[CEPS[0]]
+    for livro in resultado:
+        esperada = api.haversine_km(*origem, *COORDENADAS[livro['CEP']])
+        assert livro['DISTANCIA_KM'] == pytest.approx(esperada, abs=0.01)
+    assert resultado[1]['DISTANCIA_KM'] == pytest.approx(3.8, abs=0.2)
+
+    _, curto = proximos(client, f'cep={CEPS[0]}&raio_km=5')
+    assert [livro['ID_LIVRO'] for livro in curto] == [livros[CEPS[0]], 1, 2]
+    _, pagina = proximos(client, f'cep={CEPS[0]}&raio_km=500&limit=2')
+    assert [livro['ID_LIVRO'] for livro in pagina] == [livros[CEPS[0]], 1]
+    _, longe = proximos(client, f'cep={CEPS[0]}&raio_km=500&preco_min=30')
+    assert [livro['ID_LIVRO'] for livro in longe] == [livros[CEPS[0]], 1, livros[CEPS[2]], livros[CEPS[3]]]
+
+
+def test_sem_coordenadas_usa_o_prefixo_do_cep(client, livros):
+    # Bairro novo na mesma região de 5 dígitos do CEP 4038001, com um livro que vem antes pelo nome
+    assert client.post('/bairros', json={'cep': 4038500, 'nm_bairro': 'Vila Clementino', 'id_cidade': 1}).status_code == 201
+    vizinho = criar(client, 'A Moreninha', 4038500)
+
+    modo, resultado = proximos(client, f'cep={CEPS[1]}&raio_km=2')
+    assert modo == 'prefixo-cep'
+    # Dentro da região, em ordem de CEP
+    assert [livro['ID_LIVRO'] for livro in resultado] == [1, 2, vizinho]
+    assert all(livro['DISTANCIA_KM'] is None for livro in resultado)
+
+    # Raio acima de 200 km: região de 1 dígito, depois da região de 5 dígitos
+    _, largo = proximos(client, f'cep={CEPS[0]}&raio_km=300')
+    assert [livro['ID_LIVRO'] for livro in largo] == [livros[CEPS[0]], 1, 2, vizinho]
+    _, curto = proximos(client, f'cep={CEPS[0]}&raio_km=50')
+    assert [livro['ID_LIVRO'] for livro in curto] == [livros[CEPS[0]]]
+
+
+def test_prefixo_sem_livros_no_raio_amplia_a_regiao(client):
+    # 01310100 e 04038001 só têm o primeiro dígito em comum, mas nada mais perto tem livros
+    _, resultado = proximos(client, f'cep={CEPS[0]}&raio_km=50')
+    assert [livro['ID_LIVRO'] for livro in resultado] == [1, 2]
+
+
+def test_cep_desconhecido_e_parametros_invalidos(client):
+    assert client.get('/livros/proximos?cep=99999999').status_code == 404
+    for query in ('raio_km=0', 'raio_km=-1', 'raio_km=501', 'raio_km=abc', 'preco_min=x'):
+        assert client.get(f'/livros/proximos?cep={CEPS[0]}&{query}').status_code == 400
+    assert client.get('/livros/proximos').status_code == 400